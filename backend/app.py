@@ -1,9 +1,19 @@
 import logging
 import sys
 import os
-from flask import Flask, request, jsonify, make_response
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, make_response
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+from completion_cache import CompletionCache
+from serving import (
+    VLLM_SERVER_URL, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, vllm_headers, completion_text,
+    parse_stream_line, sse_event, warm_up_retrieval, retrieve_context, assemble_prompt,
+    parse_rag_request, parse_max_tokens, parse_stream, parse_sampling, RAG_RETRIEVAL_WORKERS,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -21,9 +31,102 @@ app = Flask(__name__)
 # Enable CORS for all routes (Restrict origins in production)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# vLLM server configuration
-VLLM_SERVER_URL = "http://localhost:8000/v1/completions"  # Adjust if vllm is running on a different host/port
-API_KEY = "token-what-a-day"  # Ensure this matches your vllm server's API key
+# Upstream connections are kept alive and reused across requests
+vllm_session = requests.Session()
+vllm_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+vllm_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+UPSTREAM_TIMEOUT = (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+
+# Retrieval runs here so it overlaps with the rest of request handling
+retrieval_executor = ThreadPoolExecutor(max_workers=RAG_RETRIEVAL_WORKERS,
+                                        thread_name_prefix='retrieval')
+
+# Deterministic /api/generate completions, shared by identical concurrent requests
+completion_cache = CompletionCache()
+
+def stream_completion(payload, first_events=(), cache_key=None):
+    """
+    Generator relaying a streamed vLLM completion as Server-Sent Events.
+
+    Each token chunk becomes a 'data: {"text": ...}' event, followed by a final
+    'done' event. If the client disconnects, the server closes this generator
+    and the upstream response is closed with it, so vLLM aborts the request
+    instead of generating tokens nobody reads.
+
+    :param payload: Completion request body; 'stream' is forced on.
+    :param first_events: Events sent before the first token (e.g. RAG sources).
+    :param cache_key: Completion cache key; a cached completion is sent as one
+                      event, and a completion streamed to the end is cached.
+                      Identical streams in flight are not coalesced.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    upstream = None
+    parts = []
+    try:
+        yield from first_events
+        if cache_key:
+            cached = completion_cache.get(cache_key)
+            if cached is not None:
+                yield sse_event({"text": cached})
+                yield sse_event({"total_ms": round((time.perf_counter() - start) * 1000.0, 2), "cached": True},
+                                event="done")
+                return
+            completion_cache.record('misses')
+        upstream = vllm_session.post(VLLM_SERVER_URL, json=dict(payload, stream=True),
+                                     headers=vllm_headers(), stream=True, timeout=UPSTREAM_TIMEOUT)
+        if upstream.status_code != 200:
+            logger.error(f"vLLM server error: {upstream.text}")
+            yield sse_event({"error": "vLLM server error."}, event="error")
+            return
+        for line in upstream.iter_lines():
+            text = parse_stream_line(line)
+            if text is None:
+                if cache_key:
+                    completion_cache.put(cache_key, ''.join(parts))
+                break
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                logger.info(f"Time to first token: {(first_token_at - start) * 1000:.0f}ms")
+            parts.append(text)
+            yield sse_event({"text": text})
+        yield sse_event({"total_ms": round((time.perf_counter() - start) * 1000.0, 2)}, event="done")
+    except GeneratorExit:
+        logger.info("Client disconnected, cancelling upstream completion")
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming from vLLM server: {e}")
+        yield sse_event({"error": "Error generating response."}, event="error")
+    finally:
+        if upstream is not None:
+            # Closing an unfinished streamed response drops the upstream connection
+            upstream.close()
+
+def sse_response(events):
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Disable proxy buffering so tokens flush immediately
+    })
+
+def complete(payload):
+    """
+    Runs a non-streamed completion.
+
+    :return: Tuple of (generated text, (error message, status code) or None).
+    """
+    try:
+        # Send request to vllm server
+        response = vllm_session.post(VLLM_SERVER_URL, json=payload, headers=vllm_headers(),
+                                     timeout=UPSTREAM_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Error communicating with vLLM server: {e}")
+        return None, ("Error generating response.", 500)
+    if response.status_code != 200:
+        logger.error(f"vLLM server error: {response.text}")
+        return None, ("vLLM server error.", 500)
+    return completion_text(response.json()), None
 
 # ===========================
 # Generate Endpoint
@@ -33,13 +136,18 @@ API_KEY = "token-what-a-day"  # Ensure this matches your vllm server's API key
 def generate_response():
     """
     Endpoint to generate text based on a given prompt.
-    Expects JSON payload with 'prompt' and optional 'max_tokens'.
+    Expects JSON payload with 'prompt' and optional 'max_tokens', 'temperature',
+    'top_p', 'seed' and 'stream'.
+    With 'stream': true the tokens are sent as Server-Sent Events as they are generated.
+    Requests with temperature 0 or a seed are served from the completion cache.
     """
     logger.info("Received request to /api/generate")
 
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     prompt = data.get("prompt", "")
-    max_tokens = data.get("max_tokens", 1000)  # Default to 1000 tokens if not provided
+    max_tokens, error = parse_max_tokens(data)  # Defaults to 1000 tokens if not provided
+    if not error:
+        stream, error = parse_stream(data)
 
     logger.info(f"Prompt received: {prompt}")
     logger.info(f"Max tokens requested: {max_tokens}")
@@ -47,33 +155,115 @@ def generate_response():
     if not prompt:
         logger.warning("No prompt provided in the request.")
         return make_response(jsonify({"error": "No prompt provided."}), 400)
+    if not error:
+        sampling, error = parse_sampling(data)
+    if error:
+        return make_response(jsonify({"error": error}), 400)
 
-    try:
-        # Define the payload for vllm server
-        payload = {
-            "prompt": prompt,
-            "max_tokens": max_tokens
-        }
+    # Define the payload for vllm server
+    payload = {
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        **sampling
+    }
+    cache_key = completion_cache.key_for(payload)
+    if stream:
+        return sse_response(stream_completion(payload, cache_key=cache_key))
 
-        # Send request to vllm server
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {API_KEY}"
-        }
+    if cache_key:
+        generated_text, error = completion_cache.get_or_generate(cache_key, lambda: complete(payload))
+    else:
+        generated_text, error = complete(payload)
+    if error:
+        message, status_code = error
+        return make_response(jsonify({"error": message}), status_code)
+    logger.info(f"Generated response: {generated_text}")
+    return jsonify({"generated_text": generated_text})
 
-        response = requests.post(VLLM_SERVER_URL, json=payload, headers=headers)
+# ===========================
+# RAG Endpoint
+# ===========================
+
+@app.route('/api/rag', methods=['POST'])
+def rag_response():
+    """
+    Endpoint to answer a question from the ingested documents.
+    Expects JSON payload with 'query' and optional 'k', 'max_tokens',
+    'course', 'document_id' and 'stream'. The response includes per-stage
+    timings in ms. With 'stream': true the sources and timings so far are sent
+    as a 'sources' event, followed by the answer tokens as Server-Sent Events.
+    """
+    timings = {}
+    request_start = time.perf_counter()
 
-        if response.status_code == 200:
-            generated_text = response.json().get("generated_text", "")
-            logger.info(f"Generated response: {generated_text}")
-            return jsonify({"generated_text": generated_text})
-        else:
-            logger.error(f"vLLM server error: {response.text}")
-            return make_response(jsonify({"error": "vLLM server error."}), 500)
+    data = request.get_json(silent=True) or {}
+    query, k, filters, error = parse_rag_request(data)
+    if error:
+        return make_response(jsonify({"error": error}), 400)
 
+    # Start retrieval as soon as the query is known; validation continues meanwhile
+    retrieval = retrieval_executor.submit(retrieve_context, query, k, filters)
+    timings['parse'] = (time.perf_counter() - request_start) * 1000.0
+
+    validate_start = time.perf_counter()
+    max_tokens, error = parse_max_tokens(data)
+    if not error:
+        stream, error = parse_stream(data)
+    if error:
+        retrieval.cancel()
+        return make_response(jsonify({"error": error}), 400)
+    timings['validate'] = (time.perf_counter() - validate_start) * 1000.0
+
+    wait_start = time.perf_counter()
+    try:
+        results, retrieval_timings = retrieval.result()
     except Exception as e:
-        logger.error(f"Error communicating with vLLM server: {e}")
-        return make_response(jsonify({"error": "Error generating response."}), 500)
+        logger.error(f"Error retrieving context: {e}")
+        return make_response(jsonify({"error": "Error retrieving context."}), 500)
+    timings['retrieval_wait'] = (time.perf_counter() - wait_start) * 1000.0
+    timings.update(retrieval_timings)
+
+    assemble_start = time.perf_counter()
+    prompt, used = assemble_prompt(query, results)
+    timings['assemble'] = (time.perf_counter() - assemble_start) * 1000.0
+    sources = [
+        {"id": chunk_id, "distance": distance, "content": content}
+        for chunk_id, content, distance in used
+    ]
+
+    if stream:
+        timings = {stage: round(ms, 2) for stage, ms in timings.items()}
+        first = sse_event({"sources": sources, "timings_ms": timings}, event="sources")
+        return sse_response(stream_completion({"prompt": prompt, "max_tokens": max_tokens}, [first]))
+
+    completion_start = time.perf_counter()
+    answer, error = complete({"prompt": prompt, "max_tokens": max_tokens})
+    if error:
+        message, status_code = error
+        return make_response(jsonify({"error": message}), status_code)
+    timings['completion'] = (time.perf_counter() - completion_start) * 1000.0
+
+    timings['total'] = (time.perf_counter() - request_start) * 1000.0
+    timings = {stage: round(ms, 2) for stage, ms in timings.items()}
+    logger.info(f"RAG request timings (ms): {timings}")
+    result = jsonify({
+        "answer": answer,
+        "sources": sources,
+        "timings_ms": timings,
+    })
+    result.headers['Server-Timing'] = ', '.join(f"{stage};dur={ms}" for stage, ms in timings.items())
+    return result
+
+# ===========================
+# Metrics Endpoint
+# ===========================
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    Completion cache counters: hits, coalesced requests, misses, hit rate and bytes saved.
+    """
+    return jsonify({"completion_cache": completion_cache.metrics()})
 
 # ===========================
 # Root Endpoint
@@ -91,6 +281,8 @@ def root():
 # ===========================
 
 if __name__ == '__main__':
+    # Load models and open connections in the background while the server starts
+    threading.Thread(target=warm_up_retrieval, daemon=True).start()
     # Run the Flask app
     app.run(host='0.0.0.0', port=5000)
 
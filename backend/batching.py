@@ -0,0 +1,188 @@
+# batching.py
+# Dynamic micro-batching for the model servers (server.py, server2.py).
+#
+# Request handlers submit prompts to a BatchScheduler and await their result.
+# The scheduler gathers requests that arrive within a short window into one
+# batch and runs one engine call per batch on a worker thread, so the event
+# loop never blocks on the model and concurrent prompts share a forward pass.
+from abc import ABC, abstractmethod
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '10'))
+BATCH_MAX_QUEUE = int(os.getenv('BATCH_MAX_QUEUE', '256'))  # Waiting requests before new ones are rejected
+
+class GenerationEngine(ABC):
+    """
+    Interface of the engines the scheduler drives.
+    """
+
+    @abstractmethod
+    def generate(self, prompts, params):
+        """
+        Generates one completion per prompt. Called from a worker thread, one batch at a time.
+
+        :param prompts: List of prompt strings.
+        :param params: List of sampling parameter dicts ('max_tokens', 'temperature',
+                       'top_p'), one per prompt.
+        :return: List of generated texts in prompt order.
+        """
+
+class VLLMEngine(GenerationEngine):
+    """
+    Engine backed by a loaded vllm.LLM.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def generate(self, prompts, params):
+        from vllm import SamplingParams
+
+        # vLLM accepts one SamplingParams per prompt and returns outputs in prompt order
+        outputs = self.llm.generate(prompts, [SamplingParams(**p) for p in params])
+        return [output.outputs[0].text.strip() for output in outputs]
+
+class FakeEngine(GenerationEngine):
+    """
+    CPU stand-in that costs a fixed overhead per batch plus a per-token step
+    for the longest request, like a batched decoder.
+    """
+
+    def __init__(self, batch_overhead_ms=20, token_ms=1):
+        """
+        :param batch_overhead_ms: Simulated cost of one engine call.
+        :param token_ms: Simulated cost of one decoding step for the whole batch.
+        """
+        self.batch_overhead_ms = batch_overhead_ms
+        self.token_ms = token_ms
+        self.batch_sizes = []
+
+    def generate(self, prompts, params):
+        steps = max(p.get('max_tokens', 16) for p in params)
+        time.sleep((self.batch_overhead_ms + steps * self.token_ms) / 1000.0)
+        self.batch_sizes.append(len(prompts))
+        return [f"echo: {prompt}" for prompt in prompts]
+
+class BatchScheduler:
+    """
+    Queues generation requests and runs them through the engine in batches.
+
+    A batch starts with the first queued request and takes whatever else
+    arrives within max_wait_ms, up to max_batch_size. Requests that arrive
+    while a batch is generating wait in the queue and form the next batch
+    immediately, so under load batches fill without waiting. At most
+    max_queue requests wait; beyond that `submit` raises asyncio.QueueFull
+    so the server can shed load instead of queueing without bound.
+    """
+
+    def __init__(self, engine, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                 max_queue=BATCH_MAX_QUEUE):
+        """
+        :param engine: GenerationEngine to run batches on.
+        :param max_batch_size: Most requests per engine call.
+        :param max_wait_ms: Longest time the first request of a batch waits for company.
+        :param max_queue: Most requests waiting for a batch.
+        """
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.queue = None
+        self.task = None
+        # One worker: the engine owns the GPU and runs one batch at a time
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='engine')
+        self.stats = {'requests': 0, 'batches': 0, 'cancelled': 0, 'rejected': 0}
+
+    def start(self):
+        """
+        Starts the scheduling loop on the running event loop (call from a startup hook).
+        """
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, prompt, max_tokens=16, temperature=0.7, top_p=0.9):
+        """
+        Queues one prompt and waits for its completion.
+
+        :return: Generated text.
+        :raises asyncio.QueueFull: If max_queue requests are already waiting.
+        """
+        future = asyncio.get_running_loop().create_future()
+        params = {'max_tokens': max_tokens, 'temperature': temperature, 'top_p': top_p}
+        self.stats['requests'] += 1
+        try:
+            self.queue.put_nowait((prompt, params, future))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            raise
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take what is already queued without waiting
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that disconnected while queued are not generated for
+            live = [item for item in batch if not item[2].done()]
+            self.stats['cancelled'] += len(batch) - len(live)
+            if not live:
+                continue
+            prompts = [prompt for prompt, _, _ in live]
+            params = [params for _, params, _ in live]
+            try:
+                texts = await loop.run_in_executor(self.executor, self.engine.generate, prompts, params)
+            except Exception as e:
+                print(f"Error generating batch of {len(live)}: {e}")
+                for _, _, future in live:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats['batches'] += 1
+            for (_, _, future), text in zip(live, texts):
+                if not future.done():
+                    future.set_result(text)
+
+async def _demo(num_requests=64):
+    engine = FakeEngine()
+    scheduler = BatchScheduler(engine, max_batch_size=16, max_wait_ms=10)
+    scheduler.start()
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        scheduler.submit(f"prompt {i}", max_tokens=32) for i in range(num_requests)
+    ])
+    elapsed = time.perf_counter() - start
+    await scheduler.stop()
+    print(f"{len(results)} requests in {elapsed * 1000:.0f}ms with batch sizes {engine.batch_sizes}")
+    print(f"Sequential would take about {num_requests * (engine.batch_overhead_ms + 32 * engine.token_ms)}ms")
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -0,0 +1,225 @@
+# completion_cache.py
+# Completion cache for the gateways (app.py, gateway.py).
+#
+# Deterministic completions (temperature 0 or a fixed seed) are kept in a
+# byte-bounded LRU keyed by the normalized prompt, the model and the sampling
+# parameters. Identical requests that arrive while the same completion is
+# being generated wait for that generation instead of starting their own.
+#
+# Streamed requests use the cache but are not coalesced: a cached completion
+# is sent as one event and a stream read to the end is cached, but a stream
+# that misses always starts its own generation, since waiting for another
+# request's completion would delay its first token until that one finished.
+from collections import OrderedDict
+from concurrent.futures import Future
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from serving import VLLM_SERVER_URL
+
+COMPLETION_CACHE_BYTES = int(os.getenv('COMPLETION_CACHE_BYTES', str(64 * 1024 * 1024)))
+COMPLETION_CACHE_TTL = float(os.getenv('COMPLETION_CACHE_TTL', '3600'))  # seconds
+# Identifies the model in cache keys; defaults to the upstream URL, which serves one model
+COMPLETION_CACHE_MODEL = os.getenv('VLLM_MODEL', VLLM_SERVER_URL)
+
+def normalize_prompt(prompt):
+    """
+    NFC-normalizes the prompt and collapses whitespace runs, so prompts that
+    differ only in spacing share an entry.
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', prompt)).strip()
+
+def is_deterministic(payload):
+    """
+    :param payload: Completion request body.
+    :return: True if the request always produces the same completion.
+    """
+    return payload.get('temperature') == 0 or payload.get('seed') is not None
+
+def completion_key(payload, model=COMPLETION_CACHE_MODEL):
+    """
+    Cache key of a completion request: the normalized prompt, the model and
+    every sampling parameter in the payload. 'stream' does not change the
+    completion and is left out.
+    """
+    params = {name: value for name, value in payload.items() if name != 'stream'}
+    params['prompt'] = normalize_prompt(params.get('prompt', ''))
+    params['model'] = model
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+class CompletionCache:
+    """
+    LRU of completion texts bounded by their total size in bytes, with
+    in-flight coalescing for both threaded and asyncio callers.
+
+    `get_or_generate` (threads) and `aget_or_generate` (asyncio) take a
+    `generate` callable returning (text, error), where error is None or a
+    (message, HTTP status) tuple; only successful
+    completions are cached, and coalesced callers receive the same
+    (text, error) as the request they attached to.
+    """
+
+    def __init__(self, max_bytes=COMPLETION_CACHE_BYTES, ttl=COMPLETION_CACHE_TTL):
+        """
+        :param max_bytes: Bound on the UTF-8 size of the cached texts.
+        :param ttl: Seconds an entry stays valid.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'coalesced': 0, 'misses': 0, 'uncacheable': 0,
+                      'evictions': 0, 'bytes_saved': 0}
+
+    def get(self, key):
+        """
+        :return: The cached text, or None; a hit counts towards the metrics.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            text, size, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += size
+            return text
+
+    def put(self, key, text):
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (text, size, time.monotonic() + self.ttl)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def record(self, outcome, text=None):
+        """
+        Counts a request that did not hit the cache: 'misses', 'uncacheable' or
+        'coalesced' (with the text it received).
+        """
+        with self.lock:
+            self.stats[outcome] += 1
+            if outcome == 'coalesced' and text is not None:
+                self.stats['bytes_saved'] += len(text.encode('utf-8'))
+
+    def key_for(self, payload):
+        """
+        :return: Cache key of the request, or None (counted as uncacheable) if it is not deterministic.
+        """
+        if not is_deterministic(payload):
+            self.record('uncacheable')
+            return None
+        return completion_key(payload)
+
+    def get_or_generate(self, key, generate):
+        """
+        Threaded lookup: returns the cached text, waits for an identical
+        generation already running, or runs `generate` and caches its text.
+
+        :return: Tuple of (text, error).
+        """
+        text = self.get(key)
+        if text is not None:
+            return text, None
+        with self.lock:
+            future = self.pending.get(key)
+            leader = future is None
+            if leader:
+                future = self.pending[key] = Future()
+        if not leader:
+            text, error = future.result()
+            self.record('coalesced', text if error is None else None)
+            return text, error
+        self.record('misses')
+        result = (None, ("Error generating response.", 500))
+        try:
+            result = generate()
+            if result[1] is None:
+                self.put(key, result[0])
+        finally:
+            with self.lock:
+                del self.pending[key]
+            future.set_result(result)
+        return result
+
+    async def aget_or_generate(self, key, generate):
+        """
+        Asyncio version of `get_or_generate`; `generate` is a coroutine function.
+        The generation runs as its own task, so a caller that disconnects does
+        not cancel it for the others.
+        """
+        text = self.get(key)
+        if text is not None:
+            return text, None
+        task = self.pending.get(key)
+        if task is None:
+            self.record('misses')
+            task = self.pending[key] = asyncio.ensure_future(generate())
+            task.add_done_callback(lambda done: self._finish(key, done))
+            return await asyncio.shield(task)
+        text, error = await asyncio.shield(task)
+        self.record('coalesced', text if error is None else None)
+        return text, error
+
+    def _finish(self, key, task):
+        del self.pending[key]
+        if not task.cancelled() and task.exception() is None:
+            text, error = task.result()
+            if error is None:
+                self.put(key, text)
+
+    def metrics(self):
+        """
+        :return: Counters plus hit rate (hits and coalesced requests over
+                 cacheable requests), entries and bytes held.
+        """
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics['entries'] = len(self.entries)
+            metrics['bytes'] = self.bytes
+            metrics['max_bytes'] = self.max_bytes
+        served = metrics['hits'] + metrics['coalesced']
+        cacheable = served + metrics['misses']
+        metrics['hit_rate'] = served / cacheable if cacheable else 0.0
+        return metrics
+
+if __name__ == "__main__":
+    cache = CompletionCache(max_bytes=1024)
+    calls = []
+
+    async def fake_generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "Paris", None
+
+    async def demo():
+        payload = {"prompt": "What is  the capital of France?", "max_tokens": 16, "temperature": 0}
+        key = completion_key(payload)
+        # Ten identical concurrent requests share one generation, the next one hits the cache
+        await asyncio.gather(*[cache.aget_or_generate(key, fake_generate) for _ in range(10)])
+        await cache.aget_or_generate(completion_key(dict(payload, prompt="What is the capital of France?")),
+                                     fake_generate)
+
+    asyncio.run(demo())
+    print(f"Generations: {len(calls)}, metrics: {cache.metrics()}")
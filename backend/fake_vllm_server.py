@@ -0,0 +1,108 @@
+# fake_vllm_server.py
+# Stand-in for vLLM's OpenAI-compatible /v1/completions endpoint that emits
+# tokens with configurable delays, for exercising the gateways without a GPU.
+#
+# Run with: python fake_vllm_server.py --port 8000 --token-delay-ms 20
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Delays in milliseconds; overridable by the command line
+FIRST_TOKEN_DELAY_MS = float(os.getenv('FAKE_FIRST_TOKEN_DELAY_MS', '100'))
+TOKEN_DELAY_MS = float(os.getenv('FAKE_TOKEN_DELAY_MS', '20'))
+JITTER_MS = float(os.getenv('FAKE_JITTER_MS', '0'))
+MAX_TOKENS = int(os.getenv('FAKE_MAX_TOKENS', '4096'))
+
+app = FastAPI()
+stats = {'requests': 0, 'active': 0, 'completed': 0, 'cancelled': 0, 'tokens': 0}
+
+def _delay(base_ms):
+    return max(base_ms + random.uniform(-JITTER_MS, JITTER_MS), 0.0) / 1000.0
+
+def _body(request_id, text, finish_reason=None):
+    return {
+        "id": request_id,
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{"index": 0, "text": text, "logprobs": None, "finish_reason": finish_reason}],
+    }
+
+async def _tokens(num_tokens):
+    """
+    Yields token texts with the configured first-token and inter-token delays.
+    """
+    await asyncio.sleep(_delay(FIRST_TOKEN_DELAY_MS))
+    for i in range(num_tokens):
+        if i:
+            await asyncio.sleep(_delay(TOKEN_DELAY_MS))
+        stats['tokens'] += 1
+        yield f" token{i}"
+
+@app.post("/v1/completions")
+async def completions(request: Request):
+    data = await request.json()
+    num_tokens = min(int(data.get("max_tokens", 16)), MAX_TOKENS)
+    request_id = f"cmpl-{stats['requests']}"
+    stats['requests'] += 1
+
+    if not data.get("stream"):
+        stats['active'] += 1
+        try:
+            text = ''.join([token async for token in _tokens(num_tokens)])
+            stats['completed'] += 1
+        except asyncio.CancelledError:
+            stats['cancelled'] += 1
+            raise
+        finally:
+            stats['active'] -= 1
+        body = _body(request_id, text, "length")
+        body["usage"] = {"prompt_tokens": len(str(data.get("prompt", "")).split()),
+                         "completion_tokens": num_tokens}
+        return body
+
+    async def events():
+        stats['active'] += 1
+        try:
+            async for token in _tokens(num_tokens):
+                yield f"data: {json.dumps(_body(request_id, token))}\n\n"
+            yield f"data: {json.dumps(_body(request_id, '', 'length'))}\n\n"
+            yield "data: [DONE]\n\n"
+            stats['completed'] += 1
+        except asyncio.CancelledError:
+            # The client went away mid-stream; vLLM would abort the sequence here
+            stats['cancelled'] += 1
+            raise
+        finally:
+            stats['active'] -= 1
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+@app.get("/stats")
+async def get_stats():
+    """
+    Counters for checking that gateways reuse connections and cancel abandoned generations.
+    """
+    return stats
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake vLLM completions server.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--first-token-delay-ms', type=float, default=FIRST_TOKEN_DELAY_MS)
+    parser.add_argument('--token-delay-ms', type=float, default=TOKEN_DELAY_MS)
+    parser.add_argument('--jitter-ms', type=float, default=JITTER_MS)
+    args = parser.parse_args()
+
+    FIRST_TOKEN_DELAY_MS = args.first_token_delay_ms
+    TOKEN_DELAY_MS = args.token_delay_ms
+    JITTER_MS = args.jitter_ms
+    uvicorn.run(app, host=args.host, port=args.port, backlog=4096)
@@ -0,0 +1,330 @@
+# gateway.py
+# Async gateway: the same /api/generate and /api/rag endpoints as app.py,
+# served from one event loop so thousands of generations can be in flight
+# per process without a thread each.
+#
+# Run with: uvicorn gateway:app --host 0.0.0.0 --port 5000
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+import httpx
+
+from completion_cache import CompletionCache
+from serving import (
+    VLLM_SERVER_URL, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, vllm_headers, completion_text,
+    parse_stream_line, sse_event, warm_up_retrieval, retrieve_context, assemble_prompt,
+    parse_rag_request, parse_max_tokens, parse_stream, parse_sampling, RAG_RETRIEVAL_WORKERS,
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Generations allowed in flight; each holds one upstream connection and a few KB of buffers
+MAX_IN_FLIGHT = int(os.getenv('GATEWAY_MAX_IN_FLIGHT', '4096'))
+# Seconds a request waits for a free slot before it is rejected
+QUEUE_TIMEOUT = float(os.getenv('GATEWAY_QUEUE_TIMEOUT', '5'))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', str(MAX_IN_FLIGHT)))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv('UPSTREAM_MAX_KEEPALIVE', '256'))
+
+app = FastAPI()
+
+# Enable CORS for all routes (Restrict origins in production)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+client = None
+in_flight = None
+completion_cache = CompletionCache()
+retrieval_executor = ThreadPoolExecutor(max_workers=RAG_RETRIEVAL_WORKERS,
+                                        thread_name_prefix='retrieval')
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',  # Disable proxy buffering so tokens flush immediately
+}
+
+def create_client(transport=None):
+    """
+    Creates the upstream client shared by every request: keep-alive reuse,
+    bounded connections, and a read timeout that applies between streamed chunks.
+
+    :param transport: httpx transport to use instead of the network, e.g. a
+                      MockTransport or an ASGITransport over fake_vllm_server.app.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(connect=UPSTREAM_CONNECT_TIMEOUT, read=UPSTREAM_READ_TIMEOUT,
+                              write=UPSTREAM_CONNECT_TIMEOUT, pool=QUEUE_TIMEOUT),
+        headers=vllm_headers(),
+        transport=transport,
+    )
+
+@app.on_event("startup")
+async def start_gateway():
+    global client, in_flight
+    client = create_client()
+    in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+    # Warm up retrieval without delaying startup
+    asyncio.get_running_loop().run_in_executor(retrieval_executor, warm_up_retrieval)
+
+@app.on_event("shutdown")
+async def stop_gateway():
+    await client.aclose()
+    retrieval_executor.shutdown(wait=False)
+
+async def acquire_slot():
+    """
+    Waits up to QUEUE_TIMEOUT seconds for an in-flight slot.
+
+    :return: True if a slot was acquired; release it with `in_flight.release()`.
+    """
+    try:
+        await asyncio.wait_for(in_flight.acquire(), QUEUE_TIMEOUT)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def error_response(message, status_code):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+async def stream_completion(payload, first_events=(), cache_key=None):
+    """
+    Async generator relaying a streamed vLLM completion as Server-Sent Events.
+
+    When the client disconnects, the server cancels this generator; leaving
+    the `client.stream` block then closes the upstream connection, so vLLM
+    aborts the generation.
+
+    :param payload: Completion request body; 'stream' is forced on.
+    :param first_events: Events sent before the first token (e.g. RAG sources).
+    :param cache_key: Completion cache key; a cached completion is sent as one
+                      event, and a completion streamed to the end is cached.
+                      Identical streams in flight are not coalesced.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    for event in first_events:
+        yield event
+    if cache_key:
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            yield sse_event({"text": cached})
+            yield sse_event({"total_ms": round((time.perf_counter() - start) * 1000.0, 2), "cached": True},
+                            event="done")
+            return
+        completion_cache.record('misses')
+    parts = []
+    if not await acquire_slot():
+        yield sse_event({"error": "Gateway is at capacity."}, event="error")
+        return
+    try:
+        async with client.stream("POST", VLLM_SERVER_URL, json=dict(payload, stream=True)) as upstream:
+            if upstream.status_code != 200:
+                logger.error(f"vLLM server error: {(await upstream.aread()).decode('utf-8', 'replace')}")
+                yield sse_event({"error": "vLLM server error."}, event="error")
+                return
+            async for line in upstream.aiter_lines():
+                text = parse_stream_line(line)
+                if text is None:
+                    if cache_key:
+                        completion_cache.put(cache_key, ''.join(parts))
+                    break
+                if not text:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    logger.info(f"Time to first token: {(first_token_at - start) * 1000:.0f}ms")
+                parts.append(text)
+                yield sse_event({"text": text})
+        yield sse_event({"total_ms": round((time.perf_counter() - start) * 1000.0, 2)}, event="done")
+    except asyncio.CancelledError:
+        logger.info("Client disconnected, cancelling upstream completion")
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming from vLLM server: {e}")
+        yield sse_event({"error": "Error generating response."}, event="error")
+    finally:
+        in_flight.release()
+
+async def complete(payload):
+    """
+    Runs a non-streamed completion within an in-flight slot.
+
+    :return: Tuple of (generated text, (error message, status code) or None).
+    """
+    if not await acquire_slot():
+        return None, ("Gateway is at capacity.", 503)
+    try:
+        response = await client.post(VLLM_SERVER_URL, json=payload)
+    except Exception as e:
+        logger.error(f"Error communicating with vLLM server: {e}")
+        return None, ("Error generating response.", 500)
+    finally:
+        in_flight.release()
+    if response.status_code != 200:
+        logger.error(f"vLLM server error: {response.text}")
+        return None, ("vLLM server error.", 500)
+    return completion_text(response.json()), None
+
+async def cached_complete(payload):
+    """
+    Runs a non-streamed completion through the completion cache; deterministic
+    requests identical to one already running share its generation.
+
+    :return: Tuple of (generated text, (error message, status code) or None).
+    """
+    key = completion_cache.key_for(payload)
+    if key is None:
+        return await complete(payload)
+    return await completion_cache.aget_or_generate(key, lambda: complete(payload))
+
+# ===========================
+# Generate Endpoint
+# ===========================
+
+@app.post("/api/generate")
+async def generate_response(request: Request):
+    """
+    Endpoint to generate text based on a given prompt.
+    Expects JSON payload with 'prompt' and optional 'max_tokens', 'temperature',
+    'top_p', 'seed' and 'stream'. Requests with temperature 0 or a seed are
+    served from the completion cache.
+    """
+    data = await read_json(request)
+    prompt = data.get("prompt", "")
+    if not prompt:
+        return error_response("No prompt provided.", 400)
+    max_tokens, error = parse_max_tokens(data)
+    if error:
+        return error_response(error, 400)
+    stream, error = parse_stream(data)
+    if error:
+        return error_response(error, 400)
+    sampling, error = parse_sampling(data)
+    if error:
+        return error_response(error, 400)
+
+    payload = {"prompt": prompt, "max_tokens": max_tokens, **sampling}
+    if stream:
+        return StreamingResponse(stream_completion(payload, cache_key=completion_cache.key_for(payload)),
+                                 media_type='text/event-stream', headers=SSE_HEADERS)
+    generated_text, error = await cached_complete(payload)
+    if error:
+        return error_response(*error)
+    return {"generated_text": generated_text}
+
+# ===========================
+# RAG Endpoint
+# ===========================
+
+@app.post("/api/rag")
+async def rag_response(request: Request):
+    """
+    Endpoint to answer a question from the ingested documents; same payload
+    and response as the Flask /api/rag.
+    """
+    timings = {}
+    request_start = time.perf_counter()
+
+    data = await read_json(request)
+    query, k, filters, error = parse_rag_request(data)
+    if error:
+        return error_response(error, 400)
+
+    # Retrieval is blocking (model and database), so it runs on the thread pool
+    retrieval = asyncio.get_running_loop().run_in_executor(
+        retrieval_executor, retrieve_context, query, k, filters)
+    timings['parse'] = (time.perf_counter() - request_start) * 1000.0
+
+    validate_start = time.perf_counter()
+    max_tokens, error = parse_max_tokens(data)
+    if not error:
+        stream, error = parse_stream(data)
+    if error:
+        retrieval.cancel()
+        return error_response(error, 400)
+    timings['validate'] = (time.perf_counter() - validate_start) * 1000.0
+
+    wait_start = time.perf_counter()
+    try:
+        results, retrieval_timings = await retrieval
+    except Exception as e:
+        logger.error(f"Error retrieving context: {e}")
+        return error_response("Error retrieving context.", 500)
+    timings['retrieval_wait'] = (time.perf_counter() - wait_start) * 1000.0
+    timings.update(retrieval_timings)
+
+    assemble_start = time.perf_counter()
+    prompt, used = assemble_prompt(query, results)
+    timings['assemble'] = (time.perf_counter() - assemble_start) * 1000.0
+    sources = [
+        {"id": chunk_id, "distance": distance, "content": content}
+        for chunk_id, content, distance in used
+    ]
+    payload = {"prompt": prompt, "max_tokens": max_tokens}
+
+    if stream:
+        timings = {stage: round(ms, 2) for stage, ms in timings.items()}
+        first = sse_event({"sources": sources, "timings_ms": timings}, event="sources")
+        return StreamingResponse(stream_completion(payload, [first]), media_type='text/event-stream',
+                                 headers=SSE_HEADERS)
+
+    completion_start = time.perf_counter()
+    answer, error = await complete(payload)
+    if error:
+        return error_response(*error)
+    timings['completion'] = (time.perf_counter() - completion_start) * 1000.0
+    timings['total'] = (time.perf_counter() - request_start) * 1000.0
+    timings = {stage: round(ms, 2) for stage, ms in timings.items()}
+    logger.info(f"RAG request timings (ms): {timings}")
+    return JSONResponse(
+        {"answer": answer, "sources": sources, "timings_ms": timings},
+        headers={'Server-Timing': ', '.join(f"{stage};dur={ms}" for stage, ms in timings.items())},
+    )
+
+# ===========================
+# Metrics Endpoint
+# ===========================
+
+@app.get("/api/metrics")
+async def metrics():
+    """
+    Completion cache counters: hits, coalesced requests, misses, hit rate and bytes saved.
+    """
+    return {"completion_cache": completion_cache.metrics()}
+
+# ===========================
+# Root Endpoint
+# ===========================
+
+@app.get("/")
+async def root():
+    """
+    Root endpoint to verify that the API is running.
+    """
+    return {"message": "Welcome to the vLLM async gateway!"}
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('GATEWAY_PORT', '5000')),
+                backlog=4096, timeout_keep_alive=30)
@@ -1,70 +1,159 @@
 # image_processing/generate_image_captions.py
+# Run from backend/ with: python -m image_processing.generate_image_captions
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from transformers import BlipProcessor, BlipForConditionalGeneration
 from PIL import Image
+import io
+import itertools
 import os
-import psycopg2
-from dotenv import load_dotenv
-from psycopg2.extras import execute_values
+import torch
+from vector_db.bulk_load import replace_image_descriptions
+from vector_db.db import get_db_config
+from vector_db.embedding_cache import cached_encode
+from vector_db.schema import DEFAULT_COURSE
 
-load_dotenv()
+CAPTION_MODEL = "Salesforce/blip-image-captioning-base"
 
-def get_db_config():
-    return {
-        'dbname': os.getenv('DB_NAME', 'rag_db'),
-        'user': os.getenv('DB_USER', 'postgres'),
-        'password': os.getenv('DB_PASSWORD', 'your_password'),
-        'host': os.getenv('DB_HOST', 'localhost'),
-        'port': os.getenv('DB_PORT', '5432')
-    }
-
-def generate_captions(image_folder, model_name="Salesforce/blip-image-captioning-base"):
+@lru_cache(maxsize=None)
+def get_caption_model(model_name=CAPTION_MODEL):
     """
-    Generates captions for all images in the specified folder.
+    Loads the BLIP processor and model once per process.
     
-    :param image_folder: Directory containing images.
     :param model_name: Pretrained model name.
-    :return: Dictionary mapping image paths to captions.
+    :return: Tuple of (processor, model).
     """
     processor = BlipProcessor.from_pretrained(model_name)
     model = BlipForConditionalGeneration.from_pretrained(model_name)
-    
+    model.eval()
+    return processor, model
+
+def _iter_folder_images(image_folder):
+    """
+    Yields (image_file, opener, area) tuples for every image file in a folder.
+    """
     image_files = sorted([
         f for f in os.listdir(image_folder) 
         if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))
     ])
-    
-    captions = {}
     for image_file in image_files:
         image_path = os.path.join(image_folder, image_file)
+        # Sizes are unknown until decode, so folder images are not regrouped
+        yield image_file, lambda path=image_path: Image.open(path), 0
+
+def _iter_record_images(records):
+    """
+    Yields (image_file, opener, area) tuples for in-memory image records from
+    `pdf_parsing.extract_images.iter_images`.
+    """
+    for record in records:
+        yield (record['filename'], lambda data=record['bytes']: Image.open(io.BytesIO(data)),
+               record['width'] * record['height'])
+
+def _group_batches(images, batch_size, lookahead=8):
+    """
+    Groups images of similar size into batches.
+    
+    Reads up to batch_size * lookahead images ahead, sorts them by pixel area
+    and cuts the window into batches, so memory stays bounded while images in
+    a batch take similar time to decode and resize.
+    """
+    window_size = batch_size * lookahead
+    while True:
+        window = list(itertools.islice(images, window_size))
+        if not window:
+            return
+        window.sort(key=lambda image: image[2])
+        for i in range(0, len(window), batch_size):
+            yield window[i:i + batch_size]
+
+def _prepare_batch(processor, batch):
+    """
+    Worker task: decodes a batch of images and runs the BLIP preprocessor.
+    
+    :return: Tuple of (image filenames, model inputs or None).
+    """
+    names, pixels = [], []
+    for image_file, open_image, _ in batch:
         try:
-            image = Image.open(image_path).convert('RGB')
-            inputs = processor(image, return_tensors="pt")
-            out = model.generate(**inputs)
-            caption = processor.decode(out[0], skip_special_tokens=True)
-            captions[image_file] = caption
-            print(f"Captioned {image_file}: {caption}")
+            pixels.append(open_image().convert('RGB'))
+            names.append(image_file)
         except Exception as e:
-            print(f"Error captioning {image_file}: {e}")
+            print(f"Error decoding {image_file}: {e}")
+    if not pixels:
+        return names, None
+    return names, processor(images=pixels, return_tensors="pt")
+
+def generate_captions(image_folder=None, model_name=CAPTION_MODEL, records=None,
+                      batch_size=8, num_workers=2, max_new_tokens=30):
+    """
+    Generates captions for all images in the specified folder, or for
+    in-memory image records without touching the disk.
+    
+    Images are decoded and preprocessed on a thread pool, up to num_workers
+    batches ahead, while the model generates captions for the current batch.
+    
+    :param image_folder: Directory containing images.
+    :param model_name: Pretrained model name.
+    :param records: Optional iterable of image records to caption instead of a folder.
+    :param batch_size: Number of images per generate call.
+    :param num_workers: Number of batches prepared in the background.
+    :param max_new_tokens: Maximum caption length in tokens.
+    :return: Dictionary mapping image filenames to captions.
+    """
+    processor, model = get_caption_model(model_name)
+    
+    if records is not None:
+        images = _iter_record_images(records)
+    else:
+        images = _iter_folder_images(image_folder)
+    batches = _group_batches(images, batch_size)
+    
+    captions = {}
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque(
+            executor.submit(_prepare_batch, processor, batch)
+            for batch in itertools.islice(batches, num_workers)
+        )
+        while pending:
+            names, inputs = pending.popleft().result()
+            # Keep the prefetch queue full before blocking on the model
+            for batch in itertools.islice(batches, 1):
+                pending.append(executor.submit(_prepare_batch, processor, batch))
+            if inputs is None:
+                continue
+            try:
+                with torch.inference_mode():
+                    out = model.generate(**inputs, max_new_tokens=max_new_tokens)
+                for image_file, caption in zip(names, processor.batch_decode(out, skip_special_tokens=True)):
+                    captions[image_file] = caption
+                    print(f"Captioned {image_file}: {caption}")
+            except Exception as e:
+                print(f"Error captioning {', '.join(names)}: {e}")
     
     return captions
 
-def store_image_captions(captions, db_config):
+def store_image_captions(captions, document_id, course=DEFAULT_COURSE, db_config=None,
+                         model_name='all-MiniLM-L6-v2', image_folder='../data/extracted_images/'):
     """
-    Stores image captions into the 'image_descriptions' table.
+    Stores one document's image captions into the 'image_descriptions' table,
+    replacing the images stored for it by earlier runs.
     
     :param captions: Dictionary mapping image filenames to captions.
-    :param db_config: Database connection parameters.
+    :param document_id: Identifier of the document the images come from.
+    :param course: Course the document belongs to.
+    :param db_config: Database connection parameters (defaults to the environment).
+    :param model_name: Name of the SentenceTransformer model for the caption embeddings.
+    :param image_folder: Folder recorded in image_path.
     """
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        insert_query = """
-            INSERT INTO image_descriptions (document_id, page_number, image_path, caption, embedding)
-            VALUES %s
-        """
+        # Embed all captions in one batched call with the shared model
+        caption_embeddings = cached_encode(list(captions.values()), model_name=model_name) if captions else []
+        
         # Assuming image filenames contain page numbers, e.g., 'page1_img1.png'
         data_to_insert = []
-        for image_file, caption in captions.items():
+        for (image_file, caption), embedding in zip(captions.items(), caption_embeddings):
             # Extract page number from filename
             parts = image_file.split('_')
             if len(parts) >= 2 and parts[0].startswith('page') and parts[1].startswith('img'):
@@ -72,29 +161,20 @@ def store_image_captions(captions, db_config):
             else:
                 page_number = 0  # Default or handle differently
             
-            document_id = 'physics_notes'  # Modify if handling multiple documents
-            image_path = os.path.join('../data/extracted_images/', image_file)
-            
-            # Generate embedding for the caption
-            # Initialize the embedding model here or pass embeddings as a parameter
-            # For simplicity, we'll generate embeddings here
-            from sentence_transformers import SentenceTransformer
-            embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-            embedding = embedding_model.encode(caption).tolist()
+            image_path = os.path.join(image_folder or '', image_file)
             
-            data_to_insert.append((document_id, page_number, image_path, caption, embedding))
+            data_to_insert.append((document_id, page_number, image_path, caption, embedding, course))
         
-        execute_values(cursor, insert_query, data_to_insert)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"Stored {len(data_to_insert)} image captions into PostgreSQL.")
+        stats = replace_image_descriptions(document_id, data_to_insert, db_config)
+        print(f"Stored {stats['rows']} image captions into PostgreSQL, replacing {stats['deleted']} "
+              f"({stats['rows_per_sec']:.0f} rows/sec).")
     except Exception as e:
         print(f"Error storing image captions: {e}")
 
 if __name__ == "__main__":
-    image_folder = '../data/extracted_images/'
+    image_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                'extracted_images')
     db_config = get_db_config()
     captions = generate_captions(image_folder)
-    store_image_captions(captions, db_config)
+    store_image_captions(captions, 'physics_notes', db_config=db_config, image_folder=image_folder)
 
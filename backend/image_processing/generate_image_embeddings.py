@@ -1,40 +1,26 @@
 # image_processing/generate_image_embeddings.py
-from sentence_transformers import SentenceTransformer
-import psycopg2
-import os
-from dotenv import load_dotenv
+# Run from backend/ with: python -m image_processing.generate_image_embeddings
+from vector_db.embedding_cache import cached_encode
+from vector_db.db import get_connection, get_db_config
+from vector_db.schema import bump_corpus_version
 from psycopg2.extras import execute_values
 
-load_dotenv()
-
-def get_db_config():
-    return {
-        'dbname': os.getenv('DB_NAME', 'rag_db'),
-        'user': os.getenv('DB_USER', 'postgres'),
-        'password': os.getenv('DB_PASSWORD', 'your_password'),
-        'host': os.getenv('DB_HOST', 'localhost'),
-        'port': os.getenv('DB_PORT', '5432')
-    }
-
-def load_captions(db_config):
+def load_captions(db_config=None):
     """
     Retrieves image captions from the 'image_descriptions' table.
     
-    :param db_config: Database connection parameters.
+    :param db_config: Database connection parameters (defaults to the environment).
     :return: List of tuples containing (id, caption).
     """
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
         query_sql = """
             SELECT id, caption
             FROM image_descriptions
         """
-        cursor.execute(query_sql)
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return results
+        with get_connection(db_config) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query_sql)
+                return cursor.fetchall()
     except Exception as e:
         print(f"Error loading captions: {e}")
         return []
@@ -47,21 +33,17 @@ def generate_embeddings(captions, model_name='all-MiniLM-L6-v2'):
     :param model_name: Name of the SentenceTransformer model.
     :return: List of embeddings.
     """
-    model = SentenceTransformer(model_name)
-    embeddings = [model.encode(caption) for _, caption in captions]
-    return embeddings
+    return cached_encode([caption for _, caption in captions], model_name=model_name)
 
-def update_embeddings(captions, embeddings, db_config):
+def update_embeddings(captions, embeddings, db_config=None):
     """
     Updates the 'image_descriptions' table with the generated embeddings.
     
     :param captions: List of tuples containing (id, caption).
     :param embeddings: List of embeddings.
-    :param db_config: Database connection parameters.
+    :param db_config: Database connection parameters (defaults to the environment).
     """
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
         update_query = """
             UPDATE image_descriptions
             SET embedding = data.embedding
@@ -71,10 +53,10 @@ def update_embeddings(captions, embeddings, db_config):
         data_to_update = [
             (id_, emb.tolist()) for (id_, _), emb in zip(captions, embeddings)
         ]
-        execute_values(cursor, update_query, data_to_update)
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with get_connection(db_config) as conn:
+            with conn.cursor() as cursor:
+                execute_values(cursor, update_query, data_to_update)
+        bump_corpus_version(db_config)
         print(f"Updated {len(data_to_update)} image embeddings in PostgreSQL.")
     except Exception as e:
         print(f"Error updating embeddings: {e}")
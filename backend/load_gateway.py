@@ -0,0 +1,78 @@
+# load_gateway.py
+# Opens many concurrent streaming generations against a gateway and reports
+# time to first token, completion time and throughput.
+#
+# Example, against the fake server:
+#   python fake_vllm_server.py --port 8000 --token-delay-ms 20 &
+#   uvicorn gateway:app --port 5000 &
+#   python load_gateway.py --url http://localhost:5000/api/generate --concurrency 2000
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+import numpy as np
+
+async def one_stream(client, url, max_tokens, cancel_after=None):
+    """
+    Runs one streamed generation.
+
+    :param cancel_after: Disconnect after this many tokens, to exercise upstream cancellation.
+    :return: Tuple of (time to first token, total time, tokens received, error or None).
+    """
+    start = time.perf_counter()
+    first_token = None
+    tokens = 0
+    try:
+        async with client.stream("POST", url, json={"prompt": "load test", "max_tokens": max_tokens,
+                                                    "stream": True}) as response:
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    if event == "error":
+                        return first_token, time.perf_counter() - start, tokens, json.loads(line[5:])["error"]
+                    if event is None:
+                        tokens += 1
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        if cancel_after is not None and tokens >= cancel_after:
+                            break
+                    event = None
+    except Exception as e:
+        return first_token, time.perf_counter() - start, tokens, str(e)
+    return first_token, time.perf_counter() - start, tokens, None
+
+async def run_load(url, concurrency, max_tokens, cancel_fraction=0.0):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300.0)) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            one_stream(client, url, max_tokens,
+                       cancel_after=max_tokens // 4 if random.random() < cancel_fraction else None)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+    first_tokens = np.array([r[0] for r in results if r[0] is not None]) * 1000.0
+    errors = [r[3] for r in results if r[3]]
+    total_tokens = sum(r[2] for r in results)
+    print(f"{concurrency} streams in {elapsed:.2f}s, {total_tokens / elapsed:.0f} tokens/s, "
+          f"{len(errors)} errors")
+    if len(first_tokens):
+        print(f"Time to first token: p50={np.percentile(first_tokens, 50):.0f}ms "
+              f"p99={np.percentile(first_tokens, 99):.0f}ms")
+    if errors:
+        print(f"First error: {errors[0]}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent streaming load against a gateway.")
+    parser.add_argument('--url', default='http://localhost:5000/api/generate')
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--max-tokens', type=int, default=64)
+    parser.add_argument('--cancel-fraction', type=float, default=0.0,
+                        help="Fraction of clients that disconnect early.")
+    args = parser.parse_args()
+    asyncio.run(run_load(args.url, args.concurrency, args.max_tokens, args.cancel_fraction))
@@ -1,45 +1,141 @@
 # pdf_parsing/chunk_text.py
+from collections import deque
+from functools import lru_cache
 from transformers import AutoTokenizer
 import os
 
-def chunk_text(text, max_tokens=500, overlap=50, model_name='sentence-transformers/all-MiniLM-L6-v2'):
+DEFAULT_TOKENIZER = 'sentence-transformers/all-MiniLM-L6-v2'
+SEGMENT_CHARS = 100_000  # Characters tokenized per call when streaming a document
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name=DEFAULT_TOKENIZER):
+    """
+    Loads a fast tokenizer once per process.
+
+    :param model_name: Name of the tokenizer model.
+    :return: Cached tokenizer instance.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    if not tokenizer.is_fast:
+        raise ValueError(f"{model_name} has no fast tokenizer; offset mappings are required.")
+    return tokenizer
+
+def _iter_token_offsets(text, tokenizer, segment_chars=SEGMENT_CHARS):
+    """
+    Yields (start, end) character offsets of every token in text.
+
+    Long texts are tokenized in segments cut at whitespace, so memory stays
+    bounded and no word is split across segments.
+    """
+    position = 0
+    while position < len(text):
+        end = min(position + segment_chars, len(text))
+        if end < len(text):
+            cut = max(text.rfind(' ', position, end), text.rfind('\n', position, end))
+            if cut > position:
+                end = cut
+        encoding = tokenizer(text[position:end], add_special_tokens=False,
+                             return_offsets_mapping=True)
+        for start, stop in encoding['offset_mapping']:
+            yield position + start, position + stop
+        position = end
+
+def _iter_windows(offsets, max_tokens, overlap):
+    """
+    Groups token offsets into overlapping windows of character spans.
+
+    :param offsets: Iterable of token (start, end) offsets.
+    :return: Generator of (start, end) character spans.
+    """
+    stride = max_tokens - overlap
+    if stride <= 0:
+        raise ValueError("overlap must be smaller than max_tokens")
+    window = deque()
+    emitted = False
+    for offset in offsets:
+        window.append(offset)
+        if len(window) == max_tokens:
+            yield window[0][0], window[-1][1]
+            emitted = True
+            for _ in range(stride):
+                window.popleft()
+    # Emit the tail only if it holds tokens not already covered by the last window
+    if window and (not emitted or len(window) > overlap):
+        yield window[0][0], window[-1][1]
+
+def _iter_records(text, spans):
+    for number, (start, end) in enumerate(spans, start=1):
+        yield {'chunk_number': number, 'start': start, 'end': end, 'content': text[start:end]}
+
+def iter_chunks(text, max_tokens=500, overlap=50, model_name=DEFAULT_TOKENIZER):
+    """
+    Streams chunk records for a document of any size.
+
+    :param text: The cleaned text to be chunked.
+    :param max_tokens: Maximum number of tokens per chunk.
+    :param overlap: Number of overlapping tokens between chunks.
+    :param model_name: Name of the tokenizer model.
+    :return: Generator of dicts with 'chunk_number', 'start', 'end' and 'content',
+             where content is exactly text[start:end].
+    """
+    tokenizer = get_tokenizer(model_name)
+    spans = _iter_windows(_iter_token_offsets(text, tokenizer), max_tokens, overlap)
+    return _iter_records(text, spans)
+
+def chunk_text(text, max_tokens=500, overlap=50, model_name=DEFAULT_TOKENIZER):
     """
     Splits text into chunks suitable for LLM processing.
-    
+
+    Chunks are slices of the original text taken at token boundaries, so the
+    stored content matches the source exactly.
+
     :param text: The cleaned text to be chunked.
     :param max_tokens: Maximum number of tokens per chunk.
     :param overlap: Number of overlapping tokens between chunks.
     :param model_name: Name of the tokenizer model.
-    :return: List of text chunks.
-    """
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    tokens = tokenizer.encode(text)
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = start + max_tokens
-        chunk_tokens = tokens[start:end]
-        chunk_text = tokenizer.decode(chunk_tokens, skip_special_tokens=True)
-        chunks.append(chunk_text)
-        start += max_tokens - overlap
-    return chunks
+    :return: List of chunk records (see `iter_chunks`).
+    """
+    return list(iter_chunks(text, max_tokens, overlap, model_name))
+
+def chunk_texts(texts, max_tokens=500, overlap=50, model_name=DEFAULT_TOKENIZER):
+    """
+    Chunks many documents, tokenizing the short ones in a single batch call.
+
+    :param texts: List of cleaned document texts.
+    :param max_tokens: Maximum number of tokens per chunk.
+    :param overlap: Number of overlapping tokens between chunks.
+    :param model_name: Name of the tokenizer model.
+    :return: List with one list of chunk records per input text.
+    """
+    tokenizer = get_tokenizer(model_name)
+    results = [None] * len(texts)
+    short = [i for i, text in enumerate(texts) if len(text) <= SEGMENT_CHARS]
+    if short:
+        encodings = tokenizer([texts[i] for i in short], add_special_tokens=False,
+                              return_offsets_mapping=True)
+        for i, offsets in zip(short, encodings['offset_mapping']):
+            results[i] = list(_iter_records(texts[i], _iter_windows(offsets, max_tokens, overlap)))
+    for i, text in enumerate(texts):
+        if results[i] is None:
+            results[i] = chunk_text(text, max_tokens, overlap, model_name)
+    return results
 
 def save_chunks(chunks, output_dir):
     """
     Saves each text chunk to a separate file in the specified directory.
-    
-    :param chunks: List of text chunks.
+
+    :param chunks: List of chunk records.
     :param output_dir: Directory to save the chunk files.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
-    for i, chunk in enumerate(chunks, start=1):
-        chunk_filename = f'chunk_{i}.txt'
+
+    for chunk in chunks:
+        chunk_filename = f"chunk_{chunk['chunk_number']}.txt"
         chunk_path = os.path.join(output_dir, chunk_filename)
         with open(chunk_path, 'w', encoding='utf-8') as f:
-            f.write(chunk)
-    
+            f.write(chunk['content'])
+
     print(f"Saved {len(chunks)} text chunks to {output_dir}")
 
 if __name__ == "__main__":
@@ -47,16 +143,15 @@ if __name__ == "__main__":
     data_directory = '../data/'
     cleaned_text_file = 'cleaned_text.txt'
     chunks_output_dir = '../data/chunks/'
-    
+
     input_path = os.path.join(data_directory, cleaned_text_file)
     output_dir = chunks_output_dir
-    
+
     try:
         with open(input_path, 'r', encoding='utf-8') as f:
             cleaned_text = f.read()
-        
+
         chunks = chunk_text(cleaned_text)
         save_chunks(chunks, output_dir)
     except Exception as e:
         print(f"Error chunking text: {e}")
-
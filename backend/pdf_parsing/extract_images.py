@@ -1,36 +1,134 @@
 # pdf_parsing/extract_images.py
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
+import itertools
 import os
 
-def extract_images(pdf_path, output_folder):
+MIN_IMAGE_SIZE = 32  # Images narrower or shorter than this (pixels) are decorative
+
+def _extract_page_range(args):
+    """
+    Worker task: extracts the image records of a contiguous page range.
+
+    Sizes come from the page's image table, so images that are too small are
+    dropped before their streams are extracted.
+
+    :param args: Tuple of (pdf_path, first_page, last_page, min_width, min_height),
+                 0-based pages, end exclusive.
+    :return: List of image records.
+    """
+    pdf_path, first_page, last_page, min_width, min_height = args
+    records = []
+    seen_xrefs = set()
+    with fitz.open(pdf_path) as pdf:
+        for page_number in range(first_page, last_page):
+            images = pdf[page_number].get_images(full=True)
+            for img_index, img in enumerate(images):
+                xref, width, height = img[0], img[2], img[3]
+                if width < min_width or height < min_height or xref in seen_xrefs:
+                    continue
+                seen_xrefs.add(xref)
+                base_image = pdf.extract_image(xref)
+                if not base_image:
+                    continue
+                records.append({
+                    'page': page_number + 1,
+                    'index': img_index + 1,
+                    'xref': xref,
+                    'ext': base_image["ext"],
+                    'width': base_image["width"],
+                    'height': base_image["height"],
+                    'bytes': base_image["image"],
+                    'filename': f"page{page_number+1}_img{img_index+1}.{base_image['ext']}",
+                })
+    return records
+
+def iter_images(pdf_path, min_width=MIN_IMAGE_SIZE, min_height=MIN_IMAGE_SIZE,
+                pages_per_shard=8, max_workers=None):
+    """
+    Streams image records from a PDF, extracting page ranges in a process pool.
+
+    Records are yielded in page order. At most two shards per worker are in
+    flight, so extracted image bytes do not pile up ahead of a slow consumer.
+    An image referenced on several pages (logos, headers) is only yielded for
+    the first page it appears on.
+
+    :param pdf_path: Path to the PDF file.
+    :param min_width: Minimum image width in pixels.
+    :param min_height: Minimum image height in pixels.
+    :param pages_per_shard: Number of pages handled by each worker task.
+    :param max_workers: Size of the process pool (defaults to the CPU count).
+    :return: Generator of dicts with 'page', 'index', 'xref', 'ext', 'width',
+             'height', 'bytes' and 'filename'.
+    """
+    with fitz.open(pdf_path) as pdf:
+        num_pages = len(pdf)
+    shards = [
+        (pdf_path, start, min(start + pages_per_shard, num_pages), min_width, min_height)
+        for start in range(0, num_pages, pages_per_shard)
+    ]
+    if len(shards) <= 1 or max_workers == 1:
+        yield from _dedupe(map(_extract_page_range, shards))
+    else:
+        yield from _dedupe(_iter_shard_results(shards, max_workers or os.cpu_count() or 1))
+
+def _iter_shard_results(shards, max_workers):
+    """
+    Extracts shards in a process pool, yielding their records in shard order
+    with at most max_workers * 2 shards submitted but not yet consumed.
+    """
+    shards = iter(shards)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(
+            executor.submit(_extract_page_range, shard)
+            for shard in itertools.islice(shards, max_workers * 2)
+        )
+        while pending:
+            records = pending.popleft().result()
+            # Refill the window only as results are consumed
+            for shard in itertools.islice(shards, 1):
+                pending.append(executor.submit(_extract_page_range, shard))
+            yield records
+
+def _dedupe(shard_results):
+    seen_xrefs = set()
+    for records in shard_results:
+        for record in records:
+            if record['xref'] not in seen_xrefs:
+                seen_xrefs.add(record['xref'])
+                yield record
+
+def save_image(record, output_folder):
+    """
+    Writes an image record to disk.
+
+    :param record: Image record from `iter_images`.
+    :param output_folder: Directory where the image will be saved.
+    :return: Path to the saved image.
+    """
+    image_path = os.path.join(output_folder, record['filename'])
+    with open(image_path, "wb") as img_file:
+        img_file.write(record['bytes'])
+    return image_path
+
+def extract_images(pdf_path, output_folder, min_width=MIN_IMAGE_SIZE, min_height=MIN_IMAGE_SIZE):
     """
     Extracts images from a PDF file and saves them to the specified folder.
-    
+
     :param pdf_path: Path to the PDF file.
     :param output_folder: Directory where images will be saved.
+    :param min_width: Minimum image width in pixels.
+    :param min_height: Minimum image height in pixels.
     :return: List of paths to the extracted images.
     """
     try:
-        pdf = fitz.open(pdf_path)
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
-        
-        image_list = []
-        for page_number in range(len(pdf)):
-            page = pdf[page_number]
-            images = page.get_images(full=True)
-            for img_index, img in enumerate(images):
-                xref = img[0]
-                base_image = pdf.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                image_path = os.path.join(
-                    output_folder, f"page{page_number+1}_img{img_index+1}.{image_ext}"
-                )
-                with open(image_path, "wb") as img_file:
-                    img_file.write(image_bytes)
-                image_list.append(image_path)
-        return image_list
+        return [
+            save_image(record, output_folder)
+            for record in iter_images(pdf_path, min_width, min_height)
+        ]
     except Exception as e:
         print(f"Error extracting images from {pdf_path}: {e}")
         return []
@@ -40,9 +138,8 @@ if __name__ == "__main__":
     pdf_directory = '../data/'
     pdf_file = 'physics_notes.pdf'
     pdf_path = os.path.join(pdf_directory, pdf_file)
-    
+
     images_output_folder = '../data/extracted_images/'
     images = extract_images(pdf_path, images_output_folder)
-    
-    print(f"Extracted {len(images)} images. Saved to {images_output_folder}")
 
+    print(f"Extracted {len(images)} images. Saved to {images_output_folder}")
@@ -1,14 +1,24 @@
 # pdf_parsing/extract_text.py
+from concurrent.futures import ProcessPoolExecutor
 from pdfminer.high_level import extract_text
+from pdfminer.pdfpage import PDFPage
 import os
 
-def extract_text_from_pdf(pdf_path):
+PAGE_BREAK = '\f'  # pdfminer terminates every page with a form feed
+
+def extract_text_from_pdf(pdf_path, parallel=False, pages_per_shard=16, max_workers=None):
     """
     Extracts text from a PDF file.
-    
+
     :param pdf_path: Path to the PDF file.
+    :param parallel: If True, extract page shards in a process pool.
+    :param pages_per_shard: Number of pages handled by each worker task.
+    :param max_workers: Size of the process pool (defaults to the CPU count).
     :return: Extracted text as a string.
     """
+    if parallel:
+        text, _ = extract_text_with_pages(pdf_path, pages_per_shard, max_workers)
+        return text
     try:
         text = extract_text(pdf_path)
         return text
@@ -16,18 +26,105 @@ def extract_text_from_pdf(pdf_path):
         print(f"Error extracting text from {pdf_path}: {e}")
         return ""
 
+def count_pages(pdf_path):
+    """
+    Counts the pages of a PDF without running layout analysis.
+
+    :param pdf_path: Path to the PDF file.
+    :return: Number of pages.
+    """
+    with open(pdf_path, 'rb') as fp:
+        return sum(1 for _ in PDFPage.get_pages(fp))
+
+def _extract_shard(args):
+    """
+    Worker task: extracts a contiguous page range and splits it into pages.
+
+    :param args: Tuple of (pdf_path, first_page, last_page), 0-based, end exclusive.
+    :return: Tuple of (first_page, list of page texts).
+    """
+    pdf_path, first_page, last_page = args
+    text = extract_text(pdf_path, page_numbers=range(first_page, last_page))
+    pages = text.split(PAGE_BREAK)
+    # Each page ends with a form feed, so the split leaves a trailing remainder
+    pages = pages[:last_page - first_page]
+    pages += [''] * (last_page - first_page - len(pages))
+    return first_page, pages
+
+def extract_text_with_pages(pdf_path, pages_per_shard=16, max_workers=None):
+    """
+    Extracts text from a PDF by sharding its pages across a process pool.
+
+    Shards are merged back in page order, so the text matches a single-threaded
+    `extract_text` call on the whole file.
+
+    :param pdf_path: Path to the PDF file.
+    :param pages_per_shard: Number of pages handled by each worker task.
+    :param max_workers: Size of the process pool (defaults to the CPU count).
+    :return: Tuple of (text, page_offsets) where page_offsets is a list of
+             (page_number, start, end) character offsets, page numbers 1-based.
+    """
+    try:
+        num_pages = count_pages(pdf_path)
+        shards = [
+            (pdf_path, start, min(start + pages_per_shard, num_pages))
+            for start in range(0, num_pages, pages_per_shard)
+        ]
+        if len(shards) <= 1 or max_workers == 1:
+            results = map(_extract_shard, shards)
+            page_lists = [pages for _, pages in results]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                # map() yields in submission order, which is page order
+                page_lists = [pages for _, pages in executor.map(_extract_shard, shards)]
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        return "", []
+
+    parts = []
+    page_offsets = []
+    position = 0
+    page_number = 1
+    for pages in page_lists:
+        for page_text in pages:
+            page_text += PAGE_BREAK
+            parts.append(page_text)
+            page_offsets.append((page_number, position, position + len(page_text)))
+            position += len(page_text)
+            page_number += 1
+    return ''.join(parts), page_offsets
+
+def page_for_offset(page_offsets, offset):
+    """
+    Finds the page containing a character offset.
+
+    :param page_offsets: Output of `extract_text_with_pages`.
+    :param offset: Character offset into the extracted text.
+    :return: 1-based page number, or None if the offset is out of range.
+    """
+    lo, hi = 0, len(page_offsets)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        page_number, start, end = page_offsets[mid]
+        if offset < start:
+            hi = mid
+        elif offset >= end:
+            lo = mid + 1
+        else:
+            return page_number
+    return None
+
 if __name__ == "__main__":
     # Example usage
     pdf_directory = '../data/'  # Relative path to data directory
     pdf_file = 'physics_notes.pdf'
     pdf_path = os.path.join(pdf_directory, pdf_file)
-    
-    extracted_text = extract_text_from_pdf(pdf_path)
-    
+
+    extracted_text, page_offsets = extract_text_with_pages(pdf_path)
+
     # Save extracted text to a file
     output_path = os.path.join(pdf_directory, 'extracted_text.txt')
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(extracted_text)
-    
-    print(f"Text extraction complete. Saved to {output_path}")
 
+    print(f"Text extraction complete ({len(page_offsets)} pages). Saved to {output_path}")
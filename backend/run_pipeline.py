@@ -1,65 +1,321 @@
 # run_pipeline.py
-import subprocess
+# Ingests PDFs into PostgreSQL in a single process.
+#
+# Run from backend/ with: python -m run_pipeline [pdf ...]
+import argparse
+import itertools
 import os
+import time
 
-def run_script(script_path):
+from pdf_parsing.extract_text import extract_text_with_pages, page_for_offset
+from pdf_parsing.process_text import clean_text
+from pdf_parsing.chunk_text import iter_chunks
+from pdf_parsing.extract_images import iter_images, save_image
+from vector_db.embedding_cache import cached_encode
+from vector_db.embedding_models import DEFAULT_EMBEDDING_MODEL, warm_up
+from vector_db.manifest import IngestManifest, hash_text
+from vector_db.schema import migrate, bump_corpus_version, DEFAULT_COURSE
+from vector_db.db import get_connection, get_db_config
+from vector_db.store_embeddings import upsert_text_chunks, delete_chunks_after, register_document
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_PDFS = [os.path.join(DATA_DIR, 'physics_notes.pdf')]
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL
+MANIFEST_PATH = os.path.join(DATA_DIR, 'ingest_manifest.json')
+
+def batched(iterable, batch_size):
+    """
+    Groups an iterable into lists of at most batch_size items.
+
+    :param iterable: Any iterable.
+    :param batch_size: Maximum items per batch.
+    :return: Generator of lists.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# ===========================
+# Pipeline Stages
+# ===========================
+# Every stage is a generator that consumes the records of the previous stage,
+# so at most one document's text and one embedding batch are held at a time.
+
+def document_id_for(pdf_path):
+    """
+    Identifier of the document stored from a PDF: its file name without extension.
+    """
+    return os.path.splitext(os.path.basename(pdf_path))[0]
+
+def extract_stage(pdf_paths, courses=None):
+    """
+    Yields one record per PDF with its raw text and per-page offsets.
+
+    :param pdf_paths: Iterable of PDF paths.
+    :param courses: Dictionary of document_id -> course (see `register_documents`);
+                    missing documents get DEFAULT_COURSE.
+    """
+    for pdf_path in pdf_paths:
+        text, page_offsets = extract_text_with_pages(pdf_path)
+        print(f"Extracted {len(page_offsets)} pages from {pdf_path}")
+        document_id = document_id_for(pdf_path)
+        yield {
+            'document_id': document_id,
+            'course': (courses or {}).get(document_id, DEFAULT_COURSE),
+            'pdf_path': pdf_path,
+            'pages': [text[start:end] for _, start, end in page_offsets],
+        }
+
+def clean_stage(documents):
+    """
+    Cleans each page and joins the pages into the document text.
+
+    Cleaning page by page gives the same text as cleaning the whole document
+    (page breaks are whitespace) while keeping the page boundaries.
+
+    :param documents: Records from `extract_stage`.
     """
-    Runs a Python script using subprocess.
-    
-    :param script_path: Path to the Python script.
+    for document in documents:
+        page_offsets = []
+        parts = []
+        position = 0
+        for page_number, page_text in enumerate(document.pop('pages'), start=1):
+            cleaned = clean_text(page_text)
+            if not cleaned:
+                continue
+            if parts:
+                parts.append(' ')
+                position += 1
+            parts.append(cleaned)
+            page_offsets.append((page_number, position, position + len(cleaned)))
+            position += len(cleaned)
+        document['text'] = ''.join(parts)
+        document['page_offsets'] = page_offsets
+        yield document
+
+def chunk_stage(documents, max_tokens=500, overlap=50):
+    """
+    Splits each document into chunk records tagged with their source page.
+
+    :param documents: Records from `clean_stage`.
+    :param max_tokens: Maximum number of tokens per chunk.
+    :param overlap: Number of overlapping tokens between chunks.
+    """
+    for document in documents:
+        for chunk in iter_chunks(document['text'], max_tokens=max_tokens, overlap=overlap):
+            chunk['document_id'] = document['document_id']
+            chunk['course'] = document['course']
+            chunk['page_number'] = page_for_offset(document['page_offsets'], chunk['start'])
+            yield chunk
+
+def diff_stage(chunks, manifest):
+    """
+    Drops chunks whose content hash matches the manifest.
+
+    Holds one document's chunk texts at a time to compute its hashes.
+
+    :param chunks: Records from `chunk_stage`.
+    :param manifest: IngestManifest for this run.
+    """
+    for document_id, document_chunks in itertools.groupby(chunks, key=lambda c: c['document_id']):
+        document_chunks = list(document_chunks)
+        hashes = {chunk['chunk_number']: hash_text(chunk['content']) for chunk in document_chunks}
+        changed = manifest.changed_chunks(document_id, hashes)
+        print(f"{document_id}: {len(changed)} of {len(hashes)} chunks changed")
+        for chunk in document_chunks:
+            if chunk['chunk_number'] in changed:
+                yield chunk
+
+def embed_stage(chunks, model_name=EMBEDDING_MODEL, batch_size=64):
+    """
+    Encodes chunk records in batches with the shared embedding model.
+
+    :param chunks: Records from `chunk_stage`.
+    :param model_name: Name of the SentenceTransformer model.
+    :param batch_size: Number of chunks encoded per call.
+    """
+    for batch in batched(chunks, batch_size):
+        embeddings = cached_encode([chunk['content'] for chunk in batch], model_name=model_name,
+                                   batch_size=batch_size)
+        for chunk, embedding in zip(batch, embeddings):
+            chunk['embedding'] = embedding
+            yield chunk
+
+def store_stage(records, db_config, batch_size=500):
+    """
+    Upserts embedded chunk records into 'text_chunks' over one connection.
+
+    :param records: Records from `embed_stage`.
+    :param db_config: Database connection parameters.
+    :param batch_size: Number of rows per COPY and commit.
+    :return: Number of rows stored.
     """
-    try:
-        subprocess.run(['python', script_path], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running {script_path}: {e}")
+    stored = 0
+    start = time.monotonic()
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            for batch in batched(records, batch_size):
+                rows = [
+                    (record['document_id'], record['chunk_number'], record['page_number'],
+                     record['content'], record['embedding'], record['course'])
+                    for record in batch
+                ]
+                upsert_text_chunks(cursor, rows)
+                conn.commit()
+                stored += len(rows)
+    elapsed = time.monotonic() - start
+    print(f"Stored {stored} chunks ({stored / max(elapsed, 1e-9):.0f} rows/sec)")
+    return stored
+
+# ===========================
+# Runner
+# ===========================
+
+def skip_empty_documents(manifest):
+    """
+    Unstages documents that produced no chunks, so they are neither pruned
+    nor recorded in the manifest.
+
+    :param manifest: IngestManifest holding the staged documents.
+    :return: Set of skipped document ids.
+    """
+    empty = {document_id for document_id, num_chunks in manifest.pending_chunk_counts().items()
+             if num_chunks == 0}
+    for document_id in sorted(empty):
+        print(f"{document_id}: no text extracted; keeping its stored chunks and retrying next run")
+        manifest.discard(document_id)
+    return empty
+
+def prune_removed_chunks(manifest, db_config):
+    """
+    Deletes chunks that no longer exist in the re-processed documents.
+
+    :param manifest: IngestManifest holding the staged documents.
+    :param db_config: Database connection parameters.
+    """
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            for document_id, num_chunks in manifest.pending_chunk_counts().items():
+                deleted = delete_chunks_after(cursor, document_id, num_chunks)
+                if deleted:
+                    print(f"{document_id}: removed {deleted} stale chunks")
+
+def register_documents(pdf_paths, db_config, course=None):
+    """
+    Records every PDF's document, relabelling documents moved by an explicit course.
+
+    :param course: Course of every PDF, or None to keep each document's recorded course.
+    :return: Tuple of (dictionary of document_id -> course, True if any stored rows changed course).
+    """
+    courses = {}
+    relabelled = False
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            for pdf_path in pdf_paths:
+                document_id = document_id_for(pdf_path)
+                courses[document_id], moved = register_document(cursor, document_id, course, pdf_path)
+                relabelled |= moved
+    return courses, relabelled
+
+def run_text_pipeline(pdf_paths, db_config, manifest, max_tokens=500, overlap=50, batch_size=64,
+                      course=None):
+    """
+    Runs extract -> clean -> chunk -> diff -> embed -> store for the given PDFs.
+
+    PDFs and chunks whose hashes match the manifest are skipped; the manifest
+    is only written once the database is up to date. A changed PDF that yields
+    no chunks (e.g. extraction failed) keeps its stored chunks and is retried
+    on the next run.
+
+    :param course: Course of every PDF, or None to keep each document's recorded course.
+    :return: Tuple of (number of chunks stored, list of changed PDF paths that were ingested).
+    """
+    courses, relabelled = register_documents(pdf_paths, db_config, course)
+    changed_paths = [
+        pdf_path for pdf_path in pdf_paths
+        if manifest.document_changed(document_id_for(pdf_path), pdf_path)
+    ]
+    print(f"{len(changed_paths)} of {len(pdf_paths)} documents changed")
+
+    documents = clean_stage(extract_stage(changed_paths, courses))
+    chunks = diff_stage(chunk_stage(documents, max_tokens=max_tokens, overlap=overlap), manifest)
+    embedded = embed_stage(chunks, batch_size=batch_size)
+    stored = store_stage(embedded, db_config)
+    failed = skip_empty_documents(manifest)
+    changed_paths = [pdf_path for pdf_path in changed_paths if document_id_for(pdf_path) not in failed]
+    prune_removed_chunks(manifest, db_config)
+    if changed_paths or relabelled:
+        bump_corpus_version(db_config)
+    manifest.commit()
+    return stored, changed_paths
+
+def run_image_pipeline(pdf_paths, db_config, image_folder=None, course=None):
+    """
+    Extracts, captions and stores the images of the given PDFs.
+
+    Image records are handed to the captioner in memory; they are only
+    written to disk when image_folder is given. Each PDF is stored under its
+    own document_id.
+
+    :param course: Course of every PDF, or None to keep each document's recorded course.
+    """
+    from image_processing.generate_image_captions import generate_captions, store_image_captions
+
+    courses, _ = register_documents(pdf_paths, db_config, course)
+
+    def records(pdf_path):
+        for record in iter_images(pdf_path):
+            if image_folder:
+                save_image(record, image_folder)
+            yield record
+
+    if image_folder and not os.path.exists(image_folder):
+        os.makedirs(image_folder)
+    for pdf_path in pdf_paths:
+        captions = generate_captions(records=records(pdf_path))
+        document_id = document_id_for(pdf_path)
+        store_image_captions(captions, document_id, courses[document_id], db_config,
+                             model_name=EMBEDDING_MODEL, image_folder=image_folder)
 
 def main():
-    # Define script paths
-    pdf_parsing_dir = 'pdf_parsing'
-    vector_db_dir = 'vector_db'
-    image_processing_dir = 'image_processing'
-    scripts_dir = 'scripts'
-
-    # Step 1: Extract text
-    print("Extracting text from PDF...")
-    extract_text_script = os.path.join(pdf_parsing_dir, 'extract_text.py')
-    run_script(extract_text_script)
-
-    # Step 2: Extract images
-    print("Extracting images from PDF...")
-    extract_images_script = os.path.join(pdf_parsing_dir, 'extract_images.py')
-    run_script(extract_images_script)
-
-    # Step 3: Process text
-    print("Processing extracted text...")
-    process_text_script = os.path.join(pdf_parsing_dir, 'process_text.py')
-    run_script(process_text_script)
-
-    # Step 4: Chunk text
-    print("Chunking processed text...")
-    chunk_text_script = os.path.join(pdf_parsing_dir, 'chunk_text.py')
-    run_script(chunk_text_script)
-
-    # Step 5: Generate and store text embeddings
-    print("Generating and storing text embeddings...")
-    store_embeddings_script = os.path.join(vector_db_dir, 'store_embeddings.py')
-    run_script(store_embeddings_script)
-
-    # Step 6: Generate and store image captions
-    print("Generating and storing image captions...")
-    generate_image_captions_script = os.path.join(image_processing_dir, 'generate_image_captions.py')
-    run_script(generate_image_captions_script)
-
-    # Optional: Generate and store image embeddings separately
-    # print("Generating and storing image embeddings...")
-    # generate_image_embeddings_script = os.path.join(image_processing_dir, 'generate_image_embeddings.py')
-    # run_script(generate_image_embeddings_script)
-
-    # Step 7: Retrieve (for testing)
-    print("Retrieving relevant text chunks...")
-    retrieve_script = os.path.join(vector_db_dir, 'retrieve.py')
-    run_script(retrieve_script)
+    parser = argparse.ArgumentParser(description="Run the ingestion pipeline in a single process.")
+    parser.add_argument('pdfs', nargs='*', default=DEFAULT_PDFS, help="PDF files to ingest.")
+    parser.add_argument('--image-folder', default=None,
+                        help="Also save extracted images to this folder.")
+    parser.add_argument('--skip-images', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--manifest', default=MANIFEST_PATH)
+    parser.add_argument('--full', action='store_true', help="Ignore the manifest and rebuild everything.")
+    parser.add_argument('--course', default=None,
+                        help="Course the PDFs belong to; without it, each document keeps its "
+                             "recorded course and new documents get the default course.")
+    args = parser.parse_args()
+
+    # Load the embedding model once for every stage
+    warm_up([EMBEDDING_MODEL])
+    db_config = get_db_config()
+    migrate(db_config)
+    manifest = IngestManifest(args.manifest, config={
+        'max_tokens': 500, 'overlap': 50, 'embedding_model': EMBEDDING_MODEL,
+    })
+    if args.full:
+        manifest.documents = {}
+
+    start = time.time()
+    print("Extracting, chunking and embedding text...")
+    stored, changed_paths = run_text_pipeline(args.pdfs, db_config, manifest,
+                                              batch_size=args.batch_size, course=args.course)
+    print(f"Stored {stored} text chunks in {time.time() - start:.1f}s")
+
+    if not args.skip_images and changed_paths:
+        print("Extracting and captioning images...")
+        run_image_pipeline(changed_paths, db_config, image_folder=args.image_folder,
+                           course=args.course)
+
+    print(f"Pipeline finished in {time.time() - start:.1f}s")
 
 if __name__ == "__main__":
     main()
-
@@ -1,10 +1,13 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from vllm import LLM, SamplingParams
+from vllm import LLM
 from transformers import AutoTokenizer
 import torch
+import asyncio
 import os
 
+from batching import BatchScheduler, VLLMEngine
+
 app = FastAPI()
 
 # Model and tokenizer setup
@@ -13,6 +16,7 @@ model_name = "akjindal53244/Llama-3.1-Storm-8B"
 # Configure to use only one GPU
 llm = None
 tokenizer = None
+scheduler = None
 
 class GenerateRequest(BaseModel):
     prompt: str
@@ -44,28 +48,39 @@ def load_model():
     except Exception as e:
         print(f"Failed to load the model: {e}")
 
+@app.on_event("startup")
+async def start_scheduler():
+    global scheduler
+    # Concurrent requests are batched into one llm.generate call (BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+    if llm:
+        scheduler = BatchScheduler(VLLMEngine(llm))
+        scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    if scheduler:
+        await scheduler.stop()
+
 @app.post("/generate")
 async def generate_text(request: GenerateRequest):
     global llm, tokenizer
 
-    if not llm or not tokenizer:
+    if not llm or not tokenizer or not scheduler:
         raise HTTPException(status_code=500, detail="Model is not loaded.")
 
     try:
-        # Prepare the sampling parameters
-        sampling_params = SamplingParams(
+        # Generation runs off the event loop, batched with other waiting requests
+        generated_text = await scheduler.submit(
+            request.prompt,
             max_tokens=request.max_tokens,
             temperature=0.7,
             top_p=0.9
         )
 
-        # Generate the response
-        outputs = llm.generate([request.prompt], sampling_params)
-
-        # Extract the generated text
-        generated_text = outputs[0].outputs[0].text.strip()
-
         return {"generated_text": generated_text}
+    except asyncio.QueueFull:
+        # Shed load rather than queueing without bound (BATCH_MAX_QUEUE)
+        raise HTTPException(status_code=503, detail="Server is busy, please retry.")
     except Exception as e:
         print(f"Error during generation: {e}")
         raise HTTPException(status_code=500, detail="Error during text generation.")
@@ -0,0 +1,196 @@
+# serving.py
+# Shared pieces of the HTTP gateways: the Flask app (app.py) and the async
+# gateway (gateway.py).
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# vLLM server configuration
+VLLM_SERVER_URL = os.getenv('VLLM_SERVER_URL', "http://localhost:8000/v1/completions")  # Adjust if vllm is running on a different host/port
+API_KEY = os.getenv('VLLM_API_KEY', "token-what-a-day")  # Ensure this matches your vllm server's API key
+
+# Upstream timeouts in seconds; the read timeout applies between streamed chunks
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '5'))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '120'))
+
+# RAG configuration
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '5'))
+RAG_MAX_TOP_K = 50
+RAG_MAX_CONTEXT_CHARS = int(os.getenv('RAG_MAX_CONTEXT_CHARS', '6000'))
+# Threads running retrieval; each keeps a pooled database connection open
+RAG_RETRIEVAL_WORKERS = int(os.getenv('RAG_RETRIEVAL_WORKERS', '8'))
+RAG_PROMPT_TEMPLATE = (
+    "Answer the question using only the context below. "
+    "If the context does not contain the answer, say so.\n\n"
+    "Context:\n{context}\n\nQuestion: {question}\nAnswer:"
+)
+
+def vllm_headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {API_KEY}"
+    }
+
+def completion_text(body):
+    """
+    Extracts the generated text from an OpenAI-style /v1/completions response
+    or from one of its streamed chunks.
+    """
+    choices = body.get("choices") or []
+    return choices[0].get("text", "") if choices else ""
+
+def parse_stream_line(line):
+    """
+    Parses one line of a streamed /v1/completions response.
+
+    :param line: Line as bytes or str, without the trailing newline.
+    :return: The chunk's text ('' for lines without text), or None at 'data: [DONE]'.
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if not line.startswith("data:"):
+        return ""
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    return completion_text(json.loads(data))
+
+def sse_event(data, event=None):
+    """
+    Formats one Server-Sent Event with a JSON payload.
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def warm_up_retrieval():
+    """
+    Loads the embedding model and opens pooled database connections before
+    the first request, so no request pays for model loading or connecting.
+    """
+    from vector_db.embedding_models import warm_up
+    from vector_db.db import health_check, reserve_connections
+    from vector_db.retrieve import VECTOR_BACKEND
+
+    start = time.perf_counter()
+    try:
+        warm_up()
+        if VECTOR_BACKEND == 'local':
+            from vector_db.local_index import get_local_index
+            get_local_index()
+        else:
+            reserve_connections(RAG_RETRIEVAL_WORKERS)
+            health_check()
+        logger.info(f"Retrieval warmed up in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        logger.error(f"Error warming up retrieval: {e}")
+
+def retrieve_context(query, k, filters):
+    """
+    Worker task: embeds the query and retrieves its top-k chunks.
+
+    :return: Tuple of (results, timings in ms).
+    """
+    from vector_db.embedding_cache import encode_query
+    from vector_db.query_cache import get_top_k_embeddings_cached
+
+    start = time.perf_counter()
+    # Encoded once here; retrieval searches with this vector instead of encoding again
+    query_embedding = encode_query(query)
+    embedded = time.perf_counter()
+    results = get_top_k_embeddings_cached(query, k=k, query_embedding=query_embedding,
+                                          filters=filters or None)
+    retrieved = time.perf_counter()
+    return results, {
+        'embed': (embedded - start) * 1000.0,
+        'retrieve': (retrieved - embedded) * 1000.0,
+    }
+
+def assemble_prompt(question, results, max_chars=RAG_MAX_CONTEXT_CHARS):
+    """
+    Builds the prompt from the retrieved chunks, nearest first, within max_chars of context.
+
+    :return: Tuple of (prompt, list of chunks used).
+    """
+    used, parts, length = [], [], 0
+    for chunk_id, content, distance in results:
+        if length + len(content) > max_chars and parts:
+            break
+        content = content[:max_chars - length]
+        parts.append(f"[{len(parts) + 1}] {content}")
+        length += len(content)
+        used.append((chunk_id, content, distance))
+    return RAG_PROMPT_TEMPLATE.format(context="\n\n".join(parts), question=question), used
+
+def parse_rag_request(data):
+    """
+    Validates the query and retrieval fields of a /api/rag payload.
+
+    :return: Tuple of (query, k, filters, error message or None).
+    """
+    query = data.get("query", "")
+    if not isinstance(query, str) or not query.strip():
+        return None, None, None, "No query provided."
+    try:
+        k = min(max(int(data.get("k", RAG_TOP_K)), 1), RAG_MAX_TOP_K)
+    except (TypeError, ValueError):
+        return None, None, None, "'k' must be an integer."
+    filters = {}
+    for key in ("course", "document_id"):
+        value = data.get(key)
+        if value is None:
+            continue
+        if not (isinstance(value, str)
+                or isinstance(value, list) and all(isinstance(item, str) for item in value)):
+            return None, None, None, f"'{key}' must be a string or a list of strings."
+        if value:
+            filters[key] = value
+    return query, k, filters, None
+
+def parse_max_tokens(data, default=1000):
+    """
+    :return: Tuple of (max_tokens, error message or None).
+    """
+    try:
+        max_tokens = int(data.get("max_tokens", default))
+    except (TypeError, ValueError):
+        return None, "'max_tokens' must be a positive integer."
+    if max_tokens <= 0:
+        return None, "'max_tokens' must be a positive integer."
+    return max_tokens, None
+
+def parse_stream(data):
+    """
+    :return: Tuple of (whether to stream, error message or None); only a JSON
+             boolean is accepted, so a string such as "false" is rejected.
+    """
+    stream = data.get("stream", False)
+    if stream is None:
+        return False, None
+    if not isinstance(stream, bool):
+        return None, "'stream' must be true or false."
+    return stream, None
+
+def parse_sampling(data):
+    """
+    Validates the optional sampling fields of a /api/generate payload.
+
+    :return: Tuple of (dict of the given 'temperature', 'top_p' and 'seed', error message or None).
+    """
+    sampling = {}
+    try:
+        if data.get("temperature") is not None:
+            sampling["temperature"] = float(data["temperature"])
+            if sampling["temperature"] < 0:
+                raise ValueError
+        if data.get("top_p") is not None:
+            sampling["top_p"] = float(data["top_p"])
+            if not 0 < sampling["top_p"] <= 1:
+                raise ValueError
+        if data.get("seed") is not None:
+            sampling["seed"] = int(data["seed"])
+    except (TypeError, ValueError):
+        return None, "'temperature' must be >= 0, 'top_p' in (0, 1] and 'seed' an integer."
+    return sampling, None
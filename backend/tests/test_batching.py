@@ -0,0 +1,127 @@
+# tests/test_batching.py
+# BatchScheduler driven by the CPU FakeEngine.
+import asyncio
+import threading
+import time
+
+import pytest
+
+from batching import BatchScheduler, FakeEngine, GenerationEngine
+
+class FailingEngine(FakeEngine):
+    def generate(self, prompts, params):
+        self.batch_sizes.append(len(prompts))
+        raise RuntimeError("engine failed")
+
+class BlockingEngine(FakeEngine):
+    """
+    Holds every batch until released, so requests pile up in the queue.
+    """
+
+    def __init__(self):
+        super().__init__(batch_overhead_ms=0, token_ms=0)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.prompts = []
+
+    def generate(self, prompts, params):
+        self.prompts.extend(prompts)
+        self.started.set()
+        self.release.wait(5)
+        return super().generate(prompts, params)
+
+def run(scenario, engine, **kwargs):
+    async def main():
+        scheduler = BatchScheduler(engine, **kwargs)
+        scheduler.start()
+        try:
+            return await scenario(scheduler)
+        finally:
+            await scheduler.stop()
+    return asyncio.run(main())
+
+async def wait_for(event):
+    await asyncio.get_running_loop().run_in_executor(None, event.wait, 5)
+
+def test_batches_are_capped_and_results_go_to_their_callers():
+    engine = FakeEngine(batch_overhead_ms=5, token_ms=0)
+
+    async def scenario(scheduler):
+        return await asyncio.gather(*[scheduler.submit(f"prompt {i}") for i in range(10)])
+
+    results = run(scenario, engine, max_batch_size=4, max_wait_ms=50)
+
+    assert results == [f"echo: prompt {i}" for i in range(10)]
+    assert max(engine.batch_sizes) == 4
+    assert sum(engine.batch_sizes) == 10
+
+def test_lone_request_is_flushed_after_max_wait():
+    engine = FakeEngine(batch_overhead_ms=0, token_ms=0)
+
+    async def scenario(scheduler):
+        start = time.perf_counter()
+        result = await scheduler.submit("alone")
+        return result, time.perf_counter() - start
+
+    result, elapsed = run(scenario, engine, max_batch_size=16, max_wait_ms=50)
+
+    assert result == "echo: alone"
+    assert engine.batch_sizes == [1]
+    assert 0.04 <= elapsed < 1.0
+
+def test_engine_error_reaches_every_caller_in_the_batch():
+    engine = FailingEngine()
+
+    async def scenario(scheduler):
+        return await asyncio.gather(*[scheduler.submit(f"prompt {i}") for i in range(3)],
+                                    return_exceptions=True)
+
+    results = run(scenario, engine, max_batch_size=8, max_wait_ms=20)
+
+    assert engine.batch_sizes == [3]
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_cancelled_callers_are_not_generated_for():
+    engine = BlockingEngine()
+
+    async def scenario(scheduler):
+        first = asyncio.ensure_future(scheduler.submit("first"))
+        await wait_for(engine.started)
+        gone = asyncio.ensure_future(scheduler.submit("gone"))
+        kept = asyncio.ensure_future(scheduler.submit("kept"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        engine.release.set()
+        return await first, await kept, scheduler.stats
+
+    first, kept, stats = run(scenario, engine, max_batch_size=8, max_wait_ms=0)
+
+    assert (first, kept) == ("echo: first", "echo: kept")
+    assert engine.prompts == ["first", "kept"]
+    assert stats['cancelled'] == 1
+
+def test_full_queue_rejects_new_requests():
+    engine = BlockingEngine()
+
+    async def scenario(scheduler):
+        first = asyncio.ensure_future(scheduler.submit("first"))
+        await wait_for(engine.started)
+        queued = asyncio.ensure_future(scheduler.submit("queued"))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.QueueFull):
+            await scheduler.submit("rejected")
+        engine.release.set()
+        return await first, await queued, scheduler.stats
+
+    first, queued, stats = run(scenario, engine, max_batch_size=8, max_wait_ms=0, max_queue=1)
+
+    assert (first, queued) == ("echo: first", "echo: queued")
+    assert stats['requests'] == 3
+    assert stats['rejected'] == 1
+
+def test_engine_without_generate_cannot_be_created():
+    class Incomplete(GenerationEngine):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
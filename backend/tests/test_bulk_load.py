@@ -0,0 +1,100 @@
+# tests/test_bulk_load.py
+# The binary COPY stream, checked byte by byte against PostgreSQL's format.
+import io
+import struct
+
+import pytest
+
+for module in ('numpy', 'psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+import numpy as np
+
+from vector_db.bulk_load import encode_copy_rows, _IterStream, TEXT_CHUNK_TYPES
+
+def decode_copy_stream(data, column_types):
+    """
+    Reference decoder for PostgreSQL's binary COPY format, written from the spec.
+    """
+    assert data[:11] == b'PGCOPY\n\xff\r\n\x00'
+    flags, extension_length = struct.unpack_from('>ii', data, 11)
+    assert (flags, extension_length) == (0, 0)
+    offset = 19
+    rows = []
+    while True:
+        (field_count,) = struct.unpack_from('>h', data, offset)
+        offset += 2
+        if field_count == -1:
+            assert offset == len(data)
+            return rows
+        assert field_count == len(column_types)
+        row = []
+        for column_type in column_types:
+            (length,) = struct.unpack_from('>i', data, offset)
+            offset += 4
+            if length == -1:
+                row.append(None)
+                continue
+            field = data[offset:offset + length]
+            offset += length
+            if column_type == 'text':
+                row.append(field.decode('utf-8'))
+            elif column_type == 'int4':
+                row.append(struct.unpack('>i', field)[0])
+            elif column_type == 'int8':
+                row.append(struct.unpack('>q', field)[0])
+            elif column_type == 'vector':
+                dim, unused = struct.unpack_from('>hh', field)
+                assert unused == 0
+                assert length == 4 + 4 * dim
+                row.append(list(struct.unpack_from(f'>{dim}f', field, 4)))
+        rows.append(row)
+
+def test_known_good_bytes():
+    data = b''.join(encode_copy_rows([('a', 7, None, np.array([1.0, -2.0], dtype=np.float32))],
+                                     ('text', 'int4', 'int8', 'vector')))
+
+    assert data == (
+        b'PGCOPY\n\xff\r\n\x00' b'\x00\x00\x00\x00' b'\x00\x00\x00\x00'
+        b'\x00\x04'
+        b'\x00\x00\x00\x01' b'a'
+        b'\x00\x00\x00\x04' b'\x00\x00\x00\x07'
+        b'\xff\xff\xff\xff'
+        b'\x00\x00\x00\x0c' b'\x00\x02\x00\x00' b'\x3f\x80\x00\x00' b'\xc0\x00\x00\x00'
+        b'\xff\xff'
+    )
+
+def test_text_chunk_rows_round_trip():
+    rng = np.random.default_rng(0)
+    rows = [
+        ('notes', 1, 3, 'Newton’s second law', rng.random(384, dtype=np.float32), 'PHYS101'),
+        ('notes', 2, None, '', rng.random(384, dtype=np.float32), 'PHYS101'),
+        ('lab', 2 ** 31 - 1, -1, 'x' * 70000, None, 'default'),
+    ]
+
+    decoded = decode_copy_stream(b''.join(encode_copy_rows(rows, TEXT_CHUNK_TYPES)), TEXT_CHUNK_TYPES)
+
+    assert len(decoded) == len(rows)
+    for row, decoded_row in zip(rows, decoded):
+        assert decoded_row[:4] == list(row[:4])
+        assert decoded_row[5] == row[5]
+        if row[4] is None:
+            assert decoded_row[4] is None
+        else:
+            np.testing.assert_array_equal(np.array(decoded_row[4], dtype=np.float32), row[4])
+
+def test_int8_and_unknown_types():
+    data = b''.join(encode_copy_rows([(2 ** 40,)], ('int8',)))
+    assert decode_copy_stream(data, ('int8',)) == [[2 ** 40]]
+
+    with pytest.raises(ValueError):
+        b''.join(encode_copy_rows([(1.0,)], ('numeric',)))
+
+def test_stream_reads_match_the_encoded_rows():
+    rows = [('doc', i, None, f'chunk {i}', np.full(4, i, dtype=np.float32), 'c') for i in range(100)]
+    expected = b''.join(encode_copy_rows(rows, TEXT_CHUNK_TYPES))
+
+    stream = io.BufferedReader(_IterStream(encode_copy_rows(rows, TEXT_CHUNK_TYPES)), buffer_size=7)
+    chunks = iter(lambda: stream.read(13), b'')
+
+    assert b''.join(chunks) == expected
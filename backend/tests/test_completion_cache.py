@@ -0,0 +1,214 @@
+# tests/test_completion_cache.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+import completion_cache
+from completion_cache import CompletionCache, completion_key
+
+ERROR = ("vLLM server error.", 500)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(completion_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_least_recently_used_entries_are_evicted_by_size():
+    cache = CompletionCache(max_bytes=10)
+    cache.put('a', 'aaaa')
+    cache.put('b', 'bbbb')
+    assert cache.get('a') == 'aaaa'
+
+    cache.put('c', 'cccc')
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('aaaa', 'cccc')
+    assert cache.bytes == 8
+    assert cache.stats['evictions'] == 1
+
+def test_size_is_counted_in_utf8_bytes():
+    cache = CompletionCache(max_bytes=6)
+    cache.put('a', 'ééé')  # 6 bytes in 3 characters
+    cache.put('b', 'x')
+
+    assert cache.get('a') is None
+    assert cache.bytes == 1
+    cache.put('c', 'x' * 7)
+    assert cache.get('c') is None
+
+def test_replacing_an_entry_keeps_the_byte_count():
+    cache = CompletionCache(max_bytes=10)
+    cache.put('a', 'aaaa')
+    cache.put('a', 'aa')
+
+    assert cache.bytes == 2
+    assert len(cache.entries) == 1
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = CompletionCache(ttl=60)
+    cache.put('a', 'Paris')
+
+    clock[0] += 59
+    assert cache.get('a') == 'Paris'
+    clock[0] += 2
+    assert cache.get('a') is None
+    assert cache.bytes == 0
+
+def test_keys_ignore_stream_and_whitespace_but_not_sampling():
+    payload = {'prompt': 'What is  the\ncapital?', 'max_tokens': 16, 'temperature': 0}
+
+    assert completion_key(payload) == completion_key(dict(payload, prompt='What is the capital?', stream=True))
+    assert completion_key(payload) != completion_key(dict(payload, max_tokens=32))
+    cache = CompletionCache()
+    assert cache.key_for(dict(payload, temperature=0.7)) is None
+    assert cache.key_for(dict(payload, temperature=0.7, seed=1)) is not None
+    assert cache.stats['uncacheable'] == 1
+
+def test_concurrent_threads_share_one_generation():
+    cache = CompletionCache()
+    calls, release = [], threading.Event()
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return 'Paris', None
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_generate('k', generate)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [('Paris', None)] * 8
+    assert len(calls) == 1
+    assert cache.stats['misses'] == 1
+    assert cache.stats['hits'] + cache.stats['coalesced'] == 7
+    assert cache.get_or_generate('k', generate) == ('Paris', None)
+    assert len(calls) == 1
+
+def test_threaded_errors_reach_waiters_and_are_not_cached():
+    cache = CompletionCache()
+    calls, release = [], threading.Event()
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return None, ERROR
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_generate('k', generate)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [(None, ERROR)] * 4
+    assert len(calls) == 1
+    assert cache.get('k') is None
+    cache.get_or_generate('k', generate)
+    assert len(calls) == 2
+
+def test_threaded_exception_raises_in_the_generating_caller_and_fails_the_waiters():
+    cache = CompletionCache()
+    started, release = threading.Event(), threading.Event()
+
+    def generate():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    errors, results = [], []
+
+    def leader():
+        try:
+            cache.get_or_generate('k', generate)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_generate('k', generate)))
+    waiter.start()
+    time.sleep(0.1)
+    release.set()
+    leader_thread.join(5)
+    waiter.join(5)
+
+    assert len(errors) == 1
+    assert results == [(None, ("Error generating response.", 500))]
+    assert cache.pending == {}
+
+def test_concurrent_coroutines_share_one_generation():
+    cache = CompletionCache()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'Paris', None
+
+    async def main():
+        results = await asyncio.gather(*[cache.aget_or_generate('k', generate) for _ in range(10)])
+        return results, await cache.aget_or_generate('k', generate)
+
+    results, again = asyncio.run(main())
+
+    assert results == [('Paris', None)] * 10
+    assert again == ('Paris', None)
+    assert len(calls) == 1
+    metrics = cache.metrics()
+    assert (metrics['misses'], metrics['coalesced'], metrics['hits']) == (1, 9, 1)
+    assert metrics['hit_rate'] == pytest.approx(10 / 11)
+    assert metrics['bytes_saved'] == 10 * len('Paris')
+
+def test_async_errors_and_exceptions_reach_every_waiter():
+    cache = CompletionCache()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        return None, ERROR
+
+    async def raising():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        errors = await asyncio.gather(*[cache.aget_or_generate('a', failing) for _ in range(3)])
+        raised = await asyncio.gather(*[cache.aget_or_generate('b', raising) for _ in range(3)],
+                                      return_exceptions=True)
+        return errors, raised
+
+    errors, raised = asyncio.run(main())
+
+    assert errors == [(None, ERROR)] * 3
+    assert all(isinstance(result, RuntimeError) for result in raised)
+    assert cache.get('a') is None and cache.get('b') is None
+    assert cache.pending == {}
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_generation():
+    cache = CompletionCache()
+
+    async def generate():
+        await asyncio.sleep(0.05)
+        return 'Paris', None
+
+    async def main():
+        first = asyncio.ensure_future(cache.aget_or_generate('k', generate))
+        second = asyncio.ensure_future(cache.aget_or_generate('k', generate))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == ('Paris', None)
+    assert cache.get('k') == 'Paris'
@@ -0,0 +1,88 @@
+# tests/test_db.py
+# Pool and prepared-statement bookkeeping, with psycopg2.connect replaced by a fake.
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+for module in ('psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+from vector_db import db
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.executed = []
+        self.info = type('Info', (), {'transaction_status': extensions.TRANSACTION_STATUS_IDLE})()
+
+    @contextmanager
+    def cursor(self):
+        yield FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, params=None):
+        self.connection.executed.append(query)
+
+@pytest.fixture(autouse=True)
+def fake_connect(monkeypatch):
+    monkeypatch.setattr(psycopg2, 'connect', lambda *args, **kwargs: FakeConnection())
+
+def test_getconn_waits_for_a_returned_connection():
+    connection_pool = db.BlockingConnectionPool(1, 1, timeout=5)
+    conn = connection_pool.getconn()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(connection_pool.getconn()))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+
+    connection_pool.putconn(conn)
+    waiter.join(5)
+    assert borrowed == [conn]
+
+def test_getconn_gives_up_after_the_timeout():
+    connection_pool = db.BlockingConnectionPool(1, 1, timeout=0.05)
+    connection_pool.getconn()
+    with pytest.raises(pool.PoolError):
+        connection_pool.getconn()
+
+def test_replacement_connection_prepares_statements_again():
+    connection_pool = db.BlockingConnectionPool(1, 1, timeout=5)
+    first = connection_pool.getconn()
+    with first.cursor() as cursor:
+        db.execute_prepared(cursor, 'top_k', '(int) AS SELECT $1', (1,))
+        db.execute_prepared(cursor, 'top_k', '(int) AS SELECT $1', (2,))
+    assert sum(query.startswith('PREPARE') for query in first.executed) == 1
+    db._discard(connection_pool, first)
+
+    second = connection_pool.getconn()
+    with second.cursor() as cursor:
+        db.execute_prepared(cursor, 'top_k', '(int) AS SELECT $1', (3,))
+    assert second.executed[0] == 'PREPARE top_k (int) AS SELECT $1'
+
+def test_reserve_opens_connections_and_keeps_them_when_returned():
+    connection_pool = db.BlockingConnectionPool(1, 4, timeout=5)
+    connection_pool.reserve(8)
+    assert connection_pool.minconn == 4
+    assert len(connection_pool._pool) == 4
+
+    borrowed = [connection_pool.getconn() for _ in range(4)]
+    for conn in borrowed:
+        connection_pool.putconn(conn)
+    assert not any(conn.closed for conn in borrowed)
@@ -0,0 +1,90 @@
+# tests/test_embedding_cache.py
+# Two EmbeddingCache instances on one directory stand in for two processes.
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vector_db import embedding_cache
+from vector_db.embedding_cache import EmbeddingCache
+
+DIM = 4
+
+def fake_encode(texts, model_name=None, batch_size=64):
+    """
+    Deterministic stand-in for the model: the vector depends only on the text.
+    """
+    return np.stack([
+        np.random.default_rng(sum(text.encode('utf-8'))).random(DIM, dtype=np.float32)
+        for text in texts
+    ])
+
+@pytest.fixture(autouse=True)
+def no_model(monkeypatch):
+    calls = []
+
+    def encode(texts, model_name=None, batch_size=64):
+        calls.append(list(texts))
+        return fake_encode(texts)
+
+    monkeypatch.setattr(embedding_cache, 'encode', encode)
+    return calls
+
+def make_cache(tmp_path):
+    return EmbeddingCache('model', 'rev', cache_dir=str(tmp_path), lru_size=2)
+
+def test_vectors_survive_a_restart(tmp_path, no_model):
+    make_cache(tmp_path).encode(['alpha', 'beta'])
+    cache = make_cache(tmp_path)
+
+    np.testing.assert_array_equal(cache.encode(['beta', 'alpha']), fake_encode(['beta', 'alpha']))
+    assert len(no_model) == 1
+
+def test_interleaved_writers_keep_rows_aligned(tmp_path, no_model):
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first.encode(['alpha'])
+    # The second writer has not seen 'alpha'; its rows must still follow the file
+    second.encode(['beta', 'gamma'])
+    first.encode(['delta'])
+
+    fresh = make_cache(tmp_path)
+    texts = ['alpha', 'beta', 'gamma', 'delta']
+    np.testing.assert_array_equal(fresh.encode(texts), fake_encode(texts))
+    assert fresh.num_rows == 4
+    assert len(no_model) == 3
+
+def test_rows_written_by_another_process_are_found(tmp_path, no_model):
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first.encode(['alpha'])
+    second.encode(['beta'])
+
+    np.testing.assert_array_equal(first.encode('beta'), fake_encode(['beta'])[0])
+    assert len(no_model) == 2
+
+def test_query_encodes_stay_in_memory(tmp_path, no_model):
+    cache = make_cache(tmp_path)
+    cache.encode(['alpha'])
+    size = os.path.getsize(cache.keys_path)
+
+    embedding_cache._caches[('model', 'rev')] = cache
+    try:
+        vector = embedding_cache.encode_query('what is alpha?', model_name='model', revision='rev')
+        again = embedding_cache.encode_query('what is alpha?', model_name='model', revision='rev')
+    finally:
+        embedding_cache._caches.pop(('model', 'rev'))
+
+    np.testing.assert_array_equal(vector, again)
+    assert os.path.getsize(cache.keys_path) == size
+    assert len(no_model) == 2
+
+def test_torn_append_is_truncated(tmp_path, no_model):
+    cache = make_cache(tmp_path)
+    cache.encode(['alpha', 'beta'])
+    with open(cache.vectors_path, 'ab') as f:
+        f.write(b'\0' * 7)
+
+    cache = make_cache(tmp_path)
+    cache.encode(['gamma'])
+    np.testing.assert_array_equal(make_cache(tmp_path).encode(['alpha', 'beta', 'gamma']),
+                                  fake_encode(['alpha', 'beta', 'gamma']))
@@ -0,0 +1,164 @@
+# tests/test_gateway.py
+# gateway.py driven through FastAPI's TestClient, with the upstream replaced by
+# fake_vllm_server.app or an httpx mock transport.
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+
+for module in ('fastapi', 'httpx'):
+    pytest.importorskip(module)
+
+import httpx
+from fastapi.testclient import TestClient
+
+import fake_vllm_server
+import gateway
+from completion_cache import CompletionCache
+from serving import sse_event
+
+@pytest.fixture(autouse=True)
+def isolated_gateway(monkeypatch):
+    monkeypatch.setattr(gateway, 'warm_up_retrieval', lambda: None)
+    monkeypatch.setattr(gateway, 'completion_cache', CompletionCache())
+    # stop_gateway shuts the executor down, so every app run needs its own
+    monkeypatch.setattr(gateway, 'retrieval_executor', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(gateway, 'client', None)
+    monkeypatch.setattr(gateway, 'in_flight', None)
+    monkeypatch.setattr(fake_vllm_server, 'FIRST_TOKEN_DELAY_MS', 0)
+    monkeypatch.setattr(fake_vllm_server, 'TOKEN_DELAY_MS', 0)
+    monkeypatch.setattr(fake_vllm_server, 'stats', dict.fromkeys(fake_vllm_server.stats, 0))
+
+@contextmanager
+def serve(monkeypatch, transport):
+    create_client = gateway.create_client
+    monkeypatch.setattr(gateway, 'create_client', lambda: create_client(transport))
+    with TestClient(gateway.app) as client:
+        yield client
+
+def fake_server():
+    return httpx.ASGITransport(app=fake_vllm_server.app)
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines.get('event'), json.loads(lines['data'])))
+    return events
+
+def test_stream_is_relayed_as_server_sent_events(monkeypatch):
+    with serve(monkeypatch, fake_server()) as client:
+        response = client.post('/api/generate', json={'prompt': 'hi', 'max_tokens': 3, 'stream': True})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = parse_events(response.text)
+    assert [data['text'] for event, data in events if event is None] == [' token0', ' token1', ' token2']
+    assert events[-1][0] == 'done'
+    assert fake_vllm_server.stats['completed'] == 1
+
+def test_completion_is_returned_whole(monkeypatch):
+    with serve(monkeypatch, fake_server()) as client:
+        response = client.post('/api/generate', json={'prompt': 'hi', 'max_tokens': 2})
+
+    assert response.json() == {'generated_text': ' token0 token1'}
+    assert gateway.in_flight._value == gateway.MAX_IN_FLIGHT
+
+def test_upstream_error_is_reported(monkeypatch):
+    transport = httpx.MockTransport(lambda request: httpx.Response(500, text='out of memory'))
+    with serve(monkeypatch, transport) as client:
+        response = client.post('/api/generate', json={'prompt': 'hi'})
+        streamed = client.post('/api/generate', json={'prompt': 'hi', 'stream': True})
+
+    assert response.status_code == 500
+    assert response.json() == {'error': 'vLLM server error.'}
+    assert parse_events(streamed.text) == [('error', {'error': 'vLLM server error.'})]
+
+def test_full_gateway_answers_503(monkeypatch):
+    monkeypatch.setattr(gateway, 'MAX_IN_FLIGHT', 0)
+    monkeypatch.setattr(gateway, 'QUEUE_TIMEOUT', 0.05)
+    transport = httpx.MockTransport(lambda request: pytest.fail("upstream called at capacity"))
+    with serve(monkeypatch, transport) as client:
+        response = client.post('/api/generate', json={'prompt': 'hi'})
+        streamed = client.post('/api/generate', json={'prompt': 'hi', 'stream': True})
+
+    assert response.status_code == 503
+    assert response.json() == {'error': 'Gateway is at capacity.'}
+    assert parse_events(streamed.text) == [('error', {'error': 'Gateway is at capacity.'})]
+
+def test_in_flight_slots_bound_concurrent_upstream_calls(monkeypatch):
+    active = {'now': 0, 'max': 0}
+
+    async def handler(request):
+        active['now'] += 1
+        active['max'] = max(active['max'], active['now'])
+        await asyncio.sleep(0.01)
+        active['now'] -= 1
+        return httpx.Response(200, json={'choices': [{'text': 'ok'}]})
+
+    async def main():
+        monkeypatch.setattr(gateway, 'client', gateway.create_client(httpx.MockTransport(handler)))
+        monkeypatch.setattr(gateway, 'in_flight', asyncio.Semaphore(2))
+        try:
+            return await asyncio.gather(*[gateway.complete({'prompt': str(i)}) for i in range(6)])
+        finally:
+            await gateway.client.aclose()
+
+    assert asyncio.run(main()) == [('ok', None)] * 6
+    assert active['max'] == 2
+    assert gateway.in_flight._value == 2
+
+class HangingStream(httpx.AsyncByteStream):
+    """
+    Upstream body that sends one token and then never finishes.
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        yield b'data: {"choices": [{"text": "hi"}]}\n\n'
+        await asyncio.Event().wait()
+
+    async def aclose(self):
+        self.closed = True
+
+def test_client_disconnect_closes_the_upstream_stream(monkeypatch):
+    upstream = HangingStream()
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, stream=upstream))
+
+    async def main():
+        monkeypatch.setattr(gateway, 'client', gateway.create_client(transport))
+        monkeypatch.setattr(gateway, 'in_flight', asyncio.Semaphore(1))
+        events, first = [], asyncio.Event()
+
+        async def consume():
+            async for event in gateway.stream_completion({'prompt': 'hi', 'max_tokens': 5}):
+                events.append(event)
+                first.set()
+
+        # The server cancels the response task when the client goes away
+        task = asyncio.create_task(consume())
+        await asyncio.wait_for(first.wait(), 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await gateway.client.aclose()
+        return events
+
+    assert asyncio.run(main()) == [sse_event({'text': 'hi'})]
+    assert upstream.closed
+    assert gateway.in_flight._value == 1
+
+def test_deterministic_stream_is_served_from_the_cache(monkeypatch):
+    request = {'prompt': 'hi', 'max_tokens': 2, 'temperature': 0, 'stream': True}
+    with serve(monkeypatch, fake_server()) as client:
+        first = parse_events(client.post('/api/generate', json=request).text)
+        second = parse_events(client.post('/api/generate', json=request).text)
+
+    assert [data['text'] for event, data in first if event is None] == [' token0', ' token1']
+    assert second[0] == (None, {'text': ' token0 token1'})
+    assert second[-1][1]['cached'] is True
+    assert fake_vllm_server.stats['requests'] == 1
@@ -0,0 +1,81 @@
+# tests/test_hybrid.py
+import pytest
+
+for module in ('numpy', 'psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+from vector_db import hybrid
+from vector_db.hybrid import fuse_ranks
+
+def test_chunks_found_by_both_searches_rank_first():
+    rows = [
+        (1, 'lexical only', 0.9, 1, None),
+        (2, 'both', 0.5, 2, 2),
+        (3, 'vector only', 0.1, None, 1),
+    ]
+
+    assert [row[0] for row in fuse_ranks(rows, k=3)] == [2, 3, 1]
+
+def test_default_damping_constant_is_60():
+    # Rank 30 in both lists (2/90) beats rank 1 in one list (1/61) with
+    # rrf_k=60, but not with rrf_k=10 (2/40 < 1/11)
+    rows = [(1, 'a', 0.5, 1, None), (2, 'b', 0.5, 30, 30)]
+
+    assert [row[0] for row in fuse_ranks(rows, k=2)] == [2, 1]
+    assert [row[0] for row in fuse_ranks(rows, k=2, rrf_k=10)] == [1, 2]
+
+def test_ties_are_broken_by_distance_then_id():
+    rows = [
+        (4, 'lexical first', 0.7, 1, None),
+        (3, 'vector first', 0.2, None, 1),
+        (2, 'same as 5', 0.4, 2, None),
+        (5, 'same as 2', 0.4, None, 2),
+    ]
+
+    assert fuse_ranks(rows, k=4) == [(3, 'vector first', 0.2), (4, 'lexical first', 0.7),
+                                     (2, 'same as 5', 0.4), (5, 'same as 2', 0.4)]
+
+def test_results_are_cut_to_k():
+    rows = [(i, str(i), float(i), None, i) for i in range(1, 11)]
+
+    assert [row[0] for row in fuse_ranks(rows, k=3)] == [1, 2, 3]
+    assert fuse_ranks([], k=3) == []
+
+def test_prefilter_fallback_reuses_the_query_embedding(monkeypatch):
+    class Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def fetchall(self):
+            return [(1, 'lexical match', 0.3)]
+
+    class Connection:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def cursor(self):
+            return Cursor()
+
+    embedding = [0.5, 0.5]
+    fallback_calls = []
+
+    def get_top_k_embeddings(query, k, **kwargs):
+        fallback_calls.append(kwargs['query_embedding'])
+        return [(1, 'lexical match', 0.3), (2, 'vector match', 0.4)]
+
+    monkeypatch.setattr(hybrid, 'encode_query', lambda *args, **kwargs: pytest.fail("query encoded"))
+    monkeypatch.setattr(hybrid, 'get_connection', lambda: Connection())
+    monkeypatch.setattr(hybrid, 'apply_search_settings', lambda *args, **kwargs: None)
+    monkeypatch.setattr(hybrid, 'execute_prepared', lambda *args: None)
+    monkeypatch.setattr(hybrid, 'get_top_k_embeddings', get_top_k_embeddings)
+
+    results = hybrid.hybrid_search('F = ma', k=2, mode='prefilter', query_embedding=embedding)
+
+    assert [row[0] for row in results] == [1, 2]
+    assert fallback_calls == [embedding]
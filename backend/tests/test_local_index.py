@@ -0,0 +1,63 @@
+# tests/test_local_index.py
+# Rebuilding an index must never change files that an open index has mapped.
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vector_db import local_index
+from vector_db.local_index import LocalVectorIndex, build_index, build_quantized, get_local_index
+
+def write_index(directory, seed, count=20, dim=8):
+    vectors = np.random.default_rng(seed).random((count, dim), dtype=np.float32)
+    build_index(directory, list(range(1, count + 1)), [f"chunk {seed}-{i}" for i in range(count)], vectors,
+                {'course': ['PHYS101'] * count})
+    return vectors
+
+def test_rebuild_leaves_open_index_intact(tmp_path):
+    directory = str(tmp_path / 'index')
+    first = write_index(directory, seed=1)
+    index = LocalVectorIndex(directory)
+
+    second = write_index(directory, seed=2, count=30)
+
+    np.testing.assert_array_equal(index.vectors, first)
+    assert index.get_content(0) == 'chunk 1-0'
+    reopened = LocalVectorIndex(directory)
+    np.testing.assert_array_equal(reopened.vectors, second)
+    assert os.path.islink(directory)
+
+def test_quantized_build_publishes_a_version_with_the_same_rows(tmp_path):
+    directory = str(tmp_path / 'index')
+    vectors = write_index(directory, seed=1)
+    index = LocalVectorIndex(directory)
+
+    build_quantized(directory, ('halfvec', 'int8'))
+
+    assert not os.path.exists(os.path.join(index.version_dir, 'vectors.f16'))
+    quantized = LocalVectorIndex(directory)
+    assert quantized.version_dir != index.version_dir
+    np.testing.assert_array_equal(quantized.vectors, vectors)
+    rows, _ = quantized.search_quantized(vectors[3], k=1, kind='int8')[0]
+    assert rows.tolist() == [3]
+    assert quantized.filter_rows({'course': 'PHYS101'}).tolist() == list(range(20))
+
+def test_get_local_index_follows_new_versions(tmp_path):
+    directory = str(tmp_path / 'index')
+    write_index(directory, seed=1)
+    before = get_local_index(directory)
+    try:
+        assert get_local_index(directory) is before
+        write_index(directory, seed=2, count=30)
+        assert get_local_index(directory).count == 30
+    finally:
+        local_index._open_indexes.pop(directory, None)
+
+def test_old_versions_are_pruned(tmp_path):
+    directory = str(tmp_path / 'index')
+    for seed in range(4):
+        write_index(directory, seed=seed)
+
+    versions = [name for name in os.listdir(tmp_path) if name.startswith('index.v')]
+    assert len(versions) == 1 + local_index.KEEP_OLD_VERSIONS
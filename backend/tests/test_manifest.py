@@ -0,0 +1,59 @@
+# tests/test_manifest.py
+import json
+
+from vector_db.manifest import IngestManifest, hash_text
+
+CONFIG = {'max_tokens': 500, 'overlap': 50, 'embedding_model': 'test'}
+
+def write_pdf(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+def test_unchanged_document_is_skipped_after_commit(tmp_path):
+    pdf = write_pdf(tmp_path, 'notes.pdf', b'v1')
+    manifest_path = str(tmp_path / 'manifest.json')
+    manifest = IngestManifest(manifest_path, CONFIG)
+    assert manifest.document_changed('notes', pdf)
+    manifest.changed_chunks('notes', {1: hash_text('a'), 2: hash_text('b')})
+    manifest.commit()
+
+    manifest = IngestManifest(manifest_path, CONFIG)
+    assert not manifest.document_changed('notes', pdf)
+    assert manifest.pending_chunk_counts() == {}
+
+def test_changed_chunks_reports_only_new_or_edited_chunks(tmp_path):
+    manifest = IngestManifest(str(tmp_path / 'manifest.json'), CONFIG)
+    manifest.changed_chunks('notes', {1: hash_text('a'), 2: hash_text('b')})
+    manifest.commit()
+
+    changed = manifest.changed_chunks('notes', {1: hash_text('a'), 2: hash_text('B'), 3: hash_text('c')})
+    assert changed == {2, 3}
+    assert manifest.pending_chunk_counts() == {'notes': 3}
+
+def test_nothing_is_written_before_commit(tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    manifest = IngestManifest(str(manifest_path), CONFIG)
+    assert manifest.document_changed('notes', write_pdf(tmp_path, 'notes.pdf', b'v1'))
+    assert not manifest_path.exists()
+
+def test_discarded_document_is_retried(tmp_path):
+    pdf = write_pdf(tmp_path, 'notes.pdf', b'v1')
+    manifest_path = str(tmp_path / 'manifest.json')
+    manifest = IngestManifest(manifest_path, CONFIG)
+    manifest.document_changed('notes', pdf)
+    manifest.discard('notes')
+    manifest.commit()
+
+    assert IngestManifest(manifest_path, CONFIG).document_changed('notes', pdf)
+
+def test_changed_settings_rebuild_everything(tmp_path):
+    pdf = write_pdf(tmp_path, 'notes.pdf', b'v1')
+    manifest_path = str(tmp_path / 'manifest.json')
+    manifest = IngestManifest(manifest_path, CONFIG)
+    manifest.document_changed('notes', pdf)
+    manifest.commit()
+    with open(manifest_path, encoding='utf-8') as f:
+        assert 'notes' in json.load(f)['documents']
+
+    assert IngestManifest(manifest_path, dict(CONFIG, max_tokens=256)).document_changed('notes', pdf)
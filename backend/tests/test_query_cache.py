@@ -0,0 +1,73 @@
+# tests/test_query_cache.py
+import pytest
+
+for module in ('numpy', 'psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+import numpy as np
+
+from vector_db import query_cache
+
+@pytest.fixture
+def searches(monkeypatch):
+    calls = []
+
+    def get_top_k_embeddings(query, k=5, query_embedding=None, **search_kwargs):
+        calls.append((query, query_embedding))
+        return [(1, 'content', 0.1)]
+
+    def encode_query(texts, **kwargs):
+        raise AssertionError("the query was already encoded")
+
+    monkeypatch.setattr(query_cache, 'get_top_k_embeddings', get_top_k_embeddings)
+    monkeypatch.setattr(query_cache, 'encode_query', encode_query)
+    return calls
+
+def make_cache(**kwargs):
+    cache = query_cache.QueryCache(**kwargs)
+    cache.check_version = lambda backend: None
+    return cache
+
+def test_given_embedding_is_searched_without_encoding_again(searches):
+    embedding = np.ones(4, dtype=np.float32)
+    cache = make_cache(semantic_threshold=0.95)
+
+    assert cache.get_top_k('what is entropy?', 3, embedding) == [(1, 'content', 0.1)]
+    assert searches[0][1] is embedding
+
+def test_similar_query_is_served_from_the_semantic_cache(searches):
+    cache = make_cache(semantic_threshold=0.95)
+    cache.get_top_k('what is entropy?', 3, np.array([1.0, 0.0], dtype=np.float32))
+
+    results = cache.get_top_k('define entropy', 3, np.array([0.99, 0.05], dtype=np.float32))
+
+    assert results == [(1, 'content', 0.1)]
+    assert len(searches) == 1
+    assert cache.stats['semantic_hits'] == 1
+
+def test_versions_and_entries_follow_the_backend_of_each_call(searches, monkeypatch):
+    versions = {'postgres': 1, 'local': 1}
+    checked = []
+
+    def corpus_version(backend):
+        checked.append(backend)
+        return versions[backend]
+
+    monkeypatch.setattr(query_cache, 'VECTOR_BACKEND', 'postgres')
+    monkeypatch.setattr(query_cache, 'VERSION_CHECK_INTERVAL', 0)
+    cache = query_cache.QueryCache()
+    cache._corpus_version = corpus_version
+
+    cache.get_top_k('what is entropy?', 3)
+    cache.get_top_k('what is entropy?', 3, backend='local')
+    assert checked == ['postgres', 'local']
+    # The override is a different store, so it is not answered from the postgres entry
+    assert len(searches) == 2
+
+    cache.get_top_k('what is entropy?', 3, backend='postgres')
+    assert len(searches) == 2
+
+    versions['local'] = 2
+    cache.get_top_k('what is entropy?', 3, backend='local')
+    assert len(searches) == 3
+    assert cache.stats['invalidations'] == 1
@@ -0,0 +1,53 @@
+# tests/test_rerank.py
+# The cross-encoder is replaced by a fake whose forward pass takes a fixed time.
+import time
+
+import pytest
+
+for module in ('numpy', 'psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+from vector_db import rerank
+
+MODEL = 'fake-cross-encoder'
+
+class SlowModel:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.batches = 0
+
+    def predict(self, pairs, batch_size=16, show_progress_bar=False):
+        time.sleep(self.seconds)
+        self.batches += 1
+        # Longer content scores higher
+        return [len(content) for _, content in pairs]
+
+@pytest.fixture
+def model(monkeypatch):
+    model = SlowModel(0.02)
+    monkeypatch.setattr(rerank, '_models', {MODEL: model})
+    monkeypatch.setattr(rerank, '_batch_seconds', {})
+    monkeypatch.setattr(rerank, '_pair_scores', rerank.TTLLRUCache(max_entries=100, ttl=60))
+    return model
+
+def candidates(count):
+    return [(i, 'x' * (i + 1), float(i)) for i in range(count)]
+
+def test_scores_every_candidate_without_a_budget(model):
+    results = rerank.rerank('query', candidates(8), n=3, model_name=MODEL, batch_size=4, budget_ms=None)
+    assert [row[0] for row in results] == [7, 6, 5]
+
+def test_model_is_warmed_before_the_budget_starts(model):
+    results = rerank.rerank('query', candidates(4), n=2, model_name=MODEL, batch_size=4, budget_ms=30)
+    # Two warm-up passes, then one batch that the 20ms estimate lets fit in 30ms
+    assert model.batches == 3
+    assert [row[0] for row in results] == [3, 2]
+
+def test_first_batch_is_skipped_when_it_cannot_fit(model):
+    rerank.warm_up(MODEL, batch_size=4)
+    model.batches = 0
+
+    results = rerank.rerank('query', candidates(8), n=3, model_name=MODEL, batch_size=4, budget_ms=5)
+
+    assert model.batches == 0
+    assert [row[0] for row in results] == [0, 1, 2]
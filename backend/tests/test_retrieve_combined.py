@@ -0,0 +1,28 @@
+# tests/test_retrieve_combined.py
+import pytest
+
+for module in ('numpy', 'psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+from vector_db.retrieve_combined import fuse_results
+
+ROWS = [
+    ('text', 1, 'a', 0.10),
+    ('text', 2, 'b', 0.20),
+    ('text', 3, 'c', 0.30),
+    ('image', 7, 'x', 0.90),
+]
+
+def test_distance_fusion_sorts_across_modalities():
+    assert [row[1] for row in fuse_results(ROWS, k=3)] == [1, 2, 3]
+
+def test_rrf_interleaves_modalities_by_rank():
+    # Both modalities' first rows score 1/61; the tie goes to the nearer one
+    assert [row[1] for row in fuse_results(ROWS, k=3, fusion='rrf')] == [1, 7, 2]
+
+def test_rrf_with_a_single_modality_keeps_distance_order():
+    assert [row[1] for row in fuse_results(ROWS[:3], k=5, fusion='rrf')] == [1, 2, 3]
+
+def test_unknown_fusion_is_rejected():
+    with pytest.raises(ValueError):
+        fuse_results(ROWS, k=3, fusion='sum')
@@ -0,0 +1,124 @@
+# tests/test_run_pipeline.py
+# Incremental re-ingestion paths of run_text_pipeline, with extraction,
+# chunking, embedding and the database replaced by in-memory fakes.
+from contextlib import contextmanager
+
+import pytest
+
+for module in ('numpy', 'psycopg2', 'dotenv', 'pdfminer', 'transformers'):
+    pytest.importorskip(module)
+
+import run_pipeline
+from vector_db.manifest import IngestManifest
+
+CONFIG = {'max_tokens': 500, 'overlap': 50, 'embedding_model': 'test'}
+
+class FakeCorpus:
+    """
+    Stands in for the PDFs and the text_chunks table. Every word of a page is one chunk.
+    """
+
+    def __init__(self, tmp_path, monkeypatch):
+        self.tmp_path = tmp_path
+        self.pages = {}
+        self.chunks = {}
+        self.stored = []
+        monkeypatch.setattr(run_pipeline, 'extract_stage', self.extract_stage)
+        monkeypatch.setattr(run_pipeline, 'iter_chunks', self.iter_chunks)
+        monkeypatch.setattr(run_pipeline, 'embed_stage', lambda chunks, batch_size=64: chunks)
+        monkeypatch.setattr(run_pipeline, 'store_stage', self.store_stage)
+        monkeypatch.setattr(run_pipeline, 'register_documents', lambda *args, **kwargs: ({}, False))
+        monkeypatch.setattr(run_pipeline, 'get_connection', self.get_connection)
+        monkeypatch.setattr(run_pipeline, 'delete_chunks_after', self.delete_chunks_after)
+        monkeypatch.setattr(run_pipeline, 'bump_corpus_version', lambda db_config: None)
+
+    def write_pdf(self, name, pages):
+        """
+        Writes a PDF stand-in whose bytes change with its pages; pages=None makes extraction fail.
+        """
+        path = self.tmp_path / f"{name}.pdf"
+        path.write_bytes(repr(pages).encode('utf-8'))
+        self.pages[str(path)] = pages
+        return str(path)
+
+    def extract_stage(self, pdf_paths, courses):
+        for pdf_path in pdf_paths:
+            yield {'document_id': run_pipeline.document_id_for(pdf_path), 'course': 'default',
+                   'pdf_path': pdf_path, 'pages': self.pages[pdf_path] or []}
+
+    def iter_chunks(self, text, max_tokens=500, overlap=50):
+        position = 0
+        for number, word in enumerate(text.split(), start=1):
+            start = text.index(word, position)
+            position = start + len(word)
+            yield {'chunk_number': number, 'start': start, 'end': position, 'content': word}
+
+    def store_stage(self, records, db_config):
+        records = list(records)
+        for record in records:
+            self.chunks.setdefault(record['document_id'], {})[record['chunk_number']] = record['content']
+        self.stored.extend(records)
+        return len(records)
+
+    @contextmanager
+    def get_connection(self, db_config):
+        class Connection:
+            @contextmanager
+            def cursor(self):
+                yield None
+        yield Connection()
+
+    def delete_chunks_after(self, cursor, document_id, last_chunk_number):
+        chunks = self.chunks.get(document_id, {})
+        stale = [number for number in chunks if number > last_chunk_number]
+        for number in stale:
+            del chunks[number]
+        return len(stale)
+
+    def run(self, pdf_paths):
+        manifest = IngestManifest(str(self.tmp_path / 'manifest.json'), CONFIG)
+        self.stored = []
+        return run_pipeline.run_text_pipeline(pdf_paths, {}, manifest)
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    return FakeCorpus(tmp_path, monkeypatch)
+
+def test_unchanged_pdf_is_not_reprocessed(corpus):
+    pdf = corpus.write_pdf('notes', ['alpha beta', 'gamma'])
+    assert corpus.run([pdf]) == (3, [pdf])
+    assert [(r['chunk_number'], r['page_number']) for r in corpus.stored] == [(1, 1), (2, 1), (3, 2)]
+
+    assert corpus.run([pdf]) == (0, [])
+    assert corpus.chunks['notes'] == {1: 'alpha', 2: 'beta', 3: 'gamma'}
+
+def test_changed_pdf_stores_changed_chunks_and_prunes_removed_ones(corpus):
+    pdf = corpus.write_pdf('notes', ['alpha beta', 'gamma'])
+    corpus.run([pdf])
+
+    pdf = corpus.write_pdf('notes', ['alpha delta'])
+    stored, changed = corpus.run([pdf])
+
+    assert (stored, changed) == (1, [pdf])
+    assert [record['content'] for record in corpus.stored] == ['delta']
+    assert corpus.chunks['notes'] == {1: 'alpha', 2: 'delta'}
+
+def test_failed_extraction_keeps_stored_chunks_and_is_retried(corpus):
+    pdf = corpus.write_pdf('notes', ['alpha beta'])
+    corpus.run([pdf])
+
+    pdf = corpus.write_pdf('notes', None)
+    assert corpus.run([pdf]) == (0, [])
+    assert corpus.chunks['notes'] == {1: 'alpha', 2: 'beta'}
+
+    pdf = corpus.write_pdf('notes', ['alpha gamma'])
+    assert corpus.run([pdf]) == (1, [pdf])
+    assert corpus.chunks['notes'] == {1: 'alpha', 2: 'gamma'}
+
+def test_failed_document_does_not_block_the_others(corpus):
+    good = corpus.write_pdf('good', ['alpha'])
+    bad = corpus.write_pdf('bad', None)
+
+    assert corpus.run([good, bad]) == (1, [good])
+    assert corpus.run([good, bad]) == (0, [])
+    assert 'bad' not in corpus.chunks
@@ -0,0 +1,50 @@
+# tests/test_schema.py
+import pytest
+
+for module in ('psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+from vector_db import schema
+
+class SettingsCursor:
+    def __init__(self, extversion):
+        self.connection = type('Connection', (), {'dsn': f'dbname=pgvector_{extversion}'})()
+        self.extversion = extversion
+        self.settings = {}
+
+    def execute(self, query, params=None):
+        if query.startswith("SELECT set_config('hnsw.iterative_scan'"):
+            self.settings['hnsw.iterative_scan'] = params[0]
+        elif query.startswith("SELECT set_config('hnsw.ef_search'"):
+            self.settings['hnsw.ef_search'] = params[0]
+
+    def fetchone(self):
+        return (self.extversion,)
+
+@pytest.fixture(autouse=True)
+def fresh_versions(monkeypatch):
+    monkeypatch.setattr(schema, '_iterative_scan_supported', {})
+
+def test_filtered_search_walks_the_graph_until_k_rows_match():
+    cursor = SettingsCursor('0.8.0')
+    schema.apply_search_settings(cursor, ef_search=40, filtered=True)
+    assert cursor.settings == {'hnsw.iterative_scan': 'strict_order', 'hnsw.ef_search': '40'}
+
+def test_older_pgvector_is_left_alone():
+    cursor = SettingsCursor('0.7.4')
+    schema.apply_search_settings(cursor, filtered=True)
+    assert cursor.settings == {}
+
+def test_unfiltered_search_does_not_scan_iteratively():
+    cursor = SettingsCursor('0.8.0')
+    schema.apply_search_settings(cursor)
+    assert cursor.settings == {}
+
+def test_ef_search_is_raised_to_the_rows_requested():
+    cursor = SettingsCursor('0.8.0')
+    schema.apply_search_settings(cursor, k=100)
+    assert cursor.settings == {'hnsw.ef_search': '100'}
+
+    cursor = SettingsCursor('0.8.0')
+    schema.apply_search_settings(cursor, k=10)
+    assert cursor.settings == {}
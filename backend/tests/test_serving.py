@@ -0,0 +1,24 @@
+# tests/test_serving.py
+from serving import parse_rag_request, parse_stream
+
+def test_stream_accepts_json_booleans_only():
+    assert parse_stream({}) == (False, None)
+    assert parse_stream({'stream': True}) == (True, None)
+    assert parse_stream({'stream': False}) == (False, None)
+    for value in ('false', 'true', 1, 0):
+        stream, error = parse_stream({'stream': value})
+        assert stream is None and error
+
+def test_rag_filters_accept_strings_and_lists_of_strings():
+    query, k, filters, error = parse_rag_request(
+        {'query': 'entropy', 'k': 3, 'course': 'PHYS101', 'document_id': ['notes', 'slides']})
+
+    assert error is None
+    assert (query, k) == ('entropy', 3)
+    assert filters == {'course': 'PHYS101', 'document_id': ['notes', 'slides']}
+    assert parse_rag_request({'query': 'entropy', 'course': '', 'document_id': []})[2] == {}
+
+def test_rag_filters_reject_other_types():
+    for value in (101, {'a': 1}, ['PHYS101', 2], True):
+        *_, error = parse_rag_request({'query': 'entropy', 'course': value})
+        assert error == "'course' must be a string or a list of strings."
@@ -0,0 +1,72 @@
+# tests/test_store_embeddings.py
+from contextlib import contextmanager
+
+import pytest
+
+for module in ('numpy', 'psycopg2', 'dotenv'):
+    pytest.importorskip(module)
+
+from vector_db import store_embeddings as store_module
+from vector_db.store_embeddings import register_document, store_embeddings
+
+class RecordingCursor:
+    def __init__(self, recorded_course):
+        self.recorded_course = recorded_course
+        self.queries = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self.queries.append((' '.join(query.split()), params))
+        self.rowcount = 1 if query.startswith('UPDATE') else 0
+
+    def fetchone(self):
+        return (self.recorded_course,)
+
+def test_document_keeps_its_course_without_an_explicit_one():
+    cursor = RecordingCursor('PHYS101')
+
+    assert register_document(cursor, 'notes', source_path='notes.pdf') == ('PHYS101', False)
+    assert not any(query.startswith('UPDATE') for query, _ in cursor.queries)
+    # The course parameter of the upsert is NULL, so documents.course is kept
+    assert cursor.queries[0][1][1] is None
+
+def test_explicit_course_relabels_stored_rows():
+    cursor = RecordingCursor('PHYS101')
+
+    assert register_document(cursor, 'notes', 'CHEM201') == ('CHEM201', True)
+    updates = [params for query, params in cursor.queries if query.startswith('UPDATE')]
+    assert updates == [('CHEM201', 'notes', 'CHEM201')] * 2
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+
+    @contextmanager
+    def cursor(self):
+        yield None
+
+    def commit(self):
+        self.commits += 1
+
+def test_rerun_upserts_chunks_and_removes_stale_ones(monkeypatch):
+    conn = FakeConnection()
+    upserted, deleted, bumps = [], [], []
+
+    @contextmanager
+    def get_connection(db_config=None):
+        yield conn
+
+    monkeypatch.setattr(store_module, 'get_connection', get_connection)
+    monkeypatch.setattr(store_module, 'upsert_text_chunks', lambda cursor, rows: upserted.append(rows))
+    monkeypatch.setattr(store_module, 'delete_chunks_after',
+                        lambda cursor, document_id, last: deleted.append((document_id, last)) or 0)
+    monkeypatch.setattr(store_module, 'bump_corpus_version', lambda db_config=None: bumps.append(1))
+
+    # Chunk files sort as text, so chunk 10 comes before chunk 2
+    rows = [('notes', number, None, f'chunk {number}', None, 'PHYS101') for number in (1, 10, 2)]
+    store_embeddings(rows, batch_size=2)
+
+    assert upserted == [rows[:2], rows[2:]]
+    assert conn.commits == 2
+    assert deleted == [('notes', 10)]
+    assert bumps == [1]
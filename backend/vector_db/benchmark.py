@@ -0,0 +1,373 @@
+# vector_db/benchmark.py
+# Run from backend/ with: python -m vector_db.benchmark
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from vector_db.local_index import (
+    LocalVectorIndex, BLOCK_ROWS, build_hnsw, build_quantized, export_from_postgres, stage_index,
+    publish_index,
+)
+from vector_db.quantization import recall_at_k, QUANTIZATION_KINDS
+from vector_db.schema import EMBEDDING_DIM
+
+DEFAULT_BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'benchmark_index')
+# Snapshot of text_chunks for the real corpus; never the serving index, which the
+# benchmark would otherwise rebuild under running workers
+DEFAULT_REAL_BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                          'benchmark_index_real')
+TOPIC_WORDS = 8       # Words that identify a synthetic cluster
+WORDS_PER_CHUNK = 30
+COMMON_WORDS = 2000   # Shared filler vocabulary
+CLUSTER_SPREAD = 1.0  # Norm of the noise added to a unit cluster center
+
+# ===========================
+# Corpora
+# ===========================
+
+def parse_size(text):
+    """
+    Parses corpus sizes such as '10000', '10k' or '10M'.
+    """
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    text = text.strip().lower()
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+def _topic_words(cluster):
+    return [f"topic{cluster}x{i}" for i in range(TOPIC_WORDS)]
+
+def build_synthetic_corpus(directory, size, dim=384, clusters=256, seed=0):
+    """
+    Writes a LocalVectorIndex of clustered unit vectors with matching synthetic text.
+
+    Rows are generated BLOCK_ROWS at a time, so corpora larger than RAM can be built.
+    Each row's text mixes its cluster's topic words with common filler words,
+    which gives the lexical index of hybrid search something to match.
+
+    :param directory: Output directory.
+    :param size: Number of vectors.
+    :param dim: Vector dimension.
+    :param clusters: Number of cluster centers.
+    :param seed: Random seed.
+    :return: float32 array of cluster centers, shape (clusters, dim).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    staging = stage_index(directory)
+    offset = 0
+    with open(os.path.join(staging, 'vectors.f32'), 'wb') as vectors_file, \
+            open(os.path.join(staging, 'norms.f32'), 'wb') as norms_file, \
+            open(os.path.join(staging, 'offsets.i64'), 'wb') as offsets_file, \
+            open(os.path.join(staging, 'content.bin'), 'wb') as content_file:
+        np.array([0], dtype=np.int64).tofile(offsets_file)
+        for start in range(0, size, BLOCK_ROWS):
+            count = min(BLOCK_ROWS, size - start)
+            assignment = rng.integers(0, clusters, count)
+            noise = rng.standard_normal((count, dim)).astype(np.float32) * (CLUSTER_SPREAD / np.sqrt(dim))
+            block = centers[assignment] + noise
+            block /= np.linalg.norm(block, axis=1, keepdims=True)
+            block.tofile(vectors_file)
+            np.einsum('ij,ij->i', block, block).astype(np.float32).tofile(norms_file)
+            fillers = rng.integers(0, COMMON_WORDS, (count, WORDS_PER_CHUNK - 3))
+            topics = rng.integers(0, TOPIC_WORDS, (count, 3))
+            encoded = [
+                ' '.join([_topic_words(cluster)[t] for t in topic] + [f"word{w}" for w in filler]).encode('utf-8')
+                for cluster, topic, filler in zip(assignment, topics, fillers)
+            ]
+            lengths = np.cumsum([len(data) for data in encoded], dtype=np.int64) + offset
+            lengths.tofile(offsets_file)
+            offset = int(lengths[-1])
+            content_file.write(b''.join(encoded))
+    # Database ids of the rows once loaded into PostgreSQL
+    np.arange(1, size + 1, dtype=np.int64).tofile(os.path.join(staging, 'ids.i64'))
+    with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'dim': dim, 'count': size, 'labels': {}}, f)
+    publish_index(directory, staging)
+    print(f"Built synthetic corpus of {size} vectors in {directory}")
+    return centers
+
+def synthetic_queries(centers, num_queries, seed=1):
+    """
+    Draws query vectors near random cluster centers, with topic-word query texts.
+
+    :return: Tuple of (float32 query matrix, list of query texts).
+    """
+    rng = np.random.default_rng(seed)
+    clusters = rng.integers(0, len(centers), num_queries)
+    dim = centers.shape[1]
+    noise = rng.standard_normal((num_queries, dim)).astype(np.float32) * (CLUSTER_SPREAD / np.sqrt(dim))
+    queries = centers[clusters] + noise
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    texts = [' '.join(_topic_words(cluster)[:3]) for cluster in clusters]
+    return queries.astype(np.float32), texts
+
+def real_queries(index, num_queries, query_file=None, model_name='all-MiniLM-L6-v2', seed=1):
+    """
+    Query texts from a file (one per line), or the opening words of random chunks,
+    encoded with the retrieval model.
+
+    :return: Tuple of (float32 query matrix, list of query texts).
+    """
+    from vector_db.embedding_cache import encode_query
+
+    if query_file:
+        with open(query_file, 'r', encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()][:num_queries]
+    else:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(index.count, size=min(num_queries, index.count), replace=False)
+        texts = [' '.join(index.get_content(int(row)).split()[:12]) for row in rows]
+    return encode_query(texts, model_name=model_name), texts
+
+def ground_truth(index, queries, k, batch_size=256):
+    """
+    Exact top-k ids for every query, by brute force over the whole corpus.
+    """
+    truth = []
+    for start in range(0, len(queries), batch_size):
+        for rows, _ in index.search_exact(queries[start:start + batch_size], k):
+            truth.append(index.ids[rows].tolist())
+    return truth
+
+def load_into_postgres(index, db_config=None, batch_rows=50000):
+    """
+    Replaces the contents of text_chunks with a benchmark corpus, keeping its row ids.
+
+    Only use against a disposable database.
+    """
+    from vector_db.bulk_load import bulk_load
+    from vector_db.db import get_connection
+    from vector_db.schema import migrate
+
+    migrate(db_config)
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("TRUNCATE text_chunks RESTART IDENTITY")
+
+    def rows():
+        for row in range(index.count):
+            yield (int(index.ids[row]), 'benchmark', row, index.get_content(row), index.vectors[row])
+
+    bulk_load('text_chunks', ('id', 'document_id', 'chunk_number', 'content', 'embedding'),
+              ('int8', 'text', 'int4', 'text', 'vector'), rows(), db_config, batch_rows)
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT setval(pg_get_serial_sequence('text_chunks', 'id'), "
+                           "(SELECT coalesce(max(id), 1) FROM text_chunks))")
+
+# ===========================
+# Measurement
+# ===========================
+
+def measure(mode, params, search, queries, texts, truth, k):
+    """
+    Runs every query once, sequentially, and summarizes recall and latency.
+
+    :param search: Callable (query_vector, query_text, k) -> list of ids.
+    :return: Result dictionary.
+    """
+    # One untimed query loads models, graphs and caches
+    search(queries[0], texts[0], k)
+    latencies = []
+    found = []
+    start = time.perf_counter()
+    for vector, text in zip(queries, texts):
+        query_start = time.perf_counter()
+        found.append(search(vector, text, k))
+        latencies.append(time.perf_counter() - query_start)
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000.0
+    result = {
+        'mode': mode,
+        'params': params,
+        'recall_at_k': recall_at_k(found, truth),
+        'qps': len(latencies) / max(elapsed, 1e-9),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+    print(f"{mode:<10} {json.dumps(params):<40} recall@{k}={result['recall_at_k']:.3f} "
+          f"qps={result['qps']:.1f} p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms")
+    return result
+
+def local_modes(index, ef_values, kinds, candidates):
+    """
+    Yields (mode, params, search) for the in-process backend.
+    """
+    def ids(hits):
+        return index.ids[hits[0][0]].tolist()
+
+    yield 'exact', {}, lambda vector, text, k: ids(index.search_exact(vector, k))
+    if ef_values:
+        try:
+            if not os.path.exists(os.path.join(index.version_dir, 'hnsw.bin')):
+                build_hnsw(index.directory)
+                # Builds publish a new version; reopen to see the graph
+                index = LocalVectorIndex(index.directory)
+            index.load_hnsw()
+        except ImportError:
+            print("hnswlib is not installed; skipping HNSW modes")
+            ef_values = []
+    for ef in ef_values:
+        yield 'hnsw', {'ef_search': ef}, \
+            lambda vector, text, k, ef=ef: ids(index.search_approximate(vector, k, ef))
+    if kinds:
+        build_quantized(index.directory, kinds)
+        index = LocalVectorIndex(index.directory)
+    for kind in kinds:
+        yield 'quantized', {'kind': kind, 'candidates': candidates}, \
+            lambda vector, text, k, kind=kind: ids(index.search_quantized(vector, k, kind, candidates))
+
+def postgres_modes(ef_values, kinds, candidates, hybrid, db_config=None):
+    """
+    Yields (mode, params, search) against PostgreSQL, using the production statements.
+
+    There is no exact mode: ground truth comes from the local scan, and forcing
+    a sequential scan on the prepared statements would not change their cached plans.
+    """
+    from vector_db.db import get_connection, execute_prepared, to_vector_literal
+    from vector_db.hybrid import FUSION_PREPARED, PREFILTER_PREPARED, fuse_ranks
+    from vector_db.retrieve import TOP_K_PREPARED, QUANTIZED_TOP_K_PREPARED
+    from vector_db.schema import apply_search_settings, build_quantized_index
+
+    def run(name, statement, params, ef_search=None, order=None):
+        with get_connection(db_config) as conn:
+            with conn.cursor() as cursor:
+                apply_search_settings(cursor, ef_search)
+                execute_prepared(cursor, name, statement, params)
+                rows = cursor.fetchall()
+        return [row[0] for row in (order(rows) if order else rows)]
+
+    for ef in ef_values:
+        yield 'hnsw', {'ef_search': ef}, lambda vector, text, k, ef=ef: run(
+            'top_k_text_chunks', TOP_K_PREPARED, (to_vector_literal(vector), k), ef_search=ef)
+    for kind in kinds:
+        build_quantized_index('text_chunks', kind, db_config=db_config)
+        yield 'quantized', {'kind': kind, 'candidates': candidates}, lambda vector, text, k, kind=kind: run(
+            f'top_k_text_chunks_{kind}', QUANTIZED_TOP_K_PREPARED[kind][0],
+            (to_vector_literal(vector), k, max(candidates, k)), ef_search=max(candidates, k))
+    if hybrid:
+        yield 'hybrid', {'mode': 'fusion', 'candidates': candidates}, lambda vector, text, k: run(
+            'hybrid_fusion', FUSION_PREPARED, (text, to_vector_literal(vector), candidates),
+            ef_search=candidates, order=lambda rows: fuse_ranks(rows, k))
+        yield 'hybrid', {'mode': 'prefilter', 'candidates': candidates}, lambda vector, text, k: run(
+            'hybrid_prefilter', PREFILTER_PREPARED, (text, to_vector_literal(vector), candidates, k),
+            ef_search=candidates)
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmark(backend='local', corpus='synthetic', size=10_000, dim=384, num_queries=200, k=10,
+                  ef_values=(16, 40, 100), kinds=QUANTIZATION_KINDS, candidates=100, hybrid=True,
+                  index_dir=DEFAULT_BENCHMARK_DIR, query_file=None, reset_database=False, db_config=None):
+    """
+    Builds or opens a corpus, computes exact ground truth and measures every retrieval mode.
+
+    :param backend: 'local' (in-process index) or 'postgres'.
+    :param corpus: 'synthetic' (generated) or 'real' (the ingested text_chunks).
+    :param size: Number of synthetic vectors.
+    :param dim: Synthetic vector dimension.
+    :param num_queries: Number of queries per mode.
+    :param k: Neighbours per query.
+    :param ef_values: HNSW ef_search settings to measure.
+    :param kinds: Quantization kinds to measure ('halfvec'/'binary' on PostgreSQL).
+    :param candidates: Rerank candidates for quantized and hybrid modes.
+    :param hybrid: Measure hybrid search (PostgreSQL only); its recall is measured
+                   against the pure vector ground truth.
+    :param index_dir: Directory of the benchmark's local index.
+    :param query_file: Query texts for the real corpus, one per line.
+    :param reset_database: Allow replacing text_chunks with the synthetic corpus.
+    :param db_config: Database connection parameters (defaults to the environment).
+    :return: Report dictionary.
+    """
+    if corpus == 'synthetic':
+        if backend == 'postgres' and dim != EMBEDDING_DIM:
+            raise ValueError(f"PostgreSQL stores vector({EMBEDDING_DIM}); use --dim {EMBEDDING_DIM}")
+        if backend == 'postgres' and not reset_database:
+            raise ValueError("Loading a synthetic corpus truncates text_chunks; pass reset_database=True "
+                             "(--reset-database) and point DB_NAME at a disposable database")
+        centers = build_synthetic_corpus(index_dir, size, dim)
+        index = LocalVectorIndex(index_dir)
+        queries, texts = synthetic_queries(centers, num_queries)
+        if backend == 'postgres':
+            from vector_db.schema import rebuild_ann_index
+            load_into_postgres(index, db_config)
+            rebuild_ann_index('text_chunks', db_config=db_config)
+    else:
+        if backend == 'postgres' or not os.path.exists(os.path.join(index_dir, 'meta.json')):
+            export_from_postgres(index_dir, db_config=db_config)
+        index = LocalVectorIndex(index_dir)
+        queries, texts = real_queries(index, num_queries, query_file)
+
+    print(f"Computing exact ground truth for {len(queries)} queries over {index.count} vectors...")
+    truth = ground_truth(index, queries, k)
+
+    if backend == 'postgres':
+        modes = postgres_modes(ef_values, [kind for kind in kinds if kind in ('halfvec', 'binary')],
+                               candidates, hybrid, db_config)
+    else:
+        modes = local_modes(index, ef_values, [kind for kind in kinds if kind in QUANTIZATION_KINDS],
+                            candidates)
+
+    results = [measure(mode, params, search, queries, texts, truth, k) for mode, params, search in modes]
+    return {
+        'meta': {
+            'backend': backend,
+            'corpus': corpus,
+            'size': index.count,
+            'dim': index.dim,
+            'queries': len(queries),
+            'k': k,
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure retrieval recall@k, QPS and latency.")
+    parser.add_argument('--backend', choices=('local', 'postgres'), default='local')
+    parser.add_argument('--corpus', choices=('synthetic', 'real'), default='synthetic')
+    parser.add_argument('--size', type=parse_size, default=parse_size('10k'),
+                        help="Synthetic corpus size, e.g. 10k, 1M, 10M.")
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--ef', type=int, nargs='*', default=[16, 40, 100])
+    parser.add_argument('--quantize', nargs='*', default=None,
+                        help="Quantization kinds; defaults to every kind the backend supports.")
+    parser.add_argument('--candidates', type=int, default=100)
+    parser.add_argument('--no-hybrid', action='store_true')
+    parser.add_argument('--index-dir', default=None,
+                        help="Benchmark index directory (defaults to one per corpus under data/).")
+    parser.add_argument('--query-file', default=None)
+    parser.add_argument('--reset-database', action='store_true',
+                        help="Replace text_chunks with the synthetic corpus (disposable databases only).")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    if args.quantize is None:
+        kinds = ('halfvec', 'binary') if args.backend == 'postgres' else QUANTIZATION_KINDS
+    else:
+        kinds = args.quantize
+    index_dir = args.index_dir or (DEFAULT_BENCHMARK_DIR if args.corpus == 'synthetic'
+                                   else DEFAULT_REAL_BENCHMARK_DIR)
+    report = run_benchmark(args.backend, args.corpus, args.size, args.dim, args.queries, args.k,
+                           args.ef, kinds, args.candidates, not args.no_hybrid, index_dir,
+                           args.query_file, args.reset_database)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
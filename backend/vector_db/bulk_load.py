@@ -0,0 +1,166 @@
+# vector_db/bulk_load.py
+import io
+import itertools
+import struct
+import time
+
+import numpy as np
+
+from vector_db.db import get_connection
+from vector_db.schema import bump_corpus_version
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)  # signature, flags, extension length
+COPY_TRAILER = struct.pack('>h', -1)
+NULL_FIELD = struct.pack('>i', -1)
+
+TEXT_CHUNK_COLUMNS = ('document_id', 'chunk_number', 'page_number', 'content', 'embedding', 'course')
+TEXT_CHUNK_TYPES = ('text', 'int4', 'int4', 'text', 'vector', 'text')
+IMAGE_DESCRIPTION_COLUMNS = ('document_id', 'page_number', 'image_path', 'caption', 'embedding', 'course')
+IMAGE_DESCRIPTION_TYPES = ('text', 'int4', 'text', 'text', 'vector', 'text')
+
+def _encode_field(value, column_type):
+    """
+    Encodes one value in PostgreSQL's binary COPY representation.
+    """
+    if value is None:
+        return NULL_FIELD
+    if column_type == 'text':
+        data = value.encode('utf-8')
+    elif column_type == 'int4':
+        data = struct.pack('>i', value)
+    elif column_type == 'int8':
+        data = struct.pack('>q', value)
+    elif column_type == 'float4':
+        data = struct.pack('>f', value)
+    elif column_type == 'vector':
+        # pgvector binary format: int16 dim, int16 unused, dim big-endian float4
+        vector = np.asarray(value, dtype='>f4')
+        data = struct.pack('>hh', vector.shape[0], 0) + vector.tobytes()
+    else:
+        raise ValueError(f"Unsupported column type for binary COPY: {column_type}")
+    return struct.pack('>i', len(data)) + data
+
+def encode_copy_rows(rows, column_types):
+    """
+    Yields the binary COPY stream for rows, one bytes object per row.
+
+    :param rows: Iterable of tuples in column order. Vectors may be numpy float32
+                 arrays; they are byte-swapped without going through Python floats.
+    :param column_types: Type name of each column ('text', 'int4', 'int8', 'float4', 'vector').
+    """
+    field_count = struct.pack('>h', len(column_types))
+    yield COPY_SIGNATURE
+    for row in rows:
+        yield field_count + b''.join(
+            _encode_field(value, column_type) for value, column_type in zip(row, column_types)
+        )
+    yield COPY_TRAILER
+
+class _IterStream(io.RawIOBase):
+    """
+    Read-only file object over an iterator of bytes, so COPY can stream rows
+    without building the whole payload in memory.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self.buffer:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.buffer = chunk
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+def copy_rows(cursor, table, columns, column_types, rows):
+    """
+    Writes rows into table with COPY ... FROM STDIN in binary format.
+
+    :param cursor: psycopg2 cursor.
+    :param table: Target table name.
+    :param columns: Column names in row order.
+    :param column_types: Type name of each column (see `encode_copy_rows`).
+    :param rows: Iterable of row tuples.
+    """
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)"
+    stream = io.BufferedReader(_IterStream(encode_copy_rows(rows, column_types)), buffer_size=1 << 16)
+    cursor.copy_expert(sql, stream, size=1 << 16)
+
+def bulk_load(table, columns, column_types, rows, db_config=None, batch_rows=50000):
+    """
+    Streams rows into a table, committing every batch_rows rows.
+
+    :param table: Target table name.
+    :param columns: Column names in row order.
+    :param column_types: Type name of each column (see `encode_copy_rows`).
+    :param rows: Iterable of row tuples; consumed lazily.
+    :param db_config: Database connection parameters (defaults to the environment).
+    :param batch_rows: Rows per COPY and commit.
+    :return: Dictionary with 'rows', 'seconds' and 'rows_per_sec'.
+    """
+    rows = iter(rows)
+    loaded = 0
+    start = time.monotonic()
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            while True:
+                batch = list(itertools.islice(rows, batch_rows))
+                if not batch:
+                    break
+                copy_rows(cursor, table, columns, column_types, batch)
+                conn.commit()
+                loaded += len(batch)
+                elapsed = time.monotonic() - start
+                print(f"Loaded {loaded} rows into {table} ({loaded / max(elapsed, 1e-9):.0f} rows/sec)")
+    if loaded:
+        bump_corpus_version(db_config)
+    elapsed = time.monotonic() - start
+    return {'rows': loaded, 'seconds': elapsed, 'rows_per_sec': loaded / max(elapsed, 1e-9)}
+
+def load_text_chunks(rows, db_config=None, batch_rows=50000):
+    """
+    Bulk loads (document_id, chunk_number, page_number, content, embedding, course)
+    rows into 'text_chunks'.
+    """
+    return bulk_load('text_chunks', TEXT_CHUNK_COLUMNS, TEXT_CHUNK_TYPES, rows, db_config, batch_rows)
+
+def load_image_descriptions(rows, db_config=None, batch_rows=50000):
+    """
+    Bulk loads (document_id, page_number, image_path, caption, embedding, course)
+    rows into 'image_descriptions'.
+    """
+    return bulk_load('image_descriptions', IMAGE_DESCRIPTION_COLUMNS, IMAGE_DESCRIPTION_TYPES,
+                     rows, db_config, batch_rows)
+
+def replace_image_descriptions(document_id, rows, db_config=None):
+    """
+    Replaces every 'image_descriptions' row of one document in a single
+    transaction, so re-ingesting a changed PDF does not duplicate its images.
+
+    :param document_id: Identifier of the document.
+    :param rows: Iterable of (document_id, page_number, image_path, caption, embedding, course) rows.
+    :param db_config: Database connection parameters (defaults to the environment).
+    :return: Dictionary with 'rows', 'deleted', 'seconds' and 'rows_per_sec'.
+    """
+    rows = list(rows)
+    start = time.monotonic()
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM image_descriptions WHERE document_id = %s", (document_id,))
+            deleted = cursor.rowcount
+            if rows:
+                copy_rows(cursor, 'image_descriptions', IMAGE_DESCRIPTION_COLUMNS,
+                          IMAGE_DESCRIPTION_TYPES, rows)
+    if rows or deleted:
+        bump_corpus_version(db_config)
+    elapsed = time.monotonic() - start
+    return {'rows': len(rows), 'deleted': deleted, 'seconds': elapsed,
+            'rows_per_sec': len(rows) / max(elapsed, 1e-9)}
@@ -0,0 +1,202 @@
+# vector_db/db.py
+from contextlib import contextmanager
+import os
+import threading
+import time
+import weakref
+
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2 import pool
+
+load_dotenv()  # Load environment variables from .env file
+
+# Connections kept open while idle; servers raise it with `reserve_connections`
+POOL_MIN_CONN = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX_CONN = max(POOL_MIN_CONN, int(os.getenv('DB_POOL_MAX', '10')))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # Seconds to wait for a free connection
+HEALTH_CHECK_AFTER = float(os.getenv('DB_HEALTH_CHECK_AFTER', '30'))  # Idle seconds before a ping
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Keyed by the connection object, so entries vanish with the connection and a
+# new connection that happens to reuse a closed one's id() starts clean
+_last_used = weakref.WeakKeyDictionary()  # conn -> time it was returned to the pool
+_prepared = weakref.WeakKeyDictionary()   # conn -> names of statements prepared on it
+
+class BlockingConnectionPool(pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool whose getconn waits for a free connection instead of
+    raising PoolError once maxconn connections are in use.
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout=POOL_TIMEOUT, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise pool.PoolError(f"no free connection after {self.timeout:.0f}s")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+    def reserve(self, minconn):
+        """
+        Keeps at least minconn connections (at most maxconn) open from now on,
+        opening the missing ones immediately.
+        """
+        with self._lock:
+            self.minconn = max(self.minconn, min(minconn, self.maxconn))
+            while len(self._pool) + len(self._used) < self.minconn:
+                self._connect()
+
+def get_db_config():
+    """
+    Retrieves database configuration from environment variables.
+
+    :return: Dictionary containing database connection parameters.
+    """
+    return {
+        'dbname': os.getenv('DB_NAME', 'rag_db'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', 'your_password'),
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': os.getenv('DB_PORT', '5432')
+    }
+
+def get_pool(db_config=None):
+    """
+    Returns the process-wide connection pool for a database configuration.
+
+    :param db_config: Database connection parameters (defaults to `get_db_config()`).
+    :return: BlockingConnectionPool.
+    """
+    db_config = db_config or get_db_config()
+    key = tuple(sorted(db_config.items()))
+    with _pools_lock:
+        connection_pool = _pools.get(key)
+        if connection_pool is None:
+            connection_pool = BlockingConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, **db_config)
+            _pools[key] = connection_pool
+    return connection_pool
+
+def reserve_connections(minconn, db_config=None):
+    """
+    Opens and keeps minconn pooled connections, so a server's workers never wait on a connect.
+
+    :param minconn: Connections to keep open, capped at DB_POOL_MAX.
+    :param db_config: Database connection parameters (defaults to `get_db_config()`).
+    """
+    get_pool(db_config).reserve(minconn)
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(conn, 0) < HEALTH_CHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _discard(connection_pool, conn):
+    _last_used.pop(conn, None)
+    _prepared.pop(conn, None)
+    connection_pool.putconn(conn, close=True)
+
+@contextmanager
+def get_connection(db_config=None):
+    """
+    Borrows a pooled connection, committing on success and rolling back on error.
+
+    Waits up to DB_POOL_TIMEOUT seconds when every connection is in use.
+    Connections idle for longer than DB_HEALTH_CHECK_AFTER seconds are pinged
+    first and replaced if the server dropped them.
+
+    :param db_config: Database connection parameters (defaults to `get_db_config()`).
+    """
+    connection_pool = get_pool(db_config)
+    conn = connection_pool.getconn()
+    if not _is_healthy(conn):
+        _discard(connection_pool, conn)
+        conn = connection_pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if conn.closed:
+            _discard(connection_pool, conn)
+        else:
+            _last_used[conn] = time.monotonic()
+            connection_pool.putconn(conn)
+
+def execute_prepared(cursor, name, statement, params):
+    """
+    Executes a server-side prepared statement, preparing it on first use per connection.
+
+    The statement is written with $1, $2, ... placeholders and parameter types,
+    e.g. statement="(vector, int) AS SELECT ... LIMIT $2".
+
+    :param cursor: Cursor of a pooled connection.
+    :param name: Statement name, unique per statement text.
+    :param statement: Everything after "PREPARE <name>".
+    :param params: Parameter values in placeholder order.
+    """
+    prepared = _prepared.setdefault(cursor.connection, set())
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} {statement}")
+        prepared.add(name)
+    placeholders = ', '.join(['%s'] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+def health_check(db_config=None):
+    """
+    Checks that the database answers a trivial query through the pool.
+
+    :param db_config: Database connection parameters (defaults to `get_db_config()`).
+    :return: True if the database is reachable.
+    """
+    try:
+        with get_connection(db_config) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                return cursor.fetchone()[0] == 1
+    except Exception as e:
+        print(f"Database health check failed: {e}")
+        return False
+
+def to_vector_literal(embedding):
+    """
+    Formats an embedding as a pgvector text literal, e.g. '[0.1,0.2]'.
+
+    :param embedding: Sequence or numpy array of floats.
+    """
+    return '[' + ','.join(repr(float(x)) for x in embedding) + ']'
+
+def close_pools():
+    """
+    Closes every pooled connection, e.g. on application shutdown.
+    """
+    with _pools_lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
+        _last_used.clear()
+        _prepared.clear()
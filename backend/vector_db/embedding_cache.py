@@ -0,0 +1,245 @@
+# vector_db/embedding_cache.py
+from collections import OrderedDict
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from vector_db.embedding_models import DEFAULT_EMBEDDING_MODEL, encode
+
+DEFAULT_CACHE_DIR = os.getenv(
+    'EMBEDDING_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'embedding_cache')
+)
+DEFAULT_REVISION = os.getenv('EMBEDDING_MODEL_REVISION', 'main')
+DIGEST_SIZE = 20  # bytes of SHA-1
+
+def normalize_text(text):
+    """
+    Normalizes text so that trivially different inputs share a cache entry.
+
+    :param text: Raw text.
+    :return: NFC-normalized text with whitespace runs collapsed and stripped.
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+class EmbeddingCache:
+    """
+    Disk-backed cache of float32 embeddings for one (model, revision) pair.
+
+    Vectors are appended to `vectors.f32` (read back through a memory map)
+    and their text digests to `keys.bin`, so row i of one file belongs to
+    digest i of the other. A bounded LRU of recently used vectors sits in
+    front of the memory map for hot queries.
+
+    The ingest pipeline and every server worker share the cache directory.
+    Appends hold an exclusive lock on its `lock` file and number their rows
+    from the length of `keys.bin`, and rows appended by other processes are
+    indexed when a lookup misses, so a digest always maps to its own vector.
+    """
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, revision=DEFAULT_REVISION,
+                 cache_dir=DEFAULT_CACHE_DIR, lru_size=10000):
+        """
+        :param model_name: Name of the SentenceTransformer model.
+        :param revision: Model revision; a new revision gets a fresh cache.
+        :param cache_dir: Root directory of the on-disk caches.
+        :param lru_size: Number of vectors kept in the in-memory LRU.
+        """
+        self.model_name = model_name
+        self.revision = revision
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{model_name}@{revision}")
+        self.directory = os.path.join(cache_dir, safe_name)
+        self.vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self.keys_path = os.path.join(self.directory, 'keys.bin')
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.lock_path = os.path.join(self.directory, 'lock')
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.index = {}
+        self.num_rows = 0
+        self.dim = None
+        self.matrix = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive=True):
+        """
+        Holds an flock on the cache directory, shared for reads and exclusive for writes.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with self._file_lock():
+            self._read_meta()
+            if os.path.exists(self.keys_path) and os.path.exists(self.vectors_path):
+                row_bytes = self.dim * 4
+                # A crash between the two appends can leave one file longer; trust the
+                # shorter one and truncate the other so new rows stay aligned
+                num_rows = min(os.path.getsize(self.keys_path) // DIGEST_SIZE,
+                               os.path.getsize(self.vectors_path) // row_bytes)
+                os.truncate(self.keys_path, num_rows * DIGEST_SIZE)
+                os.truncate(self.vectors_path, num_rows * row_bytes)
+            self._refresh()
+
+    def _read_meta(self):
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+
+    def _refresh(self):
+        """
+        Indexes the rows appended since the last refresh, by this or another
+        process. Call with the file lock held.
+        """
+        self._read_meta()
+        if self.dim is None or not os.path.exists(self.keys_path):
+            return
+        num_rows = os.path.getsize(self.keys_path) // DIGEST_SIZE
+        if num_rows <= self.num_rows:
+            return
+        with open(self.keys_path, 'rb') as f:
+            f.seek(self.num_rows * DIGEST_SIZE)
+            keys = f.read((num_rows - self.num_rows) * DIGEST_SIZE)
+        for i in range(num_rows - self.num_rows):
+            # Tolerate duplicate entries for a text; the first row wins
+            self.index.setdefault(keys[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], self.num_rows + i)
+        self.num_rows = num_rows
+        self._remap(num_rows)
+
+    def _remap(self, num_rows):
+        if num_rows:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                    shape=(num_rows, self.dim))
+
+    def _digest(self, text):
+        return hashlib.sha1(normalize_text(text).encode('utf-8')).digest()
+
+    def _lookup(self, digest):
+        vector = self.lru.get(digest)
+        if vector is not None:
+            self.lru.move_to_end(digest)
+            return vector
+        row = self.index.get(digest)
+        if row is None:
+            return None
+        if self.matrix is None or row >= self.matrix.shape[0]:
+            self._remap(self.num_rows)
+        vector = np.array(self.matrix[row])
+        self._remember(digest, vector)
+        return vector
+
+    def _remember(self, digest, vector):
+        self.lru[digest] = vector
+        self.lru.move_to_end(digest)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def _append(self, digests, vectors):
+        with self._file_lock():
+            if self.dim is None and not os.path.exists(self.meta_path):
+                with open(self.meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'model': self.model_name, 'revision': self.revision,
+                               'dim': vectors.shape[1]}, f)
+            self._refresh()
+            fresh = [i for i, digest in enumerate(digests) if digest not in self.index]
+            if not fresh:
+                return
+            # Rows are numbered from keys.bin; drop vectors a crashed writer left past it
+            row_bytes = self.dim * 4
+            if os.path.exists(self.vectors_path):
+                os.truncate(self.vectors_path, self.num_rows * row_bytes)
+            # Vectors are written before their keys so a key never points past the data
+            with open(self.vectors_path, 'ab') as f:
+                f.write(np.ascontiguousarray(vectors[fresh], dtype=np.float32).tobytes())
+            with open(self.keys_path, 'ab') as f:
+                f.write(b''.join(digests[i] for i in fresh))
+            for row, i in enumerate(fresh, start=self.num_rows):
+                self.index[digests[i]] = row
+            self.num_rows += len(fresh)
+
+    def encode(self, texts, batch_size=64, persist=True):
+        """
+        Returns embeddings for texts, encoding only the missing ones.
+
+        :param texts: A string or a list of strings.
+        :param batch_size: Number of texts per forward pass for the misses.
+        :param persist: Store new vectors on disk; otherwise they are only kept in the LRU.
+        :return: float32 array of shape (dim,) for a string, (len(texts), dim) for a list.
+        """
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size=batch_size, persist=persist)[0]
+        texts = list(texts)
+        digests = [self._digest(text) for text in texts]
+        with self.lock:
+            found = [self._lookup(digest) for digest in digests]
+            if any(vector is None for vector in found) and os.path.exists(self.keys_path):
+                # Other processes may have stored these since the last refresh
+                with self._file_lock(exclusive=False):
+                    self._refresh()
+                found = [self._lookup(digest) if vector is None else vector
+                         for digest, vector in zip(digests, found)]
+        missing = {}
+        for i, vector in enumerate(found):
+            if vector is None:
+                missing.setdefault(digests[i], i)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            new_vectors = encode([texts[i] for i in missing.values()], model_name=self.model_name,
+                                 batch_size=batch_size)
+            with self.lock:
+                if persist:
+                    self._append(list(missing), np.stack(new_vectors))
+                for digest, vector in zip(missing, new_vectors):
+                    self._remember(digest, vector)
+            by_digest = dict(zip(missing, new_vectors))
+            found = [by_digest[digests[i]] if vector is None else vector for i, vector in enumerate(found)]
+        if not found:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.stack(found).astype(np.float32, copy=False)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model_name=DEFAULT_EMBEDDING_MODEL, revision=DEFAULT_REVISION):
+    """
+    Returns the process-wide cache for (model_name, revision).
+    """
+    key = (model_name, revision)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = EmbeddingCache(model_name, revision)
+            _caches[key] = cache
+    return cache
+
+def cached_encode(texts, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=64, revision=DEFAULT_REVISION):
+    """
+    Drop-in replacement for `embedding_models.encode` that goes through the cache.
+    """
+    return get_embedding_cache(model_name, revision).encode(texts, batch_size=batch_size)
+
+def encode_query(texts, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=64, revision=DEFAULT_REVISION):
+    """
+    `cached_encode` for search queries: cached vectors are reused, but new
+    ones stay in the in-memory LRU, so user queries never grow the files.
+    """
+    return get_embedding_cache(model_name, revision).encode(texts, batch_size=batch_size, persist=False)
@@ -0,0 +1,52 @@
+# vector_db/embedding_models.py
+import threading
+
+import numpy as np
+
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+_models = {}
+_lock = threading.Lock()
+
+def get_embedding_model(model_name=DEFAULT_EMBEDDING_MODEL):
+    """
+    Returns the process-wide SentenceTransformer for model_name, loading it on first use.
+
+    :param model_name: Name of the SentenceTransformer model.
+    :return: Loaded SentenceTransformer.
+    """
+    model = _models.get(model_name)
+    if model is None:
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_name)
+                _models[model_name] = model
+    return model
+
+def encode(texts, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=64):
+    """
+    Encodes one text or a list of texts with the shared model.
+
+    :param texts: A string or a list of strings.
+    :param model_name: Name of the SentenceTransformer model.
+    :param batch_size: Number of texts per forward pass.
+    :return: float32 array of shape (dim,) for a string, (len(texts), dim) for a list.
+    """
+    model = get_embedding_model(model_name)
+    if isinstance(texts, str):
+        return np.asarray(model.encode(texts), dtype=np.float32)
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    embeddings = model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+    return np.asarray(embeddings, dtype=np.float32)
+
+def warm_up(model_names=(DEFAULT_EMBEDDING_MODEL,)):
+    """
+    Loads models and runs one dummy encode so the first real query is fast.
+
+    :param model_names: Names of the models to load.
+    """
+    for model_name in model_names:
+        encode(["warm up"], model_name=model_name)
@@ -0,0 +1,143 @@
+# vector_db/hybrid.py
+# Run from backend/ with: python -m vector_db.hybrid
+from vector_db.embedding_cache import encode_query
+from vector_db.db import get_connection, execute_prepared, to_vector_literal
+from vector_db.retrieve import get_top_k_embeddings
+from vector_db.schema import apply_search_settings, filter_params, prepared_variants, TEXT_SEARCH_CONFIG
+
+# Any query term may match: plainto_tsquery ANDs the terms, which is too strict
+# for natural-language questions, so its '&' operators are turned into '|'.
+TSQUERY = f"to_tsquery('{TEXT_SEARCH_CONFIG}', replace(plainto_tsquery('{TEXT_SEARCH_CONFIG}', $1)::text, '&', '|'))"
+
+# Lexical and vector top candidates with their ranks, in one round trip;
+# `fuse_ranks` orders their union.
+FUSION_PREPARED, FUSION_FILTERED = prepared_variants(f"""(text, vector, int) AS
+    WITH lexical AS (
+        SELECT id, row_number() OVER (ORDER BY score DESC) AS lex_rank
+        FROM (
+            SELECT id, ts_rank_cd(content_tsv, query) AS score
+            FROM text_chunks, {TSQUERY} AS query
+            WHERE content_tsv @@ query AND {{filters}}
+            ORDER BY score DESC
+            LIMIT $3
+        ) AS matches
+    ),
+    semantic AS (
+        SELECT id, row_number() OVER (ORDER BY distance) AS vec_rank
+        FROM (
+            SELECT id, embedding <-> $2 AS distance
+            FROM text_chunks
+            WHERE {{filters}}
+            ORDER BY embedding <-> $2
+            LIMIT $3
+        ) AS neighbours
+    )
+    SELECT t.id, t.content, t.embedding <-> $2 AS distance, lex_rank, vec_rank
+    FROM lexical
+    FULL OUTER JOIN semantic USING (id)
+    JOIN text_chunks t USING (id)
+""")
+
+# Lexical matches as the candidate set; exact vector distance only on those rows.
+PREFILTER_PREPARED, PREFILTER_FILTERED = prepared_variants(f"""(text, vector, int, int) AS
+    SELECT id, content, embedding <-> $2 AS distance
+    FROM (
+        SELECT id, content, embedding
+        FROM text_chunks, {TSQUERY} AS query
+        WHERE content_tsv @@ query AND {{filters}}
+        ORDER BY ts_rank_cd(content_tsv, query) DESC
+        LIMIT $3
+    ) AS candidates
+    ORDER BY distance
+    LIMIT $4
+""")
+
+def fuse_ranks(rows, k, rrf_k=60):
+    """
+    Ranks lexical and vector candidates by reciprocal rank fusion.
+
+    Each row scores 1 / (rrf_k + rank) for every list it appears in, so a
+    chunk found by both searches beats one found by a single search at the
+    same rank. Equal scores are ordered by vector distance, then id.
+
+    :param rows: Tuples of (id, content, distance, lex_rank, vec_rank), a rank
+                 being None when the row is missing from that list.
+    :param k: Number of results to return.
+    :param rrf_k: RRF damping constant.
+    :return: Top k tuples of (id, content, distance), best first.
+    """
+    def score(row):
+        return sum(1.0 / (rrf_k + rank) for rank in row[3:5] if rank is not None)
+    ranked = sorted(rows, key=lambda row: (-score(row), row[2], row[0]))
+    return [row[:3] for row in ranked[:k]]
+
+def hybrid_search(query, k=5, mode='fusion', candidates=100, rrf_k=60,
+                  model_name='all-MiniLM-L6-v2', ef_search=None, probes=None, filters=None,
+                  query_embedding=None):
+    """
+    Retrieves text chunks by combining the full-text index with vector search.
+
+    'fusion' takes the top candidates of both the GIN full-text index and the
+    vector index and ranks their union by reciprocal rank fusion (see
+    `fuse_ranks`), so exact terms (equation names, units) surface without
+    over-fetching a large vector k.
+    'prefilter' uses the full-text matches as the candidate set and computes
+    vector distances only for those rows; if fewer than k chunks match, the
+    rest is filled from plain vector search.
+
+    :param query: User input query.
+    :param k: Number of results to return.
+    :param mode: 'fusion' or 'prefilter'.
+    :param candidates: Candidates taken from each index before fusion or rescoring.
+    :param rrf_k: RRF damping constant.
+    :param model_name: Name of the SentenceTransformer model.
+    :param ef_search: HNSW search breadth for the vector branch.
+    :param probes: IVFFlat lists scanned for the vector branch.
+    :param filters: Metadata filters such as {'course': 'PHYS101'}, applied inside
+                    both the lexical and the vector candidate searches.
+    :param query_embedding: Embedding of query if the caller already computed it.
+    :return: List of tuples containing (id, content, distance).
+    """
+    if mode not in ('fusion', 'prefilter'):
+        raise ValueError(f"Unknown hybrid mode: {mode}")
+    extra = filter_params(filters) if filters else ()
+    query_emb = encode_query(query, model_name=model_name) if query_embedding is None else query_embedding
+    candidates = max(candidates, k)
+    vector = to_vector_literal(query_emb)
+
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                apply_search_settings(cursor, ef_search, probes, filtered=bool(filters), k=candidates)
+                suffix = '_filtered' if filters else ''
+                if mode == 'fusion':
+                    statement = FUSION_FILTERED if filters else FUSION_PREPARED
+                    execute_prepared(cursor, 'hybrid_fusion' + suffix, statement,
+                                     (query, vector, candidates) + extra)
+                else:
+                    statement = PREFILTER_FILTERED if filters else PREFILTER_PREPARED
+                    execute_prepared(cursor, 'hybrid_prefilter' + suffix, statement,
+                                     (query, vector, candidates, k) + extra)
+                results = cursor.fetchall()
+    except Exception as e:
+        print(f"Error running hybrid search: {e}")
+        return []
+
+    if mode == 'fusion':
+        return fuse_ranks(results, k, rrf_k)
+    if len(results) < k:
+        seen = {row[0] for row in results}
+        for row in get_top_k_embeddings(query, k=k, model_name=model_name,
+                                        ef_search=ef_search, probes=probes, filters=filters,
+                                        query_embedding=query_emb):
+            if row[0] not in seen and len(results) < k:
+                results.append(row)
+    return results
+
+if __name__ == "__main__":
+    user_query = "State Newton's second law F = ma"
+    top_k = 3
+    for search_mode in ('fusion', 'prefilter'):
+        print(f"Top {top_k} {search_mode} results for query: '{user_query}'\n")
+        for res in hybrid_search(user_query, k=top_k, mode=search_mode):
+            print(f"ID: {res[0]}, Distance: {res[2]:.4f}\nContent: {res[1]}\n")
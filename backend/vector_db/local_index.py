@@ -0,0 +1,501 @@
+# vector_db/local_index.py
+# Run from backend/ with: python -m vector_db.local_index
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from vector_db.quantization import (
+    fit_int8, quantize_int8, quantize_binary, approximate_distances, recall_at_k, QUANTIZATION_KINDS,
+)
+
+DEFAULT_INDEX_DIR = os.getenv(
+    'LOCAL_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'local_index')
+)
+BLOCK_ROWS = 65536  # Rows scored per matrix product, bounds scratch memory
+KEEP_OLD_VERSIONS = 1  # Superseded index versions kept for processes still reading them
+
+class LocalVectorIndex:
+    """
+    Read-only vector index stored as memory-mapped files in one directory:
+
+    - vectors.f32: float32 matrix of shape (count, dim)
+    - norms.f32:   squared L2 norm of every row
+    - ids.i64:     database id of every row
+    - content.bin / offsets.i64: UTF-8 content of every row and its byte offsets
+    - hnsw.bin:    optional HNSW graph (requires the `hnswlib` package)
+    - vectors.f16 / vectors.i8 (+ int8_params.npz) / vectors.b1: optional
+      compact copies for quantized first-pass search (see `build_quantized`)
+    - course.i32 / document_id.i32: optional metadata codes into the label
+      lists in meta.json, used by filtered search
+
+    Opening maps the files without reading them, so startup is instant and the
+    OS page cache is shared by every worker process that opens the same index.
+    Distances are Euclidean, matching pgvector's `<->`.
+
+    The builders below never modify files in place: `directory` is a symlink to
+    a versioned sibling directory, and a build writes a new version and swaps
+    the link (see `stage_index`). An open index keeps reading the version it
+    was opened on, including files it maps later.
+    """
+
+    def __init__(self, directory=DEFAULT_INDEX_DIR):
+        self.directory = directory
+        self.version_dir = os.path.realpath(directory)
+        with open(os.path.join(self.version_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.dim = meta['dim']
+        self.count = meta['count']
+        self.labels = meta.get('labels', {})
+        self.vectors = self._map('vectors.f32', np.float32, (self.count, self.dim))
+        self.norms = self._map('norms.f32', np.float32, (self.count,))
+        self.ids = self._map('ids.i64', np.int64, (self.count,))
+        self.offsets = self._map('offsets.i64', np.int64, (self.count + 1,))
+        self.content = self._map('content.bin', np.uint8, (int(self.offsets[-1]),)) if self.count else None
+        self.hnsw = None
+        self.codes = {}
+        self.int8_params = None
+        self.metadata = {
+            column: self._map(f'{column}.i32', np.int32, (self.count,)) for column in self.labels
+        }
+
+    def _map(self, name, dtype, shape):
+        if not shape[0]:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.version_dir, name), dtype=dtype, mode='r', shape=shape)
+
+    def get_content(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self.content[start:end]).decode('utf-8')
+
+    def _results(self, rows, squared_distances):
+        return [
+            (int(self.ids[row]), self.get_content(row), float(np.sqrt(max(distance, 0.0))))
+            for row, distance in zip(rows, squared_distances)
+        ]
+
+    def filter_rows(self, filters):
+        """
+        Rows whose metadata matches every filter.
+
+        :param filters: See `vector_db.schema.filter_params`, e.g. {'course': 'PHYS101'}.
+        :return: Sorted int64 array of rows.
+        """
+        mask = np.ones(self.count, dtype=bool)
+        for column, values in filters.items():
+            if column not in self.metadata:
+                raise ValueError(f"Local index has no '{column}' metadata; re-export it")
+            values = [values] if isinstance(values, str) else values
+            codes = [self.labels[column].index(value) for value in values if value in self.labels[column]]
+            mask &= np.isin(self.metadata[column], codes)
+        return np.flatnonzero(mask)
+
+    def search_exact(self, queries, k=5, rows=None):
+        """
+        Exact top-k by blocked matrix products and argpartition.
+
+        :param queries: float32 array of shape (dim,) or (num_queries, dim).
+        :param k: Number of results per query.
+        :param rows: Optional sorted array of rows to search, e.g. from `filter_rows`;
+                     only those rows are read.
+        :return: List of (rows, squared_distances) per query, nearest first.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        total = self.count if rows is None else len(rows)
+        k = min(k, total)
+        if k == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_dist = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, BLOCK_ROWS):
+            if rows is None:
+                block_rows = None
+                block = self.vectors[start:start + BLOCK_ROWS]
+                norms = self.norms[start:start + BLOCK_ROWS]
+            else:
+                block_rows = rows[start:start + BLOCK_ROWS]
+                block = self.vectors[block_rows]
+                norms = self.norms[block_rows]
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+            dist = norms[None, :] - 2.0 * (queries @ block.T)
+            dist += query_norms[:, None]
+            block_k = min(k, dist.shape[1])
+            part = np.argpartition(dist, block_k - 1, axis=1)[:, :block_k]
+            part_rows = part + start if block_rows is None else block_rows[part]
+            best_rows = np.concatenate([best_rows, part_rows], axis=1)
+            best_dist = np.concatenate([best_dist, np.take_along_axis(dist, part, axis=1)], axis=1)
+            if best_rows.shape[1] > k:
+                keep = np.argpartition(best_dist, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_dist = np.take_along_axis(best_dist, keep, axis=1)
+        order = np.argsort(best_dist, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_dist = np.take_along_axis(best_dist, order, axis=1)
+        return list(zip(best_rows, best_dist))
+
+    def _load_codes(self, kind):
+        codes = self.codes.get(kind)
+        if codes is None:
+            if kind == 'halfvec':
+                codes = self._map('vectors.f16', np.float16, (self.count, self.dim))
+            elif kind == 'int8':
+                codes = self._map('vectors.i8', np.int8, (self.count, self.dim))
+                params = np.load(os.path.join(self.version_dir, 'int8_params.npz'))
+                self.int8_params = (params['offset'], params['scale'])
+            elif kind == 'binary':
+                codes = self._map('vectors.b1', np.uint8, (self.count, (self.dim + 7) // 8))
+            else:
+                raise ValueError(f"Unknown quantization kind: {kind}")
+            self.codes[kind] = codes
+        return codes
+
+    def search_quantized(self, queries, k=5, kind='int8', candidates=100):
+        """
+        Top-k by a first pass over compact codes, then an exact rerank of the
+        best candidates against the full-precision vectors.
+
+        Only the compact codes are scanned, so they are what must stay in RAM;
+        the float32 matrix is touched for `candidates` rows per query.
+
+        :param queries: float32 array of shape (dim,) or (num_queries, dim).
+        :param k: Number of results per query.
+        :param kind: 'halfvec', 'int8' or 'binary'.
+        :param candidates: Rows kept from the first pass for reranking (at least k).
+        :return: List of (rows, squared_distances) per query, nearest first.
+        """
+        codes = self._load_codes(kind)
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, self.count)
+        candidates = min(max(candidates, k), self.count)
+        hits = []
+        for query in queries:
+            best_rows = np.empty(0, dtype=np.int64)
+            best_scores = np.empty(0, dtype=np.float32)
+            for start in range(0, self.count, BLOCK_ROWS):
+                scores = approximate_distances(kind, codes[start:start + BLOCK_ROWS], query, self.int8_params)
+                block_k = min(candidates, len(scores))
+                part = np.argpartition(scores, block_k - 1)[:block_k]
+                best_rows = np.concatenate([best_rows, part + start])
+                best_scores = np.concatenate([best_scores, scores[part].astype(np.float32)])
+                if len(best_rows) > candidates:
+                    keep = np.argpartition(best_scores, candidates - 1)[:candidates]
+                    best_rows, best_scores = best_rows[keep], best_scores[keep]
+            # Rerank with full precision; sorted rows keep memmap reads sequential
+            rows = np.sort(best_rows)
+            full = np.asarray(self.vectors[rows])
+            diff = full - query
+            distances = np.einsum('ij,ij->i', diff, diff)
+            order = np.argsort(distances)[:k]
+            hits.append((rows[order], distances[order]))
+        return hits
+
+    def load_hnsw(self):
+        """
+        Loads the HNSW graph built by `build_hnsw`.
+        """
+        import hnswlib  # Optional dependency, only needed for approximate search
+        graph = hnswlib.Index(space='l2', dim=self.dim)
+        graph.load_index(os.path.join(self.version_dir, 'hnsw.bin'), max_elements=self.count)
+        self.hnsw = graph
+        return graph
+
+    def search_approximate(self, queries, k=5, ef_search=None):
+        """
+        Approximate top-k through the HNSW graph.
+
+        :param queries: float32 array of shape (dim,) or (num_queries, dim).
+        :param k: Number of results per query.
+        :param ef_search: Candidate list size (higher = better recall, slower); at least k.
+        :return: List of (rows, squared_distances) per query, nearest first.
+        """
+        graph = self.hnsw or self.load_hnsw()
+        if ef_search is not None:
+            graph.set_ef(max(int(ef_search), k))
+        k = min(k, self.count)
+        rows, distances = graph.knn_query(np.atleast_2d(np.asarray(queries, dtype=np.float32)), k=k)
+        return list(zip(rows.astype(np.int64), distances))
+
+    def search(self, queries, k=5, approximate=False, ef_search=None, quantization=None, candidates=100,
+               filters=None):
+        """
+        Returns top-k results as (id, content, distance) tuples.
+
+        :param queries: A single embedding or a matrix of embeddings.
+        :param k: Number of results per query.
+        :param approximate: Use the HNSW graph instead of the exact scan.
+        :param ef_search: HNSW candidate list size.
+        :param quantization: 'halfvec', 'int8' or 'binary' for a quantized first
+                             pass with full-precision rerank.
+        :param candidates: First-pass candidates reranked per query.
+        :param filters: Metadata filters such as {'course': 'PHYS101'}; the matching
+                        rows are searched exactly, ignoring approximate and quantization.
+        :return: List of tuples for a single embedding, list of lists for a matrix.
+        """
+        single = np.asarray(queries).ndim == 1
+        if filters:
+            hits = self.search_exact(queries, k, self.filter_rows(filters))
+        elif quantization:
+            hits = self.search_quantized(queries, k, quantization, candidates)
+        elif approximate:
+            hits = self.search_approximate(queries, k, ef_search)
+        else:
+            hits = self.search_exact(queries, k)
+        results = [self._results(rows, distances) for rows, distances in hits]
+        return results[0] if single else results
+
+def stage_index(directory, keep_files=False, rewrite=()):
+    """
+    Creates the directory for the next version of the index at `directory`.
+
+    Versions are siblings named '<name>.v<suffix>'; nothing is visible to
+    readers until `publish_index` points `directory` at the new one.
+
+    :param directory: Index path (the symlink readers open).
+    :param keep_files: Hard-link the current version's files into the new one.
+    :param rewrite: With keep_files, names that the caller writes afresh and must not link.
+    :return: Path of the new version directory.
+    """
+    parent, name = os.path.split(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'{name}.v', dir=parent)
+    os.chmod(staging, 0o755)
+    current = os.path.realpath(directory)
+    if keep_files and os.path.isdir(current):
+        for file_name in os.listdir(current):
+            if file_name in rewrite:
+                continue
+            source = os.path.join(current, file_name)
+            try:
+                # Linked files are only ever read, never reopened for writing
+                os.link(source, os.path.join(staging, file_name))
+            except OSError:
+                shutil.copyfile(source, os.path.join(staging, file_name))
+    return staging
+
+def publish_index(directory, staging):
+    """
+    Atomically points `directory` at a version written by `stage_index`, then
+    removes versions older than the one it replaced.
+
+    Processes that mapped the replaced version keep their pages: removing a
+    mapped file on POSIX only drops its name.
+
+    :param directory: Index path (the symlink readers open).
+    :param staging: Complete version directory.
+    """
+    path = os.path.abspath(directory)
+    parent, name = os.path.split(path)
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    link = os.path.join(parent, f'.{name}.link.{os.getpid()}')
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(staging), link)
+    os.replace(link, path)
+    _open_indexes.pop(directory, None)
+
+    if previous is None:
+        return
+    # Versions staged after the previous one was finished may be builds still in progress
+    keep = {os.path.basename(previous), os.path.basename(staging)}
+    older = [
+        version for version in glob.glob(os.path.join(parent, glob.escape(name) + '.v*'))
+        if os.path.basename(version) not in keep and os.path.getmtime(version) < os.path.getmtime(previous)
+    ]
+    older.sort(key=os.path.getmtime, reverse=True)
+    for version in older[max(KEEP_OLD_VERSIONS - 1, 0):]:
+        shutil.rmtree(version, ignore_errors=True)
+
+def build_index(directory, ids, contents, vectors, metadata=None):
+    """
+    Writes a new version of a LocalVectorIndex directory and publishes it.
+
+    :param directory: Output directory.
+    :param ids: Sequence of integer ids.
+    :param contents: Sequence of strings, one per id.
+    :param vectors: float32 array of shape (len(ids), dim).
+    :param metadata: Optional dictionary of filter column -> sequence of strings, one per id.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    staging = stage_index(directory)
+    encoded = [content.encode('utf-8') for content in contents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    vectors.tofile(os.path.join(staging, 'vectors.f32'))
+    np.einsum('ij,ij->i', vectors, vectors).astype(np.float32).tofile(os.path.join(staging, 'norms.f32'))
+    np.asarray(ids, dtype=np.int64).tofile(os.path.join(staging, 'ids.i64'))
+    offsets.tofile(os.path.join(staging, 'offsets.i64'))
+    with open(os.path.join(staging, 'content.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    labels = {}
+    for column, values in (metadata or {}).items():
+        labels[column] = sorted(set(values))
+        codes = {label: code for code, label in enumerate(labels[column])}
+        np.array([codes[value] for value in values], dtype=np.int32).tofile(
+            os.path.join(staging, f'{column}.i32'))
+    # meta.json is written last; an index without it is incomplete
+    with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'dim': int(vectors.shape[1]), 'count': len(encoded), 'labels': labels}, f)
+    publish_index(directory, staging)
+
+def build_quantized(directory, kinds=QUANTIZATION_KINDS):
+    """
+    Publishes a new version of an index with compact copies of its vectors for quantized search.
+
+    :param directory: Index directory written by `build_index`.
+    :param kinds: Any of 'halfvec', 'int8', 'binary'.
+    """
+    index = LocalVectorIndex(directory)
+    vectors = index.vectors
+    files = {'halfvec': 'vectors.f16', 'int8': 'vectors.i8', 'binary': 'vectors.b1'}
+    staging = stage_index(directory, keep_files=True,
+                          rewrite=[files[kind] for kind in kinds] + ['int8_params.npz'])
+    if 'int8' in kinds:
+        offset, scale = fit_int8(np.asarray(vectors))
+        np.savez(os.path.join(staging, 'int8_params.npz'), offset=offset, scale=scale)
+    for kind in kinds:
+        with open(os.path.join(staging, files[kind]), 'wb') as f:
+            for start in range(0, index.count, BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + BLOCK_ROWS])
+                if kind == 'halfvec':
+                    codes = block.astype(np.float16)
+                elif kind == 'int8':
+                    codes = quantize_int8(block, offset, scale)
+                else:
+                    codes = quantize_binary(block)
+                f.write(codes.tobytes())
+    publish_index(directory, staging)
+
+def measure_quantized_recall(queries, k=10, kinds=QUANTIZATION_KINDS, candidates=100,
+                             directory=DEFAULT_INDEX_DIR):
+    """
+    Compares quantized search against the exact scan on the same index.
+
+    :param queries: float32 query embeddings of shape (num_queries, dim).
+    :param k: Number of results per query.
+    :param kinds: Quantization kinds to measure (their files must exist).
+    :param candidates: First-pass candidates reranked per query.
+    :param directory: Index directory.
+    :return: Dictionary of kind -> recall@k against the exact results.
+    """
+    index = get_local_index(directory)
+    exact = [rows.tolist() for rows, _ in index.search_exact(queries, k)]
+    recall = {}
+    for kind in kinds:
+        approximate = [rows.tolist() for rows, _ in index.search_quantized(queries, k, kind, candidates)]
+        recall[kind] = recall_at_k(approximate, exact)
+    return recall
+
+def build_hnsw(directory, m=16, ef_construction=200):
+    """
+    Publishes a new version of an index with the optional HNSW graph.
+
+    :param directory: Index directory written by `build_index`.
+    :param m: Graph degree.
+    :param ef_construction: Build-time candidate list size.
+    """
+    import hnswlib  # Optional dependency, only needed for approximate search
+    index = LocalVectorIndex(directory)
+    graph = hnswlib.Index(space='l2', dim=index.dim)
+    graph.init_index(max_elements=max(index.count, 1), M=m, ef_construction=ef_construction)
+    for start in range(0, index.count, BLOCK_ROWS):
+        block = np.asarray(index.vectors[start:start + BLOCK_ROWS])
+        graph.add_items(block, np.arange(start, start + len(block)))
+    staging = stage_index(directory, keep_files=True, rewrite=('hnsw.bin',))
+    graph.save_index(os.path.join(staging, 'hnsw.bin'))
+    publish_index(directory, staging)
+
+def export_from_postgres(directory, table='text_chunks', content_column='content', db_config=None):
+    """
+    Snapshots a pgvector table into a local index directory.
+
+    :param directory: Output directory.
+    :param table: 'text_chunks' or 'image_descriptions'.
+    :param content_column: Column returned as content ('content' or 'caption').
+    :param db_config: Database connection parameters (defaults to the environment).
+    """
+    from vector_db.db import get_connection
+
+    ids, contents, vectors = [], [], []
+    metadata = {'course': [], 'document_id': []}
+    with get_connection(db_config) as conn:
+        # Named cursor streams rows from the server instead of fetching them all
+        with conn.cursor(name='export_local_index') as cursor:
+            cursor.itersize = 10000
+            cursor.execute(f"SELECT id, {content_column}, course, document_id, embedding::text FROM {table} "
+                           f"WHERE embedding IS NOT NULL ORDER BY id")
+            for row_id, content, course, document_id, embedding in cursor:
+                ids.append(row_id)
+                contents.append(content or '')
+                metadata['course'].append(course)
+                metadata['document_id'].append(document_id)
+                vectors.append(np.array(json.loads(embedding), dtype=np.float32))
+    build_index(directory, ids, contents, np.stack(vectors) if vectors else np.empty((0, 0), np.float32),
+                metadata)
+    print(f"Exported {len(ids)} rows from {table} to {directory}")
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+def get_local_index(directory=DEFAULT_INDEX_DIR):
+    """
+    Returns the process-wide LocalVectorIndex for a directory, opening it on first
+    use and again whenever a build published a new version.
+    """
+    with _open_lock:
+        index = _open_indexes.get(directory)
+        # realpath is a few lstat calls, cheap next to a search
+        if index is None or index.version_dir != os.path.realpath(directory):
+            index = LocalVectorIndex(directory)
+            _open_indexes[directory] = index
+    return index
+
+def get_top_k_local(query, k=5, model_name='all-MiniLM-L6-v2', index_dir=DEFAULT_INDEX_DIR,
+                    approximate=False, ef_search=None, quantization=None, candidates=100, filters=None,
+                    query_embedding=None):
+    """
+    Retrieves the top k most similar text chunks to the query without a database.
+
+    :param query: User input query.
+    :param k: Number of top results to retrieve.
+    :param model_name: Name of the SentenceTransformer model.
+    :param index_dir: Local index directory.
+    :param approximate: Use the HNSW graph instead of the exact scan.
+    :param ef_search: HNSW candidate list size.
+    :param quantization: 'halfvec', 'int8' or 'binary' for a quantized first pass.
+    :param candidates: First-pass candidates reranked at full precision.
+    :param filters: Metadata filters such as {'course': 'PHYS101'}.
+    :param query_embedding: Embedding of query if the caller already computed it.
+    :return: List of tuples containing (id, content, distance).
+    """
+    from vector_db.embedding_cache import encode_query
+
+    query_emb = encode_query(query, model_name=model_name) if query_embedding is None else query_embedding
+    try:
+        return get_local_index(index_dir).search(query_emb, k, approximate, ef_search,
+                                                 quantization, candidates, filters)
+    except Exception as e:
+        print(f"Error retrieving embeddings from local index: {e}")
+        return []
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a local vector index from PostgreSQL.")
+    parser.add_argument('--dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--table', choices=('text_chunks', 'image_descriptions'), default='text_chunks')
+    parser.add_argument('--hnsw', action='store_true', help="Also build the HNSW graph (needs hnswlib).")
+    parser.add_argument('--quantize', nargs='*', choices=QUANTIZATION_KINDS,
+                        help="Also write compact vector copies for quantized search.")
+    args = parser.parse_args()
+
+    content_column = 'content' if args.table == 'text_chunks' else 'caption'
+    export_from_postgres(args.dir, args.table, content_column)
+    if args.hnsw:
+        build_hnsw(args.dir)
+    if args.quantize:
+        build_quantized(args.dir, args.quantize)
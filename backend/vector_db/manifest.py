@@ -0,0 +1,116 @@
+# vector_db/manifest.py
+import hashlib
+import json
+import os
+
+def hash_file(path, block_size=1 << 20):
+    """
+    Computes the SHA-256 of a file without reading it into memory at once.
+
+    :param path: Path to the file.
+    :param block_size: Read size in bytes.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_text(text):
+    """
+    Computes the SHA-256 of a text chunk.
+
+    :param text: Chunk content.
+    :return: Hex digest.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class IngestManifest:
+    """
+    Records the hash of every ingested PDF and of every chunk it produced.
+
+    The manifest is a JSON file of the form
+    {"config": {...}, "documents": {document_id: {"pdf_sha256": ..., "chunks": {number: sha256}}}}.
+    Changes are staged during a run and only written by `commit`, after the
+    database writes have succeeded, so an interrupted run is simply redone.
+    """
+
+    def __init__(self, path, config=None):
+        """
+        :param path: Location of the manifest JSON file.
+        :param config: Settings that affect chunk content or embeddings (chunk size,
+                       overlap, model name). If they differ from the stored ones,
+                       every document is treated as new.
+        """
+        self.path = path
+        self.config = config or {}
+        self.documents = {}
+        self.pending = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('config', {}) == self.config:
+                self.documents = data.get('documents', {})
+            else:
+                print("Ingestion settings changed; rebuilding all documents.")
+
+    def document_changed(self, document_id, pdf_path):
+        """
+        Checks whether a PDF differs from the version last ingested, and stages its hash.
+
+        :param document_id: Identifier of the document.
+        :param pdf_path: Path to the PDF file.
+        :return: True if the document must be (re)processed.
+        """
+        pdf_sha256 = hash_file(pdf_path)
+        entry = self.documents.get(document_id)
+        if entry and entry.get('pdf_sha256') == pdf_sha256:
+            return False
+        self.pending[document_id] = {'pdf_sha256': pdf_sha256, 'chunks': {}}
+        return True
+
+    def changed_chunks(self, document_id, chunk_hashes):
+        """
+        Compares chunk hashes with the last run and stages the new hashes.
+
+        :param document_id: Identifier of the document.
+        :param chunk_hashes: Dictionary mapping chunk number to content hash.
+        :return: Set of chunk numbers that are new or whose content changed.
+        """
+        previous = self.documents.get(document_id, {}).get('chunks', {})
+        pending = self.pending.setdefault(document_id, {'pdf_sha256': None, 'chunks': {}})
+        changed = set()
+        for chunk_number, chunk_hash in chunk_hashes.items():
+            pending['chunks'][str(chunk_number)] = chunk_hash
+            if previous.get(str(chunk_number)) != chunk_hash:
+                changed.add(chunk_number)
+        return changed
+
+    def discard(self, document_id):
+        """
+        Drops a document's staged entry, so the next run processes it again.
+
+        :param document_id: Identifier of the document.
+        """
+        self.pending.pop(document_id, None)
+
+    def pending_chunk_counts(self):
+        """
+        :return: Dictionary mapping each staged document to its new chunk count.
+        """
+        return {document_id: len(entry['chunks']) for document_id, entry in self.pending.items()}
+
+    def commit(self):
+        """
+        Applies the staged entries and atomically rewrites the manifest file.
+        """
+        self.documents.update(self.pending)
+        self.pending = {}
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'config': self.config, 'documents': self.documents}, f, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,79 @@
+# vector_db/quantization.py
+import numpy as np
+
+# Bytes per 384-dim vector: float32 1536, halfvec 768, int8 384, binary 48
+# Kinds are named after their pgvector types, so one name works on both backends
+QUANTIZATION_KINDS = ('halfvec', 'int8', 'binary')
+
+def fit_int8(vectors):
+    """
+    Fits per-dimension scalar quantization ranges.
+
+    :param vectors: float32 array of shape (n, dim).
+    :return: Tuple of (offset, scale) arrays of shape (dim,).
+    """
+    low = vectors.min(axis=0)
+    high = vectors.max(axis=0)
+    scale = np.maximum(high - low, 1e-12) / 255.0
+    return low.astype(np.float32), scale.astype(np.float32)
+
+def quantize_int8(vectors, offset, scale):
+    """
+    Maps each dimension linearly onto 0..255, stored as int8 (-128..127).
+    """
+    codes = np.rint((vectors - offset) / scale) - 128
+    return np.clip(codes, -128, 127).astype(np.int8)
+
+def dequantize_int8(codes, offset, scale):
+    return (codes.astype(np.float32) + 128) * scale + offset
+
+def quantize_binary(vectors):
+    """
+    Keeps one sign bit per dimension, packed 8 per byte.
+    """
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def hamming_distances(codes, query_code):
+    """
+    Hamming distance between every packed code and one packed query code.
+
+    :param codes: uint8 array of shape (n, dim / 8).
+    :param query_code: uint8 array of shape (dim / 8,).
+    :return: int array of shape (n,).
+    """
+    return _POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32)
+
+def approximate_distances(kind, codes, query, int8_params=None):
+    """
+    First-pass distances of one query against a block of compact codes.
+
+    Smaller is closer for every kind; values are only meant for ranking.
+
+    :param kind: 'halfvec', 'int8' or 'binary'.
+    :param codes: Block of codes for that kind.
+    :param query: float32 query vector.
+    :param int8_params: (offset, scale) from `fit_int8`, for 'int8'.
+    """
+    if kind == 'halfvec':
+        block = codes.astype(np.float32)
+        return np.einsum('ij,ij->i', block, block) - 2.0 * (block @ query)
+    if kind == 'int8':
+        block = dequantize_int8(codes, *int8_params)
+        return np.einsum('ij,ij->i', block, block) - 2.0 * (block @ query)
+    if kind == 'binary':
+        return hamming_distances(codes, quantize_binary(query))
+    raise ValueError(f"Unknown quantization kind: {kind}")
+
+def recall_at_k(approximate_ids, exact_ids):
+    """
+    Fraction of the exact top-k ids found by an approximate search, averaged over queries.
+
+    :param approximate_ids: One sequence of ids per query.
+    :param exact_ids: One sequence of ground-truth ids per query.
+    """
+    if not exact_ids:
+        return 0.0
+    found = sum(len(set(a) & set(e)) / max(len(e), 1) for a, e in zip(approximate_ids, exact_ids))
+    return found / len(exact_ids)
@@ -0,0 +1,204 @@
+# vector_db/query_cache.py
+from collections import OrderedDict
+import os
+import threading
+import time
+
+import numpy as np
+
+from vector_db.embedding_cache import encode_query, normalize_text
+from vector_db.retrieve import get_top_k_embeddings, VECTOR_BACKEND
+from vector_db.schema import get_corpus_version, filter_params
+
+VERSION_CHECK_INTERVAL = float(os.getenv('QUERY_CACHE_VERSION_CHECK', '2'))  # seconds
+
+class TTLLRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry when full and
+    treats entries older than ttl seconds as missing.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+def _settings_key(search_kwargs):
+    """
+    Hashable form of the search arguments; filters are normalized so that
+    'PHYS101' and ['PHYS101'] share an entry.
+    """
+    settings = dict(search_kwargs)
+    if settings.get('filters'):
+        settings['filters'] = tuple(
+            None if values is None else tuple(sorted(values))
+            for values in filter_params(settings['filters'])
+        )
+    else:
+        settings.pop('filters', None)
+    return tuple(sorted(settings.items()))
+
+class QueryCache:
+    """
+    Exact and semantic result caches for `get_top_k_embeddings`.
+
+    The exact cache is keyed by the normalized, case-folded query, k and the
+    search settings. The optional semantic cache returns the results of an
+    earlier query whose embedding has cosine similarity of at least
+    semantic_threshold with the new one. Entries are keyed by the backend
+    that answered them, and both caches are cleared whenever the corpus version
+    (bumped by ingestion) of a backend in use changes; each version is re-read
+    at most every VERSION_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, semantic_threshold=None,
+                 semantic_entries=1000, db_config=None):
+        """
+        :param max_entries: Size of the exact cache.
+        :param ttl: Seconds an entry stays valid.
+        :param semantic_threshold: Minimum cosine similarity for a semantic hit;
+                                   None disables the semantic cache.
+        :param semantic_entries: Size of the semantic cache.
+        :param db_config: Database connection parameters (defaults to the environment).
+        """
+        self.exact = TTLLRUCache(max_entries, ttl)
+        self.semantic = TTLLRUCache(semantic_entries, ttl)
+        self.semantic_threshold = semantic_threshold
+        self.db_config = db_config
+        self.versions = {}             # backend -> corpus version
+        self.versions_checked_at = {}  # backend -> time of the last check
+        self.stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def _corpus_version(self, backend):
+        if backend == 'local':
+            from vector_db.local_index import DEFAULT_INDEX_DIR
+            return os.path.getmtime(os.path.join(DEFAULT_INDEX_DIR, 'meta.json'))
+        return get_corpus_version(self.db_config)
+
+    def check_version(self, backend):
+        """
+        Clears both caches if ingestion changed backend's corpus since the last check.
+
+        :param backend: 'postgres' or 'local'.
+        """
+        now = time.monotonic()
+        if now - self.versions_checked_at.get(backend, 0.0) < VERSION_CHECK_INTERVAL:
+            return
+        try:
+            version = self._corpus_version(backend)
+        except Exception as e:
+            print(f"Error reading corpus version, clearing query cache: {e}")
+            version = None
+        with self.lock:
+            self.versions_checked_at[backend] = now
+            previous = self.versions.get(backend)
+            if version is None or version != previous:
+                # A backend's first version clears nothing: none of its entries exist yet
+                if previous is not None or version is None:
+                    self.stats['invalidations'] += 1
+                    self.exact.clear()
+                    self.semantic.clear()
+                self.versions[backend] = version
+
+    def _semantic_lookup(self, embedding, k, settings):
+        best_similarity, best_results = -1.0, None
+        now = time.monotonic()
+        for (cached_k, cached_settings, _), (entry, expires_at) in self.semantic.entries.items():
+            if cached_k < k or cached_settings != settings or expires_at < now:
+                continue
+            cached_embedding, results = entry
+            similarity = float(np.dot(embedding, cached_embedding))
+            if similarity > best_similarity:
+                best_similarity, best_results = similarity, results
+        if best_results is not None and best_similarity >= self.semantic_threshold:
+            return best_results[:k]
+        return None
+
+    def get_top_k(self, query, k=5, query_embedding=None, **search_kwargs):
+        """
+        Cached `get_top_k_embeddings`; takes the same arguments.
+
+        :param query_embedding: Embedding of query if the caller already computed it;
+                                used for the semantic lookup and the search.
+        :return: List of tuples containing (id, content, distance).
+        """
+        # Keyed by the backend that answers, so a per-call override neither
+        # shares entries with nor checks the version of the other store
+        backend = search_kwargs.get('backend') or VECTOR_BACKEND
+        self.check_version(backend)
+        settings = _settings_key(dict(search_kwargs, backend=backend))
+        key = (normalize_text(query).casefold(), k, settings)
+        with self.lock:
+            results = self.exact.get(key)
+        if results is not None:
+            self.stats['exact_hits'] += 1
+            return results
+
+        embedding = None
+        if self.semantic_threshold is not None:
+            if query_embedding is None:
+                query_embedding = encode_query(query, model_name=search_kwargs.get('model_name',
+                                                                                   'all-MiniLM-L6-v2'))
+            embedding = query_embedding / max(float(np.linalg.norm(query_embedding)), 1e-12)
+            with self.lock:
+                results = self._semantic_lookup(embedding, k, settings)
+            if results is not None:
+                self.stats['semantic_hits'] += 1
+                with self.lock:
+                    self.exact.put(key, results)
+                return results
+
+        self.stats['misses'] += 1
+        results = get_top_k_embeddings(query, k=k, query_embedding=query_embedding, **search_kwargs)
+        if results:
+            with self.lock:
+                self.exact.put(key, results)
+                if embedding is not None:
+                    # Semantic entries are matched by embedding, not by key text
+                    self.semantic.put((k, settings, key[0]), (embedding, results))
+        return results
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_query_cache(**kwargs):
+    """
+    Returns the process-wide QueryCache, creating it with kwargs on first use.
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            threshold = os.getenv('SEMANTIC_CACHE_THRESHOLD')
+            kwargs.setdefault('semantic_threshold', float(threshold) if threshold else None)
+            _default_cache = QueryCache(**kwargs)
+    return _default_cache
+
+def get_top_k_embeddings_cached(query, k=5, query_embedding=None, **search_kwargs):
+    """
+    `get_top_k_embeddings` through the process-wide query cache.
+    """
+    return get_query_cache().get_top_k(query, k, query_embedding, **search_kwargs)
@@ -0,0 +1,153 @@
+# vector_db/rerank.py
+# Run from backend/ with: python -m vector_db.rerank
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from vector_db.embedding_cache import normalize_text
+from vector_db.query_cache import TTLLRUCache
+from vector_db.retrieve import get_top_k_embeddings
+
+DEFAULT_RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+DEFAULT_BUDGET_MS = float(os.getenv('RERANK_BUDGET_MS', '150'))
+
+_models = {}
+_models_lock = threading.Lock()
+_pair_scores = TTLLRUCache(max_entries=int(os.getenv('RERANK_CACHE_SIZE', '100000')), ttl=24 * 3600)
+_pair_lock = threading.Lock()
+_batch_seconds = {}  # model_name -> duration of its latest batch, the estimate for the next
+
+def get_rerank_model(model_name=DEFAULT_RERANK_MODEL):
+    """
+    Returns the process-wide CrossEncoder for model_name, loading it on first use.
+
+    :param model_name: Name of the cross-encoder model.
+    :return: Loaded sentence_transformers CrossEncoder.
+    """
+    model = _models.get(model_name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(model_name)
+            if model is None:
+                from sentence_transformers import CrossEncoder
+                model = CrossEncoder(model_name, max_length=512)
+                _models[model_name] = model
+    return model
+
+def warm_up(model_name=DEFAULT_RERANK_MODEL, batch_size=16):
+    """
+    Loads the cross-encoder and times one full batch, so the first budget is
+    neither spent loading nor handed a batch it cannot afford.
+
+    :param model_name: Name of the cross-encoder model.
+    :param batch_size: Pairs per forward pass, as passed to `rerank`.
+    """
+    model = get_rerank_model(model_name)
+    pairs = [("warm up", "warm up")] * batch_size
+    # The first pass initializes the backend and is not representative
+    model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+    start = time.monotonic()
+    model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+    _batch_seconds[model_name] = time.monotonic() - start
+
+def _pair_key(model_name, query, content):
+    # Keyed by text rather than chunk id, so re-ingested chunks are rescored
+    digest = hashlib.sha1()
+    for part in (model_name, normalize_text(query).casefold(), content):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.digest()
+
+def rerank(query, candidates, n=5, model_name=DEFAULT_RERANK_MODEL, batch_size=16,
+           budget_ms=DEFAULT_BUDGET_MS):
+    """
+    Reorders retrieval candidates by cross-encoder relevance within a latency budget.
+
+    Candidates are scored in vector order, batch_size pairs per forward pass,
+    with cached pair scores reused. The model is loaded and timed (see
+    `warm_up`) before the budget starts, and every batch, the first included,
+    is only started if the duration of the latest batch fits in the remaining
+    budget; candidates left unscored keep their vector order after the scored ones.
+
+    :param query: User input query.
+    :param candidates: Tuples of (id, content, distance), nearest first.
+    :param n: Number of results to return.
+    :param model_name: Name of the cross-encoder model.
+    :param batch_size: Pairs scored per forward pass.
+    :param budget_ms: Time allowed for scoring; None for no limit.
+    :return: Top n tuples of (id, content, distance), best first.
+    """
+    if candidates and model_name not in _batch_seconds:
+        try:
+            warm_up(model_name, batch_size)
+        except Exception as e:
+            print(f"Error loading rerank model, keeping vector order: {e}")
+            return list(candidates[:n])
+
+    deadline = None if budget_ms is None else time.monotonic() + budget_ms / 1000.0
+    keys = [_pair_key(model_name, query, row[1]) for row in candidates]
+    scores = [None] * len(candidates)
+    with _pair_lock:
+        for i, key in enumerate(keys):
+            scores[i] = _pair_scores.get(key)
+
+    pending = [i for i, score in enumerate(scores) if score is None]
+    try:
+        model = get_rerank_model(model_name)
+        for start in range(0, len(pending), batch_size):
+            if deadline is not None and time.monotonic() + _batch_seconds.get(model_name, 0.0) > deadline:
+                print(f"Rerank budget of {budget_ms:.0f}ms reached after "
+                      f"{start} of {len(pending)} uncached pairs")
+                break
+            batch = pending[start:start + batch_size]
+            batch_start = time.monotonic()
+            batch_scores = model.predict([(query, candidates[i][1]) for i in batch],
+                                         batch_size=batch_size, show_progress_bar=False)
+            _batch_seconds[model_name] = time.monotonic() - batch_start
+            with _pair_lock:
+                for i, score in zip(batch, np.asarray(batch_scores, dtype=np.float32)):
+                    scores[i] = float(score)
+                    _pair_scores.put(keys[i], scores[i])
+    except Exception as e:
+        print(f"Error reranking, keeping vector order: {e}")
+
+    # Scoring runs in vector order, so the scored rows are the nearest ones
+    scored = sorted((i for i, score in enumerate(scores) if score is not None),
+                    key=lambda i: -scores[i])
+    unscored = [i for i, score in enumerate(scores) if score is None]
+    return [candidates[i] for i in (scored + unscored)[:n]]
+
+def get_top_k_reranked(query, n=5, candidates=50, model_name=DEFAULT_RERANK_MODEL,
+                       batch_size=16, budget_ms=DEFAULT_BUDGET_MS, **search_kwargs):
+    """
+    Over-fetches candidates with `get_top_k_embeddings` and keeps the best n after reranking.
+
+    A short, well-ordered context keeps LLM prefill cheap compared with passing
+    every candidate to the prompt.
+
+    :param query: User input query.
+    :param n: Number of results to return.
+    :param candidates: Number of vector search candidates to rerank.
+    :param model_name: Name of the cross-encoder model.
+    :param batch_size: Pairs scored per forward pass.
+    :param budget_ms: Time allowed for scoring; the vector order is used once it runs out.
+    :param search_kwargs: Passed to `get_top_k_embeddings` (e.g. filters, ef_search).
+    :return: List of tuples containing (id, content, distance).
+    """
+    # get_top_k_embeddings raises hnsw.ef_search to k, so all candidates come back
+    rows = get_top_k_embeddings(query, k=max(candidates, n), **search_kwargs)
+    return rerank(query, rows, n, model_name, batch_size, budget_ms)
+
+if __name__ == "__main__":
+    user_query = "Explain the data processing pipeline diagram."
+    top_n = 3
+    warm_up()
+    start = time.monotonic()
+    results = get_top_k_reranked(user_query, n=top_n)
+    print(f"Top {top_n} reranked results in {(time.monotonic() - start) * 1000:.0f}ms "
+          f"for query: '{user_query}'\n")
+    for res in results:
+        print(f"ID: {res[0]}, Distance: {res[2]:.4f}\nContent: {res[1]}\n")
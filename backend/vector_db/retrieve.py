@@ -1,58 +1,203 @@
 # vector_db/retrieve.py
-from sentence_transformers import SentenceTransformer
-import psycopg2
+# Run from backend/ with: python -m vector_db.retrieve
+import itertools
 import os
-from dotenv import load_dotenv
-import numpy as np
+from vector_db.embedding_cache import encode_query
+from vector_db.db import get_connection, execute_prepared, to_vector_literal
+from vector_db.schema import (
+    apply_search_settings, filter_params, filter_sql, prepared_variants, EMBEDDING_DIM,
+)
 
-load_dotenv()  # Load environment variables from .env file
+# 'postgres' or 'local' (memory-mapped index from vector_db.local_index)
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'postgres')
+# Default first-pass quantization, e.g. 'halfvec' once the float32 HNSW index
+# was dropped (see schema.build_quantized_index); unset searches full precision.
+VECTOR_QUANTIZATION = os.getenv('VECTOR_QUANTIZATION') or None
 
-def get_db_config():
-    """
-    Retrieves database configuration from environment variables.
-    
-    :return: Dictionary containing database connection parameters.
-    """
-    return {
-        'dbname': os.getenv('DB_NAME', 'rag_db'),
-        'user': os.getenv('DB_USER', 'postgres'),
-        'password': os.getenv('DB_PASSWORD', 'your_password'),
-        'host': os.getenv('DB_HOST', 'localhost'),
-        'port': os.getenv('DB_PORT', '5432')
-    }
+# PostgreSQL uses <-> for distance; assuming Euclidean distance.
+# Ordering by the operator expression itself lets the planner use the ANN index.
+TOP_K_SQL = """
+    SELECT id, content, embedding <-> %s::vector AS distance
+    FROM text_chunks
+    ORDER BY embedding <-> %s::vector
+    LIMIT %s
+"""
+# Filters go inside the WHERE of the indexed scan (see schema.prepared_variants).
+TOP_K_PREPARED, TOP_K_FILTERED = prepared_variants("""(vector, int) AS
+    SELECT id, content, embedding <-> $1 AS distance
+    FROM text_chunks
+    WHERE {filters}
+    ORDER BY embedding <-> $1
+    LIMIT $2
+""")
+# First pass over a quantized expression index (see schema.build_quantized_index)
+# fetches $3 candidates; the outer query reranks them with the full-precision column.
+QUANTIZED_TOP_K_TEMPLATE = """(vector, int, int) AS
+    SELECT id, content, embedding <-> $1 AS distance
+    FROM (
+        SELECT id, content, embedding
+        FROM text_chunks
+        WHERE {filters}
+        ORDER BY %s
+        LIMIT $3
+    ) AS candidates
+    ORDER BY distance
+    LIMIT $2
+"""
+QUANTIZED_ORDER = {
+    'halfvec': f"embedding::halfvec({EMBEDDING_DIM}) <-> $1::halfvec({EMBEDDING_DIM})",
+    'binary': f"binary_quantize(embedding)::bit({EMBEDDING_DIM}) <~> binary_quantize($1)",
+}
+QUANTIZED_TOP_K_PREPARED = {
+    kind: prepared_variants(QUANTIZED_TOP_K_TEMPLATE % order) for kind, order in QUANTIZED_ORDER.items()
+}
+# One round trip for many queries: every VALUES row drives its own indexed top-k.
+BATCH_TOP_K_SQL = b"""
+    SELECT q.query_index, r.id, r.content, r.distance
+    FROM (VALUES %s) AS q(query_index, embedding)
+    CROSS JOIN LATERAL (
+        SELECT id, content, embedding <-> q.embedding AS distance
+        FROM text_chunks
+        WHERE %s
+        ORDER BY embedding <-> q.embedding
+        LIMIT %d
+    ) AS r
+    ORDER BY q.query_index, r.distance
+"""
 
-def get_top_k_embeddings(query, k=5, model_name='all-MiniLM-L6-v2'):
+def get_top_k_embeddings(query, k=5, model_name='all-MiniLM-L6-v2', prepared=True,
+                         ef_search=None, probes=None, backend=None, quantization=None,
+                         rerank_candidates=100, filters=None, query_embedding=None):
     """
     Retrieves the top k most similar text chunks to the query.
     
     :param query: User input query.
     :param k: Number of top results to retrieve.
     :param model_name: Name of the SentenceTransformer model.
+    :param prepared: Use a server-side prepared statement on the pooled connection.
+    :param ef_search: HNSW search breadth for this query (higher = better recall, slower);
+                      always at least k.
+    :param probes: IVFFlat lists scanned for this query (higher = better recall, slower).
+    :param backend: 'postgres' or 'local'; defaults to the VECTOR_BACKEND environment variable.
+                    The local backend searches exactly unless ef_search is given.
+    :param quantization: Search a quantized index first and rerank rerank_candidates
+                         rows at full precision: 'halfvec' or 'binary' on Postgres,
+                         'halfvec', 'int8' or 'binary' on the local backend.
+                         Defaults to the VECTOR_QUANTIZATION environment variable.
+    :param rerank_candidates: First-pass candidates; ef_search is raised to at least this.
+    :param filters: Metadata filters such as {'course': 'PHYS101'} or
+                    {'document_id': ['notes', 'slides']}, applied inside the indexed
+                    search. Filtered searches always use prepared statements.
+    :param query_embedding: Embedding of query if the caller already computed it.
     :return: List of tuples containing (id, content, distance).
     """
-    model = SentenceTransformer(model_name)
-    query_emb = model.encode(query)
+    quantization = quantization or VECTOR_QUANTIZATION
+    if (backend or VECTOR_BACKEND) == 'local':
+        from vector_db.local_index import get_top_k_local
+        return get_top_k_local(query, k, model_name, approximate=ef_search is not None,
+                               ef_search=ef_search, quantization=quantization,
+                               candidates=rerank_candidates, filters=filters,
+                               query_embedding=query_embedding)
+
+    query_emb = encode_query(query, model_name=model_name) if query_embedding is None else query_embedding
+    # Validates the filters before touching the database
+    extra = filter_params(filters) if filters else ()
+    variant = 1 if filters else 0
+    suffix = '_filtered' if filters else ''
+    # The quantized first pass must be allowed to return every candidate
+    scan_rows = max(int(rerank_candidates), k) if quantization else k
     
-    db_config = get_db_config()
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        # PostgreSQL uses <-> for distance; assuming Euclidean distance
-        query_sql = """
-            SELECT id, content, embedding <-> %s AS distance
-            FROM text_chunks
-            ORDER BY distance
-            LIMIT %s
-        """
-        cursor.execute(query_sql, (query_emb.tolist(), k))
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return results
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                apply_search_settings(cursor, ef_search, probes, filtered=bool(filters), k=scan_rows)
+                vector = to_vector_literal(query_emb)
+                if quantization:
+                    if quantization not in QUANTIZED_TOP_K_PREPARED:
+                        raise ValueError(f"Unknown quantization for PostgreSQL: {quantization}")
+                    execute_prepared(cursor, f'top_k_text_chunks_{quantization}{suffix}',
+                                     QUANTIZED_TOP_K_PREPARED[quantization][variant],
+                                     (vector, k, scan_rows) + extra)
+                elif filters:
+                    execute_prepared(cursor, 'top_k_text_chunks_filtered', TOP_K_FILTERED,
+                                     (vector, k) + extra)
+                elif prepared:
+                    execute_prepared(cursor, 'top_k_text_chunks', TOP_K_PREPARED, (vector, k))
+                else:
+                    cursor.execute(TOP_K_SQL, (vector, vector, k))
+                return cursor.fetchall()
     except Exception as e:
         print(f"Error retrieving embeddings: {e}")
         return []
 
+def iter_top_k_embeddings(queries, k=5, model_name='all-MiniLM-L6-v2', encode_batch_size=1024,
+                          db_batch_size=256, ef_search=None, probes=None, backend=None, filters=None):
+    """
+    Retrieves the top k text chunks for many queries, streaming results per query.
+
+    Queries are encoded encode_batch_size at a time and searched db_batch_size
+    at a time, each search batch in a single database round trip.
+
+    :param queries: Iterable of query strings.
+    :param k: Number of top results per query.
+    :param model_name: Name of the SentenceTransformer model.
+    :param encode_batch_size: Number of queries encoded together.
+    :param db_batch_size: Number of queries per database round trip.
+    :param ef_search: HNSW search breadth.
+    :param probes: IVFFlat lists scanned.
+    :param backend: 'postgres' or 'local'; defaults to the VECTOR_BACKEND environment variable.
+    :param filters: Metadata filters applied to every query (see `get_top_k_embeddings`).
+    :return: Generator of (query, results) pairs in input order, results as in
+             `get_top_k_embeddings`.
+    """
+    queries = iter(queries)
+    while True:
+        batch = list(itertools.islice(queries, encode_batch_size))
+        if not batch:
+            return
+        embeddings = encode_query(batch, model_name=model_name)
+        for start in range(0, len(batch), db_batch_size):
+            sub_queries = batch[start:start + db_batch_size]
+            sub_embeddings = embeddings[start:start + db_batch_size]
+            if (backend or VECTOR_BACKEND) == 'local':
+                from vector_db.local_index import get_local_index
+                results = get_local_index().search(sub_embeddings, k, approximate=ef_search is not None,
+                                                   ef_search=ef_search, filters=filters)
+            else:
+                results = _search_batch(sub_embeddings, k, ef_search, probes, filters)
+            yield from zip(sub_queries, results)
+
+def _search_batch(embeddings, k, ef_search=None, probes=None, filters=None):
+    """
+    Runs top-k for a batch of query embeddings in one LATERAL join.
+
+    :return: One list of (id, content, distance) tuples per embedding.
+    """
+    results = [[] for _ in range(len(embeddings))]
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                apply_search_settings(cursor, ef_search, probes, filtered=bool(filters), k=k)
+                values = b','.join(
+                    cursor.mogrify("(%s, %s::vector)", (i, to_vector_literal(embedding)))
+                    for i, embedding in enumerate(embeddings)
+                )
+                # Literal filter values let the planner pick a course's partial index
+                cursor.execute(BATCH_TOP_K_SQL % (values, filter_sql(cursor, filters), int(k)))
+                for query_index, id_, content, distance in cursor:
+                    results[query_index].append((id_, content, distance))
+    except Exception as e:
+        print(f"Error retrieving batch embeddings: {e}")
+    return results
+
+def get_top_k_embeddings_batch(queries, k=5, **kwargs):
+    """
+    List form of `iter_top_k_embeddings`.
+
+    :return: One list of (id, content, distance) tuples per query.
+    """
+    return [results for _, results in iter_top_k_embeddings(queries, k, **kwargs)]
+
 if __name__ == "__main__":
     user_query = "Explain the data processing pipeline diagram."
     top_k = 3
@@ -61,4 +206,3 @@ if __name__ == "__main__":
     print(f"Top {top_k} results for query: '{user_query}'\n")
     for res in results:
         print(f"ID: {res[0]}, Distance: {res[2]:.4f}\nContent: {res[1]}\n")
-
@@ -1,62 +1,116 @@
 # vector_db/retrieve_combined.py
-from sentence_transformers import SentenceTransformer
-import psycopg2
-import os
-from dotenv import load_dotenv
+# Run from backend/ with: python -m vector_db.retrieve_combined
+from vector_db.embedding_cache import encode_query
+from vector_db.db import get_connection, execute_prepared, to_vector_literal
+from vector_db.retrieve import (
+    TOP_K_PREPARED as TEXT_TOP_K_PREPARED, TOP_K_FILTERED as TEXT_TOP_K_FILTERED,
+)
+from vector_db.schema import apply_search_settings, filter_params, prepared_variants
 
-load_dotenv()
+IMAGE_TOP_K_PREPARED, IMAGE_TOP_K_FILTERED = prepared_variants("""(vector, int) AS
+    SELECT id, caption, embedding <-> $1 AS distance
+    FROM image_descriptions
+    WHERE {filters}
+    ORDER BY embedding <-> $1
+    LIMIT $2
+""")
+# Both modalities in one round trip; each branch keeps its own ORDER BY/LIMIT
+# so both can use their ANN index.
+COMBINED_TOP_K_PREPARED, COMBINED_TOP_K_FILTERED = prepared_variants("""(vector, int) AS
+    (SELECT 'text' AS source, id, content AS text, embedding <-> $1 AS distance
+     FROM text_chunks
+     WHERE {filters}
+     ORDER BY embedding <-> $1
+     LIMIT $2)
+    UNION ALL
+    (SELECT 'image' AS source, id, caption AS text, embedding <-> $1 AS distance
+     FROM image_descriptions
+     WHERE {filters}
+     ORDER BY embedding <-> $1
+     LIMIT $2)
+""")
 
-def get_db_config():
-    return {
-        'dbname': os.getenv('DB_NAME', 'rag_db'),
-        'user': os.getenv('DB_USER', 'postgres'),
-        'password': os.getenv('DB_PASSWORD', 'your_password'),
-        'host': os.getenv('DB_HOST', 'localhost'),
-        'port': os.getenv('DB_PORT', '5432')
-    }
+def _top_k(name, statements, query, k, model_name, ef_search, probes, filters):
+    """
+    Encodes the query and runs the unfiltered or filtered form of a prepared top-k statement.
+    """
+    query_emb = encode_query(query, model_name=model_name)
+    extra = filter_params(filters) if filters else ()
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            apply_search_settings(cursor, ef_search, probes, filtered=bool(filters), k=k)
+            if filters:
+                execute_prepared(cursor, f'{name}_filtered', statements[1],
+                                 (to_vector_literal(query_emb), k) + extra)
+            else:
+                execute_prepared(cursor, name, statements[0], (to_vector_literal(query_emb), k))
+            return cursor.fetchall()
 
-def retrieve_text_chunks(query, k=5, model_name='all-MiniLM-L6-v2'):
-    model = SentenceTransformer(model_name)
-    query_emb = model.encode(query)
-    
-    db_config = get_db_config()
+def fuse_results(rows, k, fusion='distance', rrf_k=60):
+    """
+    Merges per-modality results into one ranking.
+
+    Chunks and captions are embedded by the same model, so their distances are
+    directly comparable and 'distance' fusion simply sorts by them. 'rrf'
+    (reciprocal rank fusion) ignores distances and scores 1 / (rrf_k + rank)
+    within each modality, which balances the modalities regardless of scale.
+
+    :param rows: Tuples of (source, id, text, distance).
+    :param k: Number of fused results to return.
+    :param fusion: 'distance' or 'rrf'.
+    :param rrf_k: RRF damping constant.
+    :return: Top k tuples of (source, id, text, distance), best first.
+    """
+    if fusion == 'distance':
+        return sorted(rows, key=lambda row: row[3])[:k]
+    if fusion != 'rrf':
+        raise ValueError(f"Unknown fusion method: {fusion}")
+    scored = []
+    for source in {row[0] for row in rows}:
+        ranked = sorted((row for row in rows if row[0] == source), key=lambda row: row[3])
+        scored.extend((1.0 / (rrf_k + rank), row) for rank, row in enumerate(ranked, start=1))
+    scored.sort(key=lambda item: (-item[0], item[1][3]))
+    return [row for _, row in scored[:k]]
+
+def retrieve_combined(query, k=5, model_name='all-MiniLM-L6-v2', fusion='distance',
+                      ef_search=None, probes=None, filters=None):
+    """
+    Retrieves text chunks and image captions for a query with a single encode
+    and a single database round trip, fused into one ranking.
+
+    :param query: User input query.
+    :param k: Number of fused results to return; each modality contributes up to k.
+    :param model_name: Name of the SentenceTransformer model.
+    :param fusion: 'distance' or 'rrf' (see `fuse_results`).
+    :param ef_search: HNSW search breadth for this query.
+    :param probes: IVFFlat lists scanned for this query.
+    :param filters: Metadata filters such as {'course': 'PHYS101'}, applied inside
+                    both indexed searches (see `vector_db.schema.filter_params`).
+    :return: List of tuples containing (source, id, text, distance), source being
+             'text' or 'image'.
+    """
+    try:
+        rows = _top_k('top_k_combined', (COMBINED_TOP_K_PREPARED, COMBINED_TOP_K_FILTERED),
+                      query, k, model_name, ef_search, probes, filters)
+    except Exception as e:
+        print(f"Error retrieving combined embeddings: {e}")
+        return []
+    return fuse_results(rows, k, fusion)
+
+def retrieve_text_chunks(query, k=5, model_name='all-MiniLM-L6-v2', ef_search=None, probes=None,
+                         filters=None):
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        query_sql = """
-            SELECT id, content, embedding <-> %s AS distance
-            FROM text_chunks
-            ORDER BY distance
-            LIMIT %s
-        """
-        cursor.execute(query_sql, (query_emb.tolist(), k))
-        text_results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return text_results
+        return _top_k('top_k_text_chunks', (TEXT_TOP_K_PREPARED, TEXT_TOP_K_FILTERED),
+                      query, k, model_name, ef_search, probes, filters)
     except Exception as e:
         print(f"Error retrieving text embeddings: {e}")
         return []
 
-def retrieve_image_captions(query, k=5, model_name='all-MiniLM-L6-v2'):
-    model = SentenceTransformer(model_name)
-    query_emb = model.encode(query)
-    
-    db_config = get_db_config()
+def retrieve_image_captions(query, k=5, model_name='all-MiniLM-L6-v2', ef_search=None, probes=None,
+                            filters=None):
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        query_sql = """
-            SELECT id, caption, embedding <-> %s AS distance
-            FROM image_descriptions
-            ORDER BY distance
-            LIMIT %s
-        """
-        cursor.execute(query_sql, (query_emb.tolist(), k))
-        image_results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return image_results
+        return _top_k('top_k_image_captions', (IMAGE_TOP_K_PREPARED, IMAGE_TOP_K_FILTERED),
+                      query, k, model_name, ef_search, probes, filters)
     except Exception as e:
         print(f"Error retrieving image embeddings: {e}")
         return []
@@ -65,14 +119,8 @@ if __name__ == "__main__":
     user_query = "Describe the data flow in the system."
     top_k = 3
     
-    text_results = retrieve_text_chunks(user_query, k=top_k)
-    image_results = retrieve_image_captions(user_query, k=top_k)
-    
-    print(f"Top {top_k} Text Chunks:\n")
-    for res in text_results:
-        print(f"ID: {res[0]}, Distance: {res[2]:.4f}\nContent: {res[1]}\n")
+    results = retrieve_combined(user_query, k=top_k)
     
-    print(f"Top {top_k} Image Captions:\n")
-    for res in image_results:
-        print(f"ID: {res[0]}, Distance: {res[2]:.4f}\nCaption: {res[1]}\n")
-
+    print(f"Top {top_k} Results:\n")
+    for source, id_, text, distance in results:
+        print(f"[{source}] ID: {id_}, Distance: {distance:.4f}\n{text}\n")
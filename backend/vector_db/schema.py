@@ -0,0 +1,426 @@
+# vector_db/schema.py
+# Run from backend/ with: python -m vector_db.schema migrate
+import argparse
+import hashlib
+import os
+import re
+
+from vector_db.db import get_connection
+
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+
+# all-MiniLM-L6-v2 returns unit-length vectors, for which L2 distance, cosine
+# distance and negative inner product give the same ranking. The retrieval
+# queries order by `<->`, so the indexes use the matching L2 operator class.
+VECTOR_OPCLASS = 'vector_l2_ops'
+VECTOR_TABLES = ('text_chunks', 'image_descriptions')
+TEXT_SEARCH_CONFIG = 'english'  # Full-text configuration of the lexical index
+DEFAULT_COURSE = 'default'
+# Metadata columns retrieval can filter on, in filter parameter order
+FILTER_COLUMNS = ('course', 'document_id')
+# pgvector >= 0.8: keep walking the HNSW graph until k rows pass the filters,
+# so a filtered query without a matching course index still returns k rows.
+# 'strict_order' keeps results sorted by distance; 'relaxed_order' is faster
+# but may return them slightly out of order; 'off' filters the first
+# hnsw.ef_search candidates only. Older pgvector versions ignore the setting.
+HNSW_ITERATIVE_SCAN = os.getenv('HNSW_ITERATIVE_SCAN', 'strict_order')
+HNSW_DEFAULT_EF_SEARCH = 40  # pgvector's hnsw.ef_search default
+
+# Applied in order; each version runs once and is recorded in schema_migrations.
+MIGRATIONS = [
+    (1, 'create tables', f"""
+        CREATE EXTENSION IF NOT EXISTS vector;
+        CREATE TABLE IF NOT EXISTS text_chunks (
+            id BIGSERIAL PRIMARY KEY,
+            document_id TEXT NOT NULL,
+            page_number INTEGER,
+            content TEXT NOT NULL,
+            embedding vector({EMBEDDING_DIM})
+        );
+        CREATE TABLE IF NOT EXISTS image_descriptions (
+            id BIGSERIAL PRIMARY KEY,
+            document_id TEXT NOT NULL,
+            page_number INTEGER,
+            image_path TEXT,
+            caption TEXT,
+            embedding vector({EMBEDDING_DIM})
+        );
+        CREATE INDEX IF NOT EXISTS text_chunks_document_page_idx
+            ON text_chunks (document_id, page_number);
+        CREATE INDEX IF NOT EXISTS image_descriptions_document_page_idx
+            ON image_descriptions (document_id, page_number);
+    """),
+    (2, 'hnsw indexes', f"""
+        CREATE INDEX IF NOT EXISTS text_chunks_embedding_ann_idx
+            ON text_chunks USING hnsw (embedding {VECTOR_OPCLASS});
+        CREATE INDEX IF NOT EXISTS image_descriptions_embedding_ann_idx
+            ON image_descriptions USING hnsw (embedding {VECTOR_OPCLASS});
+    """),
+    (3, 'lexical index', f"""
+        ALTER TABLE text_chunks ADD COLUMN IF NOT EXISTS content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', content)) STORED;
+        CREATE INDEX IF NOT EXISTS text_chunks_content_tsv_idx
+            ON text_chunks USING gin (content_tsv);
+    """),
+    (4, 'corpus version', """
+        CREATE TABLE IF NOT EXISTS corpus_version (
+            id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            version BIGINT NOT NULL
+        );
+        INSERT INTO corpus_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+    """),
+    (5, 'documents and courses', f"""
+        CREATE TABLE IF NOT EXISTS documents (
+            document_id TEXT PRIMARY KEY,
+            course TEXT NOT NULL DEFAULT '{DEFAULT_COURSE}',
+            source_path TEXT,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        INSERT INTO documents (document_id)
+            SELECT document_id FROM text_chunks
+            UNION SELECT document_id FROM image_descriptions
+            ON CONFLICT (document_id) DO NOTHING;
+        ALTER TABLE text_chunks ADD COLUMN IF NOT EXISTS course TEXT NOT NULL DEFAULT '{DEFAULT_COURSE}';
+        ALTER TABLE image_descriptions ADD COLUMN IF NOT EXISTS course TEXT NOT NULL DEFAULT '{DEFAULT_COURSE}';
+        CREATE INDEX IF NOT EXISTS text_chunks_course_document_idx
+            ON text_chunks (course, document_id);
+        CREATE INDEX IF NOT EXISTS image_descriptions_course_document_idx
+            ON image_descriptions (course, document_id);
+    """),
+    # Chunks used to store their position in page_number; the source page is
+    # unknown for those rows until their document is re-ingested.
+    (6, 'chunk numbers', """
+        ALTER TABLE text_chunks ADD COLUMN IF NOT EXISTS chunk_number INTEGER;
+        UPDATE text_chunks SET chunk_number = page_number, page_number = NULL
+            WHERE chunk_number IS NULL;
+        CREATE INDEX IF NOT EXISTS text_chunks_document_chunk_idx
+            ON text_chunks (document_id, chunk_number);
+    """),
+    # Keeps the newest row of each chunk, then lets the database reject duplicates
+    (7, 'unique chunk numbers', """
+        DELETE FROM text_chunks older
+            USING text_chunks newer
+            WHERE older.document_id = newer.document_id
+              AND older.chunk_number = newer.chunk_number
+              AND older.id < newer.id;
+        CREATE UNIQUE INDEX IF NOT EXISTS text_chunks_document_chunk_key
+            ON text_chunks (document_id, chunk_number);
+        DROP INDEX IF EXISTS text_chunks_document_chunk_idx;
+    """),
+]
+
+def migrate(db_config=None):
+    """
+    Applies every migration newer than the database's recorded version.
+
+    :param db_config: Database connection parameters (defaults to the environment).
+    :return: List of applied migration versions.
+    """
+    applied = []
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            # Serialize concurrent migrators
+            cursor.execute("LOCK TABLE schema_migrations IN EXCLUSIVE MODE")
+            cursor.execute("SELECT coalesce(max(version), 0) FROM schema_migrations")
+            current = cursor.fetchone()[0]
+            for version, name, sql in MIGRATIONS:
+                if version <= current:
+                    continue
+                print(f"Applying migration {version}: {name}")
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                               (version, name))
+                applied.append(version)
+    return applied
+
+def rebuild_ann_index(table, method='hnsw', m=16, ef_construction=64, lists=None,
+                      maintenance_work_mem='1GB', db_config=None):
+    """
+    Replaces the ANN index of a vector table, e.g. after a bulk load or to switch method.
+
+    :param table: 'text_chunks' or 'image_descriptions'.
+    :param method: 'hnsw' (better recall/speed, slower build) or 'ivfflat' (fast build,
+                   needs data present when built).
+    :param m: HNSW graph degree.
+    :param ef_construction: HNSW build-time candidate list size.
+    :param lists: IVFFlat list count; defaults to rows/1000, or sqrt(rows) above 1M rows.
+    :param maintenance_work_mem: Memory for the build; HNSW builds much faster in memory.
+    :param db_config: Database connection parameters (defaults to the environment).
+    """
+    if table not in VECTOR_TABLES:
+        raise ValueError(f"Unknown vector table: {table}")
+    index_name = f"{table}_embedding_ann_idx"
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT set_config('maintenance_work_mem', %s, true)", (maintenance_work_mem,))
+            if method == 'hnsw':
+                options = f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+            elif method == 'ivfflat':
+                if lists is None:
+                    cursor.execute(f"SELECT count(*) FROM {table}")
+                    rows = cursor.fetchone()[0]
+                    lists = rows // 1000 if rows <= 1_000_000 else int(rows ** 0.5)
+                options = f"WITH (lists = {max(int(lists), 1)})"
+            else:
+                raise ValueError(f"Unknown ANN method: {method}")
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+            print(f"Building {method} index on {table}...")
+            cursor.execute(
+                f"CREATE INDEX {index_name} ON {table} USING {method} (embedding {VECTOR_OPCLASS}) {options}"
+            )
+            cursor.execute(f"ANALYZE {table}")
+
+# pgvector expression indexes over compact copies of `embedding`. The index
+# stores only the quantized codes; the full-precision column stays in the heap
+# for reranking (see QUANTIZED_TOP_K_PREPARED in vector_db.retrieve).
+QUANTIZED_INDEX_EXPRESSIONS = {
+    'halfvec': (f"(embedding::halfvec({EMBEDDING_DIM}))", 'halfvec_l2_ops'),
+    'binary': (f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))", 'bit_hamming_ops'),
+}
+
+def build_quantized_index(table, kind='halfvec', m=16, ef_construction=64,
+                          maintenance_work_mem='1GB', drop_full_index=False, db_config=None):
+    """
+    Builds an HNSW index over a quantized expression of the embedding column.
+
+    Needs pgvector 0.7 or newer. 'halfvec' halves the index size with almost no
+    recall loss; 'binary' shrinks it 32x and relies on the rerank to recover recall.
+    Memory only shrinks once the float32 index is dropped (drop_full_index); set
+    VECTOR_QUANTIZATION to the same kind so retrieval uses the quantized index.
+    Searches that stay at full precision (hybrid search, batch retrieval) then
+    scan exactly; `rebuild_ann_index` restores the float32 index.
+
+    :param table: 'text_chunks' or 'image_descriptions'.
+    :param kind: 'halfvec' or 'binary'.
+    :param m: HNSW graph degree.
+    :param ef_construction: HNSW build-time candidate list size.
+    :param maintenance_work_mem: Memory for the build.
+    :param drop_full_index: Drop the float32 HNSW index once the quantized one is built.
+    :param db_config: Database connection parameters (defaults to the environment).
+    """
+    if table not in VECTOR_TABLES:
+        raise ValueError(f"Unknown vector table: {table}")
+    if kind not in QUANTIZED_INDEX_EXPRESSIONS:
+        raise ValueError(f"Unknown quantized index kind: {kind}")
+    expression, opclass = QUANTIZED_INDEX_EXPRESSIONS[kind]
+    index_name = f"{table}_embedding_{kind}_idx"
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT set_config('maintenance_work_mem', %s, true)", (maintenance_work_mem,))
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+            print(f"Building {kind} index on {table}...")
+            cursor.execute(
+                f"CREATE INDEX {index_name} ON {table} USING hnsw ({expression} {opclass}) "
+                f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+            )
+            if drop_full_index:
+                print(f"Dropping the float32 index on {table}...")
+                cursor.execute(f"DROP INDEX IF EXISTS {table}_embedding_ann_idx")
+            cursor.execute(f"ANALYZE {table}")
+
+def course_index_name(table, course):
+    """
+    Name of the per-course partial ANN index, within PostgreSQL's 63-byte limit.
+    """
+    slug = re.sub(r'[^a-z0-9]+', '_', course.lower()).strip('_')[:24]
+    digest = hashlib.sha1(course.encode('utf-8')).hexdigest()[:8]
+    return f"{table}_embedding_{slug}_{digest}_idx"
+
+def create_course_index(table, course, m=16, ef_construction=64, maintenance_work_mem='1GB',
+                        db_config=None):
+    """
+    Builds an HNSW index over one course's rows only.
+
+    A query filtered to that course is planned against this small graph, so it
+    only visits the course's vectors instead of filtering the shared index.
+
+    :param table: 'text_chunks' or 'image_descriptions'.
+    :param course: Course whose rows are indexed.
+    :param m: HNSW graph degree.
+    :param ef_construction: HNSW build-time candidate list size.
+    :param maintenance_work_mem: Memory for the build.
+    :param db_config: Database connection parameters (defaults to the environment).
+    """
+    if table not in VECTOR_TABLES:
+        raise ValueError(f"Unknown vector table: {table}")
+    index_name = course_index_name(table, course)
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT set_config('maintenance_work_mem', %s, true)", (maintenance_work_mem,))
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+            print(f"Building {course} index on {table}...")
+            # The predicate must be a literal for the planner to match it against query filters
+            cursor.execute(
+                cursor.mogrify(
+                    f"CREATE INDEX {index_name} ON {table} USING hnsw (embedding {VECTOR_OPCLASS}) "
+                    f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)}) WHERE course = %s",
+                    (course,)
+                )
+            )
+            cursor.execute(f"ANALYZE {table}")
+
+def filter_params(filters):
+    """
+    Normalizes retrieval filters into one parameter per FILTER_COLUMNS entry.
+
+    :param filters: Dictionary such as {'course': 'PHYS101', 'document_id': ['notes', 'slides']};
+                    each value is a string or a list of strings.
+    :return: Tuple with a list of allowed values, or None (no restriction), per column.
+    """
+    filters = filters or {}
+    unknown = set(filters) - set(FILTER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown filter columns: {', '.join(sorted(unknown))}")
+    params = []
+    for column in FILTER_COLUMNS:
+        value = filters.get(column)
+        if value is None:
+            params.append(None)
+        elif isinstance(value, str):
+            params.append([value])
+        else:
+            params.append(list(value))
+    return tuple(params)
+
+def prepared_variants(template):
+    """
+    Builds the unfiltered and filtered forms of a prepared statement template.
+
+    The template is written for `execute_prepared` with a {filters} placeholder
+    in every WHERE clause that should honour the filters. The filtered form takes
+    one extra text[] parameter per FILTER_COLUMNS entry, NULL meaning no
+    restriction; run it after `apply_search_settings(..., filtered=True)` so
+    each execution is planned with the actual values and can use a course's
+    partial index.
+
+    :param template: Statement text starting with "(types) AS".
+    :return: Tuple of (unfiltered statement, filtered statement).
+    """
+    types, body = template.split(') AS', 1)
+    first = types.count(',') + 2
+    conditions = ' AND '.join(
+        f"(${first + i}::text[] IS NULL OR {column} = ANY(${first + i}))"
+        for i, column in enumerate(FILTER_COLUMNS)
+    )
+    filtered_types = types + ', text[]' * len(FILTER_COLUMNS)
+    return (types + ') AS' + body.replace('{filters}', 'TRUE'),
+            filtered_types + ') AS' + body.replace('{filters}', conditions))
+
+def filter_sql(cursor, filters):
+    """
+    Renders filters as an SQL condition with literal values, for statements
+    that are not prepared.
+
+    :param cursor: psycopg2 cursor used for quoting.
+    :param filters: See `filter_params`.
+    :return: Condition as bytes; b'TRUE' without filters.
+    """
+    conditions = [
+        cursor.mogrify(f"{column} = ANY(%s)", (values,))
+        for column, values in zip(FILTER_COLUMNS, filter_params(filters))
+        if values is not None
+    ]
+    return b' AND '.join(conditions) or b'TRUE'
+
+def bump_corpus_version(db_config=None):
+    """
+    Marks the corpus as changed so query caches drop their entries.
+
+    Call after every ingestion write to text_chunks or image_descriptions.
+
+    :param db_config: Database connection parameters (defaults to the environment).
+    :return: The new version.
+    """
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE corpus_version SET version = version + 1 RETURNING version")
+            return cursor.fetchone()[0]
+
+def get_corpus_version(db_config=None):
+    """
+    :param db_config: Database connection parameters (defaults to the environment).
+    :return: Current corpus version.
+    """
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT version FROM corpus_version WHERE id = 1")
+            return cursor.fetchone()[0]
+
+_iterative_scan_supported = {}  # connection dsn -> pgvector >= 0.8
+
+def _supports_iterative_scan(cursor):
+    dsn = cursor.connection.dsn
+    supported = _iterative_scan_supported.get(dsn)
+    if supported is None:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+        version = tuple(int(part) for part in re.findall(r'\d+', row[0])[:2]) if row else ()
+        supported = version >= (0, 8)
+        _iterative_scan_supported[dsn] = supported
+    return supported
+
+def apply_search_settings(cursor, ef_search=None, probes=None, filtered=False, k=None):
+    """
+    Sets per-query ANN recall/speed knobs for the current transaction only.
+
+    :param cursor: Cursor of a pooled connection (inside a transaction).
+    :param ef_search: HNSW candidate list size; raised to k when smaller.
+    :param probes: Number of IVFFlat lists scanned.
+    :param filtered: The query carries metadata filters. Prepared statements are
+                     then planned per execution, so the filter values can select
+                     a per-course partial index, and HNSW_ITERATIVE_SCAN applies.
+    :param k: Rows the HNSW scan must return; an HNSW scan yields at most
+              ef_search rows, so without this a LIMIT above 40 is silently capped.
+    """
+    if k is not None and (ef_search or HNSW_DEFAULT_EF_SEARCH) < k:
+        ef_search = k
+    if filtered:
+        cursor.execute("SELECT set_config('plan_cache_mode', 'force_custom_plan', true)")
+        if HNSW_ITERATIVE_SCAN and _supports_iterative_scan(cursor):
+            cursor.execute("SELECT set_config('hnsw.iterative_scan', %s, true)", (HNSW_ITERATIVE_SCAN,))
+    if ef_search is not None:
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(int(ef_search)),))
+    if probes is not None:
+        cursor.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(int(probes)),))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the pgvector schema.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('migrate', help="Create or upgrade the tables and indexes.")
+    index_parser = subparsers.add_parser('index', help="Rebuild an ANN index.")
+    index_parser.add_argument('table', choices=VECTOR_TABLES)
+    index_parser.add_argument('--method', choices=('hnsw', 'ivfflat'), default='hnsw')
+    index_parser.add_argument('--m', type=int, default=16)
+    index_parser.add_argument('--ef-construction', type=int, default=64)
+    index_parser.add_argument('--lists', type=int, default=None)
+    quantized_parser = subparsers.add_parser('quantized-index', help="Build a quantized HNSW index.")
+    quantized_parser.add_argument('table', choices=VECTOR_TABLES)
+    quantized_parser.add_argument('--kind', choices=tuple(QUANTIZED_INDEX_EXPRESSIONS), default='halfvec')
+    quantized_parser.add_argument('--m', type=int, default=16)
+    quantized_parser.add_argument('--ef-construction', type=int, default=64)
+    quantized_parser.add_argument('--drop-full-index', action='store_true',
+                                  help="Drop the float32 HNSW index to free its memory.")
+    course_parser = subparsers.add_parser('course-index', help="Build a course's partial ANN index.")
+    course_parser.add_argument('table', choices=VECTOR_TABLES)
+    course_parser.add_argument('course')
+    course_parser.add_argument('--m', type=int, default=16)
+    course_parser.add_argument('--ef-construction', type=int, default=64)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        versions = migrate()
+        print(f"Applied migrations: {versions}" if versions else "Schema is up to date.")
+    elif args.command == 'course-index':
+        create_course_index(args.table, args.course, args.m, args.ef_construction)
+    elif args.command == 'quantized-index':
+        build_quantized_index(args.table, args.kind, args.m, args.ef_construction,
+                              drop_full_index=args.drop_full_index)
+    else:
+        rebuild_ann_index(args.table, args.method, args.m, args.ef_construction, args.lists)
@@ -1,77 +1,175 @@
 # vector_db/store_embeddings.py
-from sentence_transformers import SentenceTransformer
+# Run from backend/ with: python -m vector_db.store_embeddings <document_id>
+from vector_db.embedding_cache import cached_encode
+from vector_db.db import get_db_config, get_connection
+from vector_db.bulk_load import copy_rows, TEXT_CHUNK_COLUMNS, TEXT_CHUNK_TYPES
+from vector_db.schema import DEFAULT_COURSE, VECTOR_TABLES, bump_corpus_version
+import argparse
+import itertools
 import os
-import psycopg2
+import time
 from psycopg2.extras import execute_values
-from dotenv import load_dotenv
 
-load_dotenv()  # Load environment variables from .env file
+DEFAULT_CHUNKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'chunks')
 
-def get_db_config():
+def generate_embeddings(document_id, course=DEFAULT_COURSE, model_name='all-MiniLM-L6-v2',
+                        batch_size=256, chunks_dir=DEFAULT_CHUNKS_DIR):
     """
-    Retrieves database configuration from environment variables.
-    
-    :return: Dictionary containing database connection parameters.
-    """
-    return {
-        'dbname': os.getenv('DB_NAME', 'rag_db'),
-        'user': os.getenv('DB_USER', 'postgres'),
-        'password': os.getenv('DB_PASSWORD', 'your_password'),
-        'host': os.getenv('DB_HOST', 'localhost'),
-        'port': os.getenv('DB_PORT', '5432')
-    }
-
-def generate_embeddings(model_name='all-MiniLM-L6-v2'):
-    """
-    Generates embeddings for all text chunks in the 'chunks/' directory.
+    Generates embeddings for all text chunks of one document in the 'chunks/' directory.
     
+    :param document_id: Identifier of the document the chunks belong to.
+    :param course: Course the document belongs to.
     :param model_name: Name of the SentenceTransformer model.
-    :return: List of tuples containing (document_id, page_number, content, embedding).
+    :param batch_size: Number of chunk files read and encoded at a time.
+    :param chunks_dir: Directory of 'chunk_<n>.txt' files.
+    :return: Generator of tuples containing (document_id, chunk_number, page_number, content,
+             embedding, course); chunk files do not record their page, so page_number is None.
     """
-    model = SentenceTransformer(model_name)
-    chunks_dir = '../data/chunks/'
     chunk_files = sorted([f for f in os.listdir(chunks_dir) if f.endswith('.txt')])
-    embeddings = []
-    for file in chunk_files:
-        with open(os.path.join(chunks_dir, file), 'r', encoding='utf-8') as f:
-            text = f.read()
-            emb = model.encode(text)
+    for i in range(0, len(chunk_files), batch_size):
+        batch_files = chunk_files[i:i + batch_size]
+        texts = []
+        for file in batch_files:
+            with open(os.path.join(chunks_dir, file), 'r', encoding='utf-8') as f:
+                texts.append(f.read())
+        # Encode the batch with the shared model
+        vectors = cached_encode(texts, model_name=model_name)
+        for file, text, emb in zip(batch_files, texts, vectors):
             # Extract chunk number from filename, e.g., 'chunk_1.txt'
             chunk_number = int(file.split('_')[1].split('.')[0])
-            document_id = 'physics_notes'  # Modify if handling multiple documents
-            embeddings.append((document_id, chunk_number, text, emb.tolist()))
-    return embeddings
+            yield (document_id, chunk_number, None, text, emb, course)
+
+def insert_text_chunks(cursor, rows):
+    """
+    Bulk inserts rows into the 'text_chunks' table on an open cursor.
+    
+    :param cursor: psycopg2 cursor.
+    :param rows: List of (document_id, chunk_number, page_number, content, embedding, course)
+                 tuples, embeddings as float32 arrays.
+    """
+    # Binary COPY sends vectors straight from their numpy buffers
+    copy_rows(cursor, 'text_chunks', TEXT_CHUNK_COLUMNS, TEXT_CHUNK_TYPES, rows)
+
+def upsert_text_chunks(cursor, rows):
+    """
+    Replaces the rows of the given (document_id, chunk_number) keys in 'text_chunks'.
+    
+    COPY has no ON CONFLICT clause, so the keys are deleted before inserting;
+    migration 7 makes them unique.
+    
+    :param cursor: psycopg2 cursor.
+    :param rows: List of (document_id, chunk_number, page_number, content, embedding, course) tuples.
+    """
+    delete_query = """
+        DELETE FROM text_chunks
+        WHERE (document_id, chunk_number) IN (VALUES %s)
+    """
+    execute_values(cursor, delete_query, [(row[0], row[1]) for row in rows])
+    insert_text_chunks(cursor, rows)
 
-def store_embeddings(embeddings, db_config):
+def delete_chunks_after(cursor, document_id, last_chunk_number):
+    """
+    Deletes the chunks of a document numbered above last_chunk_number.
+    
+    Chunks are numbered by position, so chunks removed from a document are
+    always the trailing ones.
+    
+    :param cursor: psycopg2 cursor.
+    :param document_id: Identifier of the document.
+    :param last_chunk_number: Number of the last chunk to keep.
+    :return: Number of deleted rows.
     """
-    Stores embeddings into the 'text_chunks' table in PostgreSQL.
+    cursor.execute(
+        "DELETE FROM text_chunks WHERE document_id = %s AND chunk_number > %s",
+        (document_id, last_chunk_number)
+    )
+    return cursor.rowcount
+
+def register_document(cursor, document_id, course=None, source_path=None):
+    """
+    Records a document and its course in 'documents'.
+    
+    Without a course, a known document keeps its recorded course and a new one
+    gets DEFAULT_COURSE. If an explicit course moves the document, its existing
+    chunks and images are relabelled so course filters stay consistent.
     
-    :param embeddings: List of tuples containing embedding data.
-    :param db_config: Database connection parameters.
+    :param cursor: psycopg2 cursor.
+    :param document_id: Identifier of the document.
+    :param course: Course the document belongs to, or None to keep the recorded one.
+    :param source_path: Path of the source PDF.
+    :return: Tuple of (the document's course, True if rows were relabelled).
+    """
+    cursor.execute("""
+        INSERT INTO documents (document_id, course, source_path) VALUES (%s, coalesce(%s, %s), %s)
+        ON CONFLICT (document_id) DO UPDATE
+        SET course = coalesce(%s, documents.course),
+            source_path = coalesce(EXCLUDED.source_path, documents.source_path),
+            updated_at = now()
+        RETURNING course
+    """, (document_id, course, DEFAULT_COURSE, source_path, course))
+    if course is None:
+        return cursor.fetchone()[0], False
+    relabelled = 0
+    for table in VECTOR_TABLES:
+        cursor.execute(
+            f"UPDATE {table} SET course = %s WHERE document_id = %s AND course <> %s",
+            (course, document_id, course)
+        )
+        relabelled += cursor.rowcount
+    return course, relabelled > 0
+
+def store_embeddings(embeddings, db_config=None, batch_size=500):
+    """
+    Stores embeddings into the 'text_chunks' table in PostgreSQL, replacing
+    the rows stored for the same chunks by earlier runs.
+    
+    Rows are upserted by (document_id, chunk_number) and each document's chunks
+    numbered past its last stored chunk are deleted, so re-running for a
+    document neither duplicates nor keeps stale chunks.
+    
+    :param embeddings: Iterable of (document_id, chunk_number, page_number, content, embedding,
+                       course) tuples covering every chunk of their documents; consumed lazily.
+    :param db_config: Database connection parameters (defaults to the environment).
+    :param batch_size: Number of rows per COPY and commit.
     """
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        insert_query = """
-            INSERT INTO text_chunks (document_id, page_number, content, embedding)
-            VALUES %s
-        """
-        # Prepare data for insertion
-        data_to_insert = [
-            (doc_id, page_num, content, emb)
-            for doc_id, page_num, content, emb in embeddings
-        ]
-        # Use execute_values for efficient bulk insert
-        execute_values(cursor, insert_query, data_to_insert)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"Stored {len(embeddings)} text embeddings into PostgreSQL.")
+        embeddings = iter(embeddings)
+        stored, deleted = 0, 0
+        last_chunk_numbers = {}
+        start = time.monotonic()
+        with get_connection(db_config) as conn:
+            with conn.cursor() as cursor:
+                while True:
+                    rows = list(itertools.islice(embeddings, batch_size))
+                    if not rows:
+                        break
+                    upsert_text_chunks(cursor, rows)
+                    conn.commit()
+                    stored += len(rows)
+                    for row in rows:
+                        last_chunk_numbers[row[0]] = max(row[1], last_chunk_numbers.get(row[0], row[1]))
+                for document_id, last_chunk_number in last_chunk_numbers.items():
+                    deleted += delete_chunks_after(cursor, document_id, last_chunk_number)
+        if stored:
+            bump_corpus_version(db_config)
+        elapsed = time.monotonic() - start
+        print(f"Stored {stored} text embeddings into PostgreSQL, removing {deleted} stale chunks "
+              f"({stored / max(elapsed, 1e-9):.0f} rows/sec).")
     except Exception as e:
         print(f"Error storing embeddings: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed a document's chunk files and store them.")
+    parser.add_argument('document_id')
+    parser.add_argument('--course', default=None,
+                        help="Course of the document (defaults to its recorded course).")
+    parser.add_argument('--chunks-dir', default=DEFAULT_CHUNKS_DIR)
+    args = parser.parse_args()
+
     db_config = get_db_config()
-    embeddings = generate_embeddings()
+    with get_connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            course, _ = register_document(cursor, args.document_id, args.course)
+    embeddings = generate_embeddings(args.document_id, course, chunks_dir=args.chunks_dir)
     store_embeddings(embeddings, db_config)
 
@@ -68,25 +68,25 @@ You are a helpful, detail-oriented assistant specialized in providing clear, str
     ]);
 
     try {
-      const response = await fetch('http://localhost:8000/v1/completions', {
+      // The backend gateway holds the vLLM credentials and streams tokens as Server-Sent Events
+      const response = await fetch('/api/generate', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          Authorization: `Bearer token-what-a-day`,
         },
         body: JSON.stringify({
-          model: 'akjindal53244/Llama-3.1-Storm-8B',
           prompt: fullPrompt,
           max_tokens: 500,
           temperature: 0.7,
           top_p: 0.9,
-          repetition_penalty: 1.1,
-          presence_penalty: 0.6,
-          frequency_penalty: 0.5,
           stream: true,
         }),
       });
 
+      if (!response.ok) {
+        const body = await response.json().catch(() => null);
+        throw new Error(body?.error || `Request failed with status ${response.status}`);
+      }
       if (!response.body) {
         throw new Error('No response body');
       }
@@ -94,46 +94,65 @@ You are a helpful, detail-oriented assistant specialized in providing clear, str
       const reader = response.body.getReader();
       const decoder = new TextDecoder('utf-8');
       let done = false;
+      let buffer = '';
       let assistantText = '';
 
       while (!done) {
         const { value, done: doneReading } = await reader.read();
-        done = doneReading;
-        const chunkValue = decoder.decode(value);
+        if (doneReading) break;
+        buffer += decoder.decode(value, { stream: true });
 
-        const lines = chunkValue.split('\n').filter(Boolean);
+        // Events end with a blank line; keep a partial event for the next read
+        const events = buffer.split('\n\n');
+        buffer = events.pop() ?? '';
 
-        for (const line of lines) {
-          const messageLine = line.replace(/^data: /, '').trim();
-          if (messageLine === '[DONE]') {
-            done = true;
-            break;
+        for (const rawEvent of events) {
+          let eventName = 'message';
+          let data = '';
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event: ')) {
+              eventName = line.slice('event: '.length).trim();
+            } else if (line.startsWith('data: ')) {
+              data += line.slice('data: '.length);
+            }
           }
+          if (!data) continue;
+
+          let parsed;
           try {
-            const parsed = JSON.parse(messageLine);
-            const text = parsed.choices[0].text;
+            parsed = JSON.parse(data);
+          } catch (e) {
+            console.error('Could not parse stream event:', data, e);
+            continue;
+          }
 
-            assistantText += text;
+          if (eventName === 'error') {
+            throw new Error(parsed.error || 'Error generating response.');
+          }
+          if (eventName === 'done') {
+            done = true;
+            break;
+          }
+          if (typeof parsed.text !== 'string') continue;
 
-            const cleanedText = cleanResponse(assistantText);
+          assistantText += parsed.text;
+          const cleanedText = cleanResponse(assistantText);
 
-            setMessages((prevMessages) => {
-              const updatedMessages = [...prevMessages];
-              if (
-                updatedMessages.length > 0 &&
-                updatedMessages[updatedMessages.length - 1].sender === 'assistant'
-              ) {
-                updatedMessages[updatedMessages.length - 1].text = cleanedText;
-              } else {
-                updatedMessages.push({ sender: 'assistant', text: cleanedText });
-              }
-              return updatedMessages;
-            });
-          } catch (e) {
-            console.error('Could not parse stream message:', messageLine, e);
-          }
+          setMessages((prevMessages) => {
+            const updatedMessages = [...prevMessages];
+            if (
+              updatedMessages.length > 0 &&
+              updatedMessages[updatedMessages.length - 1].sender === 'assistant'
+            ) {
+              updatedMessages[updatedMessages.length - 1].text = cleanedText;
+            } else {
+              updatedMessages.push({ sender: 'assistant', text: cleanedText });
+            }
+            return updatedMessages;
+          });
         }
       }
+      await reader.cancel();
     } catch (error) {
       console.error('Error generating response:', error);
       setMessages((prevMessages) => [